@@ -1,9 +1,28 @@
 import os
-from flask import Flask, render_template, request, jsonify, session
-from google.maps import routeoptimization_v1
+import json
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, session, Response, g
 from datetime import datetime
 from backend.FileHandler import *
-from backend.RouteHandler import get_start_time, get_end_time
+from backend.Solver import max_hours, SOLVER_BACKEND
+from backend.OptimizationClient import optimization_clients, OPTIMIZATION_WARMUP
+from backend.Decomposition import get_planning_solver
+from backend.Jobs import JobManager, QueueFullError
+from backend.ResultCache import ResultCache, model_key
+from backend.RouteEvaluation import RouteEvaluator
+from backend.StateStore import get_state_store, DEFAULT_TEAM, VersionConflictError
+from backend.TeamState import TeamStates
+from backend.Snapshots import Snapshot
+from backend.RouteGeometry import route_geometry, route_points
+from backend.WarmStart import WARM_START, initial_routes, moved_patients
+from backend.InsertionIndex import InsertionIndex
+from backend.UploadSnapshots import upload_snapshots, UPLOAD_SNAPSHOT_WARMLOAD
+from backend.RouteExport import EXPORT_FORMATS
+from backend.Metrics import (timed_stage, log_event, render_prometheus, configure_logging,
+                             HTTP_REQUESTS, HTTP_DURATION)
 from config import *
 
 # Google Cloud Service Account Authentifizierung
@@ -12,9 +31,117 @@ os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = SERVICE_ACCOUNT_CREDENTIALS
 app = Flask(__name__)
 app.secret_key = FLASK_SECRET_KEY
 
-# Globale Variable für optimierte Routen
-optimized_routes = []
-unassigned_tk_stops = []  # Speichert nicht zugeordnete TK-Fälle
+# Strukturierte Logs der Planungsstufen
+configure_logging()
+
+# Verbindung zur Route Optimization API schon beim Start aufbauen
+if SOLVER_BACKEND == 'google' and OPTIMIZATION_WARMUP:
+    optimization_clients.warm_up_async()
+
+# Ergebnisse identischer Optimierungsmodelle
+optimization_cache = ResultCache()
+
+# Inkrementelle Bewertung manueller Routenänderungen
+route_evaluator = RouteEvaluator()
+
+# Straßengeometrie manuell geänderter Routen, nach der Antwort an den Browser
+geometry_executor = ThreadPoolExecutor(max_workers=2)
+
+# Gemeinsamer, persistenter Zustand für alle Worker-Prozesse
+state_store = get_state_store()
+team_states = TeamStates(state_store)  # Zustand je Team, nie zwischen Teams getauscht
+
+# Hintergrund-Ausführung der Optimierungen, Status und Ergebnisse im gemeinsamen Speicher
+optimization_jobs = JobManager(store=state_store)
+
+# Endpunkte ohne Teamzustand (Jobabfragen dürfen nicht auf laufende Uploads warten)
+STATELESS_ENDPOINTS = {'static', 'metrics', 'get_job', 'job_events', 'cancel_job'}
+
+def get_team():
+    return session.get('team', DEFAULT_TEAM)
+
+def persist_state(state, *keys):
+    """Schreibt geänderte Teile des Zustands in den gemeinsamen Speicher (VersionConflictError bei Konflikt)"""
+    team_states.persist(state, *keys)
+
+@app.errorhandler(VersionConflictError)
+def version_conflict(e):
+    """Ein anderer Worker-Prozess hat den Zustand inzwischen geändert"""
+    return jsonify({'status': 'error', 'conflict': True,
+                    'message': f'Die Daten wurden zwischenzeitlich geändert, bitte neu laden ({e})'}), 409
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Zähler und Antwortzeit je Endpunkt"""
+    if 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        duration = time.perf_counter() - g.request_start
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        HTTP_DURATION.observe(duration, endpoint=endpoint)
+        log_event('http_request', endpoint=endpoint, method=request.method,
+                  status=response.status_code, duration_ms=round(duration * 1000, 2))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Metriken im Prometheus-Textformat"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def sync_state():
+    """
+    Bindet den Zustand des Teams an die Anfrage und lädt Änderungen anderer Worker-Prozesse.
+    Die Teamsperre gilt nur für den Abgleich; Änderungen nehmen sie in update_state() erneut.
+    """
+    if request.args.get('team'):
+        session['team'] = request.args['team']
+    if request.endpoint in STATELESS_ENDPOINTS:
+        return
+    state = team_states.get(get_team())
+    with state.lock:
+        team_states.sync(state)
+    g.state = state
+
+def update_state(state, apply, *keys):
+    """
+    Wendet apply(state) auf den aktuellen Stand an und speichert keys versioniert, alles unter
+    der Teamsperre. Langsame Vorarbeit (Parsen, Geocoding, Bewertung) gehört vor den Aufruf.
+    """
+    with state.lock:
+        team_states.sync(state)
+        result = apply(state)
+        persist_state(state, *keys)
+    return result
+
+def upload_commit(state, apply, *keys):
+    """commit-Funktion für die Upload-Handler: übernimmt erst nach erfolgreicher Aufbereitung"""
+    def commit(*args):
+        result = update_state(state, lambda current: apply(current, *args), *keys)
+        # Neue Daten machen gespeicherte Optimierungsergebnisse ungültig
+        optimization_cache.invalidate()
+        return result
+    return commit
+
+def warm_load_state(team=DEFAULT_TEAM):
+    """
+    Lädt den Zustand schon beim Start. Fehlen Patienten oder Mitarbeiter im Zustandsspeicher
+    (z.B. neue Installation), werden die zuletzt verwendeten Upload-Snapshots übernommen.
+    """
+    with timed_stage('warm_load', team=team), team_states.locked(team) as state:
+        if not state.weekly_patients:
+            snapshot = upload_snapshots.latest('patients')
+            if snapshot is not None:
+                apply_patient_upload(state, snapshot[0], 'Montag')
+                persist_state(state, 'weekly_patients')
+        if not state.vehicles:
+            snapshot = upload_snapshots.latest('vehicles')
+            if snapshot is not None:
+                apply_vehicle_upload(state, snapshot[0])
+                persist_state(state, 'vehicles')
 
 def get_selected_weekday():
     return session.get('selected_weekday', 'Montag')
@@ -32,262 +159,514 @@ def update_weekday():
         weekday = data.get('weekday')
         if weekday:
             set_selected_weekday(weekday)
-            # Lade die Patienten für den neuen Wochentag neu
-            reload_patients_for_weekday(weekday)
+            # Patienten des Wochentags entstehen je Anfrage aus dem Wochendatensatz des Teams
             return jsonify({
                 'status': 'success', 
                 'weekday': weekday,
-                'patient_count': len(patients)
+                'patient_count': len(g.state.patients_for(weekday))
             })
         return jsonify({'status': 'error', 'message': 'No weekday provided'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
-def reload_patients_for_weekday(weekday):
-    """Lädt die Patienten für den angegebenen Wochentag neu"""
-    global patients
-    patients.clear()
-    if hasattr(app, 'last_patient_upload'):
-        handle_patient_upload(app.last_patient_upload, weekday)
-
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
+    state = g.state
     if request.method == 'POST':
         upload_type = request.form.get('upload_type')
+        # Parsen und Geocoding ohne Teamsperre, gespeichert wird nur ein erfolgreicher Upload
         if upload_type == 'patients':
-            return handle_patient_upload(request)
+            return handle_patient_upload(request, upload_commit(state, apply_patient_upload, 'weekly_patients'))
         elif upload_type == 'vehicles':
-            return handle_vehicle_upload(request)
+            return handle_vehicle_upload(request, upload_commit(state, apply_vehicle_upload, 'vehicles'))
 
     return render_template(
         'index.html',
-        patients=patients,
-        vehicles=vehicles,
+        patients=state.patients_for(get_selected_weekday()),
+        vehicles=state.vehicles,
         google_maps_api_key=GOOGLE_MAPS_API_KEY,
-        saved_routes=optimized_routes
+        saved_routes=state.optimized_routes
     )
 
-@app.route('/get_markers')
-def get_markers():
-    return jsonify({
+def build_markers(state, weekday):
+    return {
         'patients': [
             {
+                'id': p.id,
                 'name': p.name,
                 'address': p.address,
                 'lat': p.lat,
                 'lng': p.lon,
+                'precision': p.precision,
                 'visit_type': p.visit_type
-            } for p in patients
+            } for p in state.patients_for(weekday)
         ],
         'vehicles': [
             {
+                'id': v.id,
                 'name': v.name,
                 'start_address': v.start_address,
                 'lat': v.lat,
                 'lng': v.lon,
+                'precision': v.precision,
                 'funktion': v.funktion
-            } for v in vehicles
+            } for v in state.vehicles
         ]
-    })
+    }
+
+def build_saved_routes(state):
+    return {
+        'status': 'success',
+        'routes': state.optimized_routes,
+        'tk_patients': state.unassigned_tk_stops
+    }
+
+# Delta-Schlüssel der vorserialisierten Antworten
+MARKER_KEYS = {'patients': 'id', 'vehicles': 'id'}
+ROUTE_KEYS = {'routes': 'vehicle', 'tk_patients': None}
+
+def team_snapshot(state, name, build, keys):
+    """
+    Vorserialisierte Antwort eines Lesendpunkts je Team (name z.B. mit Wochentag),
+    neu erzeugt nur bei geänderter Zustandsversion; Deltas nie gegen Stände anderer Teams
+    """
+    snapshot = state.snapshots.get(name)
+    if snapshot is None:
+        snapshot = state.snapshots.setdefault(name, Snapshot(build, keys=keys))
+    return snapshot
+
+def state_version(*keys):
+    """Versionskennung aus Team und StateStore-Versionen der Schlüssel"""
+    return g.state.version(*keys)
+
+def serve_snapshot(snapshot, *keys, weekday=None):
+    """
+    Liefert den Snapshot mit ETag (304 bei unverändertem Stand), gzip falls vom Client akzeptiert,
+    oder mit ?since=<version> nur die Änderungen seit dieser Version.
+    weekday: Wochentag der Sitzung, falls der Inhalt davon abhängt
+    """
+    since = request.args.get('since')
+    # Version und Inhalt aus demselben Stand, das Erzeugen läuft ohne Ein-/Ausgabe
+    with g.state.lock:
+        version = state_version(*keys) + (f":{weekday}" if weekday else '')
+        delta = snapshot.delta(since, version) if since else None
+        if delta is None:
+            body, gzipped = snapshot.current(version)
+    if delta is not None:
+        return jsonify(delta)
+
+    response = Response(body, mimetype='application/json')
+    if gzipped is not None:
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip']:
+            response.set_data(gzipped)
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(hashlib.sha1(version.encode('utf-8')).hexdigest()[:20], weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/get_markers')
+def get_markers():
+    state, weekday = g.state, get_selected_weekday()
+    snapshot = team_snapshot(state, f'markers:{weekday}', lambda: build_markers(state, weekday), MARKER_KEYS)
+    return serve_snapshot(snapshot, 'weekly_patients', 'vehicles', weekday=weekday)
 
 @app.route('/patients', methods=['GET', 'POST'])
 def show_patients():
     selected_weekday = get_selected_weekday()
     return render_template('show_patient.html',
-                           patients=patients,
+                           patients=g.state.patients_for(selected_weekday),
                            weekday=selected_weekday)
 
 @app.route('/vehicles')
 def show_vehicles():
-    return render_template('show_vehicle.html', vehicles=vehicles)
+    return render_template('show_vehicle.html', vehicles=g.state.vehicles)
 
 @app.route('/optimize_route', methods=['POST'])
 def optimize_route():
     """
-    Routenoptimierung:
-    - Trennung von TK und Nicht-TK Patienten
-    - Flottenrouting nur für Nicht-TK
-    - Berücksichtigung des Stellenumfangs als maximale Routenzeit
-    - Separate Rückgabe der TK-Fälle
-    - Optionale Zeitausgabe im Terminal
+    Routenoptimierung als Hintergrundjob:
+    - Gibt sofort eine Job-ID zurück
+    - Status, Zeiten und Ergebnis durch Abfragen von /jobs/<job_id>
+      (/jobs/<job_id>/events als Server-Sent-Events nur mit asynchronen Worker-Klassen)
     """
-    optimization_client = routeoptimization_v1.RouteOptimizationClient()
+    state = g.state
+    weekday = get_selected_weekday()
+    # Momentaufnahme der Daten, damit spätere Uploads den Job nicht beeinflussen;
+    # der Job speichert nur, wenn der Plan bis dahin nicht anderweitig geändert wurde
+    with state.lock:
+        patients, vehicle_list = state.patients_for(weekday), list(state.vehicles)
+        previous_routes = state.week_routes.get(weekday, {}).get('routes')
+        base_versions = {key: state.versions.get(key, 0) for key in ('routes', 'week_routes')}
 
     # Prüfe ob Daten vorhanden
-    if not patients or not vehicles:
+    if not patients or not vehicle_list:
         return jsonify({'status': 'error', 'message': 'Mindestens ein Patient und ein Fahrzeug benötigt'})
 
     # Patienten nach Besuchstyp trennen
-    non_tk_patients = [p for p in patients if p.visit_type in ("Neuaufnahme", "HB")]
-    tk_patients    = [p for p in patients if p.visit_type == "TK"]
-
-    # Shipments für Nicht-TK erstellen
-    shipments = []
-    for patient in non_tk_patients:
-        duration_seconds = 0
-        if patient.visit_type == "HB":
-            duration_seconds = 2100  # 35 min
-        elif patient.visit_type == "Neuaufnahme":
-            duration_seconds = 7200  # 120 min
-        # sonst -> 0s
-
-        pickups = [{
-            "arrival_location": {
-                "latitude": patient.lat,
-                "longitude": patient.lon
-            },
-            "duration": f"{duration_seconds}s"
-        }]
-        shipments.append({"pickups": pickups})
-
-    # 3) Fahrzeuge: Berücksichtige Stellenumfang
-    vehicles_model = []
-    for v in vehicles:
-        stellenumfang = getattr(v, 'stellenumfang', 100)  
-        
-        # Berechne Sekunden (7 Stunden * Stellenumfang%)
-        seconds = int((stellenumfang / 100.0) * 7 * 3600)
-        
-        # Formatiere als Duration-String
-        duration_string = f"{seconds}s"
+    non_tk_patients = patients.filter_by('visit_type', "Neuaufnahme", "HB")
+    tk_patients    = patients.filter_by('visit_type', "TK")
 
-        vehicle_model = {
-            "start_location": {
-                "latitude": v.lat,
-                "longitude": v.lon
-            },
-            "end_location": {
-                "latitude": v.lat,
-                "longitude": v.lon
+    try:
+        job = optimization_jobs.submit(run_optimization, non_tk_patients, tk_patients,
+                                       vehicle_list, weekday, state.team, previous_routes,
+                                       base_versions, description=f'Optimierung {weekday}')
+    except QueueFullError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 429
+
+    return jsonify({'status': 'queued', 'job_id': job.id}), 202
+
+def extract_routes(solved_routes, non_tk_patients, tk_patients, vehicle_list):
+    """Baut aus dem Solver-Ergebnis die Struktur für optimized_routes und die TK-Liste"""
+    routes = []
+    for i, route in enumerate(solved_routes):
+        vehicle = vehicle_list[route.vehicle_index]
+        duration_hrs = route.duration_hrs
+
+        log_event('vehicle_route', level=logging.DEBUG, index=i, vehicle=vehicle.name,
+                  duration_hrs=round(duration_hrs, 2), stops=len(route.shipment_indices))
+
+        route_info = {
+            "vehicle": vehicle.name,
+            "funktion": vehicle.funktion,
+            "duration_hrs": round(duration_hrs, 2),
+            "max_hours": max_hours(vehicle),
+            "vehicle_start": {
+                "lat": vehicle.lat,
+                "lng": vehicle.lon
             },
-            "cost_per_hour": 1,
-            "route_duration_limit": {
-                "max_duration": duration_string
-            }
+            "stops": []
         }
-        vehicles_model.append(vehicle_model)
-
-    # Request zusammenstellen
-    fleet_routing_request = routeoptimization_v1.OptimizeToursRequest({
-        "parent": "projects/routenplanung-sapv",
-        "model": {
-            "shipments": shipments,
-            "vehicles": vehicles_model,
-            "global_start_time": get_start_time(get_selected_weekday()),
-            "global_end_time": get_end_time(get_selected_weekday())
+
+        # Besuche => non_tk_patients
+        for p_idx in route.shipment_indices:
+            p = non_tk_patients[p_idx]
+            route_info["stops"].append({
+                "patient": p.name,
+                "address": p.address,
+                "visit_type": p.visit_type,
+                "time_info": p.time_info,
+                "location": {
+                    "lat": p.lat,
+                    "lng": p.lon
+                }
+            })
+
+        # Etappen-Polylines aus der Optimierung (Google) für die Kartendarstellung übernehmen
+        if route.legs:
+            route_geometry.seed(route_points(route_info), route.legs, provider='google')
+
+        routes.append(route_info)
+
+    # 5) TK-Fälle als Liste
+    tk_list = [
+        {
+            "patient": tk.name,
+            "address": tk.address,
+            "visit_type": tk.visit_type,
+            "time_info": tk.time_info,
+            "location": {
+                "lat": tk.lat,
+                "lng": tk.lon
+            }
         }
-    })
+        for tk in tk_patients
+    ]
+    return routes, tk_list
 
-    # Aufruf der Optimierung
+def plan_day(non_tk_patients, tk_patients, vehicle_list, weekday,
+             should_stop=lambda: False, set_progress=lambda message: None, previous_routes=None):
+    """
+    Routenoptimierung eines Wochentags:
+    - Flottenrouting nur für Nicht-TK
+    - Berücksichtigung des Stellenumfangs als maximale Routenzeit
+    - Separate Rückgabe der TK-Fälle
+    - Letzter Plan des Wochentags (previous_routes) als Startlösung
+    """
+    solver = get_planning_solver()
+    cache_key = model_key(non_tk_patients, vehicle_list, weekday, solver.name)
+    solved_routes = optimization_cache.get(cache_key)
+    from_cache = solved_routes is not None
+
+    seeds, warm_start = None, None
+    if WARM_START and previous_routes:
+        seeds, warm_start = initial_routes(previous_routes, non_tk_patients, vehicle_list)
+
+    if not from_cache:
+        set_progress('Optimierung läuft')
+        # Aufruf der Optimierung über das konfigurierte Solver-Backend
+        try:
+            solved_routes = solver.solve(non_tk_patients, vehicle_list, weekday,
+                                         should_stop=should_stop, initial_routes=seeds)
+        except Exception as e:
+            raise RuntimeError(f'Optimierungsfehler: {str(e)}')
+        if not should_stop():
+            optimization_cache.put(cache_key, solved_routes)
+
+    set_progress('Routen werden aufbereitet')
+    with timed_stage('route_extraction', weekday=weekday):
+        try:
+            # Routen extrahieren
+            routes, tk_list = extract_routes(solved_routes, non_tk_patients, tk_patients, vehicle_list)
+        except Exception as e:
+            raise RuntimeError(f'Serverfehler: {str(e)}')
+
+    # Streckengeometrie für die Karte, nur fehlende Etappen werden berechnet
+    set_progress('Streckenverlauf wird berechnet')
+    with timed_stage('route_geometry', weekday=weekday):
+        route_geometry.attach(routes)
+
+    result = {
+        'status': 'success',
+        'routes': routes,
+        'tk_patients': tk_list,
+        'from_cache': from_cache
+    }
+    # Bei geografischer Zerlegung: Cluster, Randkorrekturen und ggf. Abstand zum Gesamtmodell
+    if not from_cache and getattr(solver, 'last_report', None):
+        result['decomposition'] = solver.last_report
+    # Warmstart: übernommene Stopps und Stabilität gegenüber dem letzten Plan
+    if warm_start is not None:
+        warm_start['moved_patients'] = moved_patients(previous_routes, routes)
+        result['warm_start'] = warm_start
+    return result
+
+PLAN_CHANGED_MESSAGE = 'Der Plan wurde während der Optimierung geändert und nicht überschrieben, bitte erneut optimieren'
+
+def run_optimization(job, non_tk_patients, tk_patients, vehicle_list, weekday, team, previous_routes=None,
+                     base_versions=None):
+    """Hintergrundjob für /optimize_route"""
+    result = plan_day(non_tk_patients, tk_patients, vehicle_list, weekday,
+                      should_stop=lambda: job.cancel_requested,
+                      set_progress=job.set_progress,
+                      previous_routes=previous_routes)
+
+    # Abgebrochene Jobs überschreiben den gespeicherten Plan nicht
+    if job.cancel_requested:
+        return result
+    # Zwischenzeitlich bearbeitete Pläne nicht überschreiben
     try:
-        response = optimization_client.optimize_tours(fleet_routing_request)
-    except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'message': f'Optimierungsfehler: {str(e)}'
-        })
+        with team_states.locked(team, expected=base_versions) as state:
+            state.optimized_routes = result['routes']
+            state.unassigned_tk_stops = result['tk_patients']
+            state.optimized_weekday = weekday
+            state.week_routes = dict(state.week_routes, **{weekday: result})
+            persist_state(state, 'routes', 'week_routes')
+            version = state.version('routes')
+    except VersionConflictError:
+        raise RuntimeError(PLAN_CHANGED_MESSAGE)
+    route_evaluator.prime(result['routes'])
+    return dict(result, version=version)
+
+@app.route('/optimize_week', methods=['POST'])
+def optimize_week():
+    """Plant alle Wochentage (Montag–Freitag) parallel als Hintergrundjob"""
+    state = g.state
+    with state.lock:
+        weekly_patients, vehicle_list = state.weekly_patients, list(state.vehicles)
+        previous_plans = {weekday: plan.get('routes') for weekday, plan in state.week_routes.items()}
+        base_version = state.versions.get('week_routes', 0)
+    if not weekly_patients or not vehicle_list:
+        return jsonify({'status': 'error', 'message': 'Mindestens ein Patient und ein Fahrzeug benötigt'})
 
     try:
-        # Routen extrahieren
-        global optimized_routes
-        optimized_routes = []
-        for i, route in enumerate(response.routes):
-            start_dt = route.vehicle_start_time
-            end_dt   = route.vehicle_end_time
-
-            # Debug im Terminal
-            if start_dt and end_dt:
-                duration_sec = (end_dt - start_dt).total_seconds()
-                duration_hrs = duration_sec / 3600.0
-                print(f"Fahrzeug {i} => "
-                      f"Start: {start_dt}, Ende: {end_dt}, "
-                      f"Dauer: {duration_hrs:.2f} h, "
-                      f"Name: {vehicles[route.vehicle_index].name}")
-            else:
-                duration_hrs = 0
-                print(f"Fahrzeug {i} => None start/end (nicht genutzt?)")
-
-            v_index = route.vehicle_index
-            vehicle = vehicles[v_index]
-            # Berechne max_hours basierend auf Stellenumfang (100% = 7h)
-            max_hours = round((getattr(vehicle, 'stellenumfang', 100) / 100.0) * 7, 2)
-            
-            route_info = {
-                "vehicle": vehicle.name,
-                "funktion": vehicle.funktion,
-                "duration_hrs": round(duration_hrs, 2),
-                "max_hours": max_hours,
-                "vehicle_start": {
-                    "lat": vehicle.lat,
-                    "lng": vehicle.lon
-                },
-                "stops": []
+        job = optimization_jobs.submit(run_week_optimization, weekly_patients, vehicle_list,
+                                       state.team, previous_plans, base_version,
+                                       description='Wochenplanung')
+    except QueueFullError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 429
+
+    return jsonify({'status': 'queued', 'job_id': job.id}), 202
+
+def run_week_optimization(job, weekly_patients, vehicle_list, team, previous_plans=None, base_version=None):
+    """Hintergrundjob für /optimize_week: fünf unabhängige Tagesmodelle gleichzeitig lösen"""
+    day_models = {}
+    for weekday in WEEKDAYS:
+        day_patients = patients_for_weekday(weekly_patients, weekday)
+        day_models[weekday] = (
+            day_patients.filter_by('visit_type', "Neuaufnahme", "HB"),
+            day_patients.filter_by('visit_type', "TK")
+        )
+
+    finished = []
+    job.set_progress(f'0/{len(WEEKDAYS)} Tage geplant')
+
+    def solve_day(weekday):
+        non_tk_patients, tk_patients = day_models[weekday]
+        result = plan_day(non_tk_patients, tk_patients, vehicle_list, weekday,
+                          should_stop=lambda: job.cancel_requested,
+                          previous_routes=(previous_plans or {}).get(weekday))
+        finished.append(weekday)
+        job.set_progress(f'{len(finished)}/{len(WEEKDAYS)} Tage geplant')
+        return weekday, result
+
+    with ThreadPoolExecutor(max_workers=len(WEEKDAYS)) as executor:
+        results = dict(executor.map(solve_day, WEEKDAYS))
+
+    if not job.cancel_requested:
+        expected = None if base_version is None else {'week_routes': base_version}
+        try:
+            with team_states.locked(team, expected=expected) as state:
+                state.week_routes = dict(state.week_routes, **results)
+                persist_state(state, 'week_routes')
+        except VersionConflictError:
+            raise RuntimeError(PLAN_CHANGED_MESSAGE)
+
+    return {
+        'status': 'success',
+        'days': {
+            weekday: {
+                'routes': sum(1 for route in result['routes'] if route['stops']),
+                'stops': sum(len(route['stops']) for route in result['routes']),
+                'tk_patients': len(result['tk_patients']),
+                'from_cache': result['from_cache']
             }
+            for weekday, result in results.items()
+        }
+    }
+
+@app.route('/week_plan/<weekday>')
+def get_week_plan(weekday):
+    """Liefert den gespeicherten Plan eines Wochentags"""
+    if weekday not in WEEKDAYS:
+        return jsonify({'status': 'error', 'message': 'Ungültiger Wochentag'}), 400
+    plan = g.state.week_routes.get(weekday)
+    if plan is None:
+        return jsonify({'status': 'error', 'message': f'Kein Plan für {weekday} vorhanden'}), 404
+    return jsonify(dict(plan, weekday=weekday))
+
+def plan_for_weekday(weekday):
+    """Aktueller Plan eines Wochentags (bearbeiteter Tagesplan oder Wochenplanung) oder None"""
+    state = g.state
+    if weekday == state.optimized_weekday and state.optimized_routes:
+        return {'routes': state.optimized_routes, 'tk_patients': state.unassigned_tk_stops}
+    return state.week_routes.get(weekday)
+
+@app.route('/export_routes')
+def export_routes():
+    """
+    Download der Tourenpläne, blockweise gestreamt.
+    ?weekday=<tag> (Standard: zuletzt geplanter Tag) oder ?weekday=woche für alle Tage,
+    ?format=xlsx (Übersicht und ein Blatt je Mitarbeiter, Standard) oder csv
+    """
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': 'Ungültiges Format (csv oder xlsx)'}), 400
+    weekday = request.args.get('weekday') or g.state.optimized_weekday or get_selected_weekday()
+    if weekday.lower() == 'woche':
+        days, label = WEEKDAYS, 'Woche'
+    elif weekday in WEEKDAYS:
+        days, label = [weekday], weekday
+    else:
+        return jsonify({'status': 'error', 'message': 'Ungültiger Wochentag'}), 400
+
+    with g.state.lock:
+        plans = [(day, plan_for_weekday(day)) for day in days]
+    plans = [(day, plan) for day, plan in plans if plan is not None]
+    if not plans:
+        return jsonify({'status': 'error', 'message': f'Kein Plan für {label} vorhanden'}), 404
+
+    generate, mimetype, extension = EXPORT_FORMATS[export_format]
+    log_event('route_export', weekday=label, format=export_format,
+              routes=sum(len(plan.get('routes', [])) for _, plan in plans))
+    return Response(generate(plans), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="Tourenplan_{label}.{extension}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-            # Besuche => non_tk_patients
-            for visit in route.visits:
-                p_idx = visit.shipment_index
-                if p_idx >= 0:
-                    p = non_tk_patients[p_idx]
-                    route_info["stops"].append({
-                        "patient": p.name,
-                        "address": p.address,
-                        "visit_type": p.visit_type,
-                        "time_info": p.time_info,
-                        "location": {
-                            "lat": p.lat,
-                            "lng": p.lon
-                        }
-                    })
-
-            optimized_routes.append(route_info)
-
-        # 5) TK-Fälle als Liste
-        global unassigned_tk_stops
-        tk_list = [
-            {
-                "patient": tk.name,
-                "address": tk.address,
-                "visit_type": tk.visit_type,
-                "time_info": tk.time_info,
-                "location": {
-                    "lat": tk.lat,
-                    "lng": tk.lon
-                }
-            }
-            for tk in tk_patients
-        ]
-        unassigned_tk_stops = tk_list
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    data = optimization_jobs.status(job_id)
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Unbekannter Job'}), 404
+    return jsonify(data)
 
-        return jsonify({
-            'status': 'success',
-            'routes': optimized_routes,
-            'tk_patients': tk_list
-        })
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Server-Sent-Events: sendet jede Statusänderung bis der Job beendet ist.
+    Hält eine Verbindung je Client offen, nur mit asynchronen Worker-Klassen (z.B. gevent) einsetzen.
+    """
+    if optimization_jobs.status(job_id, include_result=False) is None:
+        return jsonify({'status': 'error', 'message': 'Unbekannter Job'}), 404
+
+    def stream():
+        for data in optimization_jobs.watch(job_id):
+            yield ": keep-alive\n\n" if data is None else f"data: {json.dumps(data)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    data = optimization_jobs.cancel(job_id)
+    if data is None:
+        return jsonify({'status': 'error', 'message': 'Unbekannter Job'}), 404
+    return jsonify(data)
 
+def fill_route_geometry(team, routes_version):
+    """
+    Ergänzt die Straßengeometrie, die update_routes als Luftlinie gezeichnet hat, und bewertet
+    die betroffenen Routen neu. Übernommen nur, wenn der Plan seitdem unverändert ist.
+    """
+    try:
+        state = team_states.get(team)
+        with state.lock:
+            team_states.sync(state)
+            if state.versions.get('routes') != routes_version:
+                return
+            stored = state.optimized_routes
+        routes = [dict(route) for route in stored]
+        with timed_stage('route_geometry', team=team):
+            route_geometry.attach(routes)
+        # Nur die vorläufig bewerteten Routen neu bewerten, die übrigen behalten ihre Dauer
+        evaluation = route_evaluator.evaluate(
+            routes, [route for route in stored if not (route.get('geometry') or {}).get('pending')])
+        for route in routes:
+            route['duration_hrs'] = evaluation['routes'][route['vehicle']]['duration_hrs']
+
+        with team_states.locked(team, expected={'routes': routes_version}) as state:
+            state.optimized_routes = routes
+            weekday = state.optimized_weekday
+            if weekday in state.week_routes:
+                state.week_routes = dict(state.week_routes, **{weekday: dict(state.week_routes[weekday],
+                                                                             routes=routes)})
+            persist_state(state, 'routes', 'week_routes')
+    except VersionConflictError:
+        pass  # Neuere Änderung, deren eigene Ergänzung folgt
     except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'message': f'Serverfehler: {str(e)}'
-        })
+        log_event('route_geometry_error', team=team, error=str(e))
 
 @app.route('/update_routes', methods=['POST'])
 def update_routes():
+    """
+    Übernimmt manuelle Änderungen (Drag-and-Drop).
+    Dauer und max_hours-Verletzungen werden serverseitig nur für geänderte Routen neu berechnet.
+    Mit 'version' (aus /get_saved_routes) wird nur gespeichert, wenn der Plan seitdem unverändert
+    ist, sonst 409.
+    """
+    state = g.state
     try:
-        global optimized_routes
-        global unassigned_tk_stops
         data = request.get_json()
-        optimized_routes = []
+        with state.lock:
+            base_version = state.version('routes')
+            previous_routes, vehicles = state.optimized_routes, state.vehicles
+        # Ohne Angabe gilt der beim Eingang der Anfrage geladene Stand
+        expected_version = data.get('version') or base_version
+        if expected_version != base_version:
+            raise VersionConflictError(f"Version {expected_version}, aktuell {base_version}")
+        new_routes = []
         
         # Reguläre Routen verarbeiten
         for route in data.get('optimized_routes', []):
             if route['vehicle'] != 'tk':
-                vehicle = next((v for v in vehicles if v.name == route['vehicle']), None)
+                vehicle = vehicles.get_by_name(route['vehicle'])
                 if vehicle:
                     route_info = {
                         'vehicle': route['vehicle'],
                         'duration_hrs': route['duration_hrs'],
-                        'max_hours': route['max_hours'],
+                        'max_hours': max_hours(vehicle),
                         'funktion': route['funktion'],
                         'vehicle_start': {
                             'lat': vehicle.lat,
@@ -295,16 +674,53 @@ def update_routes():
                         },
                         'stops': route['stops']
                     }
-                    optimized_routes.append(route_info)
-        
+                    new_routes.append(route_info)
+
+        # Streckengeometrie aus dem Cache, neue Etappen vorerst als Luftlinie;
+        # die Straßengeometrie wird nach dem Speichern im Hintergrund ergänzt
+        with timed_stage('route_geometry'):
+            route_geometry.attach(new_routes, compute=False)
+
+        # Serverseitige Bewertung statt der vom Browser gesendeten Dauer;
+        # unveränderte Routen behalten ihre bisherige Dauer
+        evaluation = route_evaluator.evaluate(new_routes, previous_routes)
+        for route_info in new_routes:
+            route_info['duration_hrs'] = evaluation['routes'][route_info['vehicle']]['duration_hrs']
+
         # Speichere die nicht zugewiesenen TK-Stopps
         unassigned_tk_stops = data.get('unassigned_tk_stops', [])
+        selected_weekday = get_selected_weekday()
+
+        with state.lock:
+            team_states.sync(state)
+            if state.version('routes') != expected_version:
+                raise VersionConflictError(f"Version {expected_version}, aktuell {state.version('routes')}")
+            state.optimized_routes = new_routes
+            state.unassigned_tk_stops = unassigned_tk_stops
+            # Manuell bearbeiteter Plan ist Startlösung der nächsten Optimierung dieses Wochentags
+            state.optimized_weekday = state.optimized_weekday or selected_weekday
+            state.week_routes = dict(state.week_routes, **{state.optimized_weekday: {
+                'status': 'success',
+                'routes': new_routes,
+                'tk_patients': unassigned_tk_stops,
+                'from_cache': False,
+                'edited': True
+            }})
+            persist_state(state, 'routes', 'week_routes')
+            version = state.version('routes')
+
+        if any(route['geometry']['pending'] for route in new_routes):
+            geometry_executor.submit(fill_route_geometry, state.team, state.versions['routes'])
         
         return jsonify({
             'status': 'success',
-            'routes': optimized_routes,
-            'tk_patients': unassigned_tk_stops
+            'routes': new_routes,
+            'tk_patients': unassigned_tk_stops,
+            'evaluation': evaluation,
+            'version': version
         })
+    except VersionConflictError as e:
+        return version_conflict(e)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
@@ -312,13 +728,48 @@ def update_routes():
 def get_current_weekday():
     return jsonify({'weekday': get_selected_weekday()})
 
+# Räumlicher Index über die aktuellen Routen je Team, neu aufgebaut bei geänderter Routenversion
+insertion_indexes = {}  # Team -> (version, index)
+
+@app.route('/tk_suggestions')
+def tk_suggestions():
+    """
+    Einfügevorschläge für nicht zugeordnete TK-Patienten:
+    je Patient die k Routen und Positionen mit der geringsten Mehrfahrzeit innerhalb von max_hours.
+    Optional ?patient=<name> für einen einzelnen Patienten, ?k=<anzahl> (Standard 3).
+    """
+    k = request.args.get('k', 3, type=int)
+    if k < 1:
+        return jsonify({'status': 'error', 'message': 'k muss mindestens 1 sein'}), 400
+
+    with g.state.lock:
+        version = state_version('routes')
+        routes, unassigned_tk_stops = g.state.optimized_routes, g.state.unassigned_tk_stops
+    cached = insertion_indexes.get(g.state.team)
+    if cached is None or cached[0] != version:
+        cached = insertion_indexes[g.state.team] = (version, InsertionIndex(routes))
+    index = cached[1]
+
+    patient = request.args.get('patient')
+    suggestions = {}
+    for stop in unassigned_tk_stops:
+        location = stop.get('location') or {}
+        if patient and stop.get('patient') != patient:
+            continue
+        if location.get('lat') is None or location.get('lng') is None:
+            continue
+        suggestions[stop['patient']] = index.suggestions(location['lat'], location['lng'],
+                                                         stop.get('visit_type', 'TK'), k)
+    return jsonify({'status': 'success', 'version': version, 'suggestions': suggestions})
+
 @app.route('/get_saved_routes')
 def get_saved_routes():
-    return jsonify({
-        'status': 'success',
-        'routes': optimized_routes,
-        'tk_patients': unassigned_tk_stops
-    })
+    state = g.state
+    return serve_snapshot(team_snapshot(state, 'routes', lambda: build_saved_routes(state), ROUTE_KEYS), 'routes')
+
+# Zustand und letzte Uploads schon beim Start laden
+if UPLOAD_SNAPSHOT_WARMLOAD:
+    warm_load_state()
 
 if __name__ == '__main__':
     app.run(debug=True)
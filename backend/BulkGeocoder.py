@@ -0,0 +1,140 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.Metrics import (GEOCODING_CALLS, GEOCODING_ERRORS, GEOCODING_CACHE,
+                             GEOCODING_LATENCY, log_event)
+
+# Standardwerte für das Bulk-Geocoding
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 10
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+
+# Fehlertext für endgültig nicht auflösbare Adressen
+NOT_FOUND = 'Adresse nicht gefunden'
+
+
+class TokenBucket:
+    """Thread-sicherer Token-Bucket zur Begrenzung der Anfragerate"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocodeSummary:
+    """Zusammenfassung eines Bulk-Geocoding-Laufs"""
+
+    def __init__(self):
+        self.total = 0
+        self.cached = 0
+        self.resolved = 0
+        self.failed = {}  # Adresse -> Fehlerbeschreibung
+        self.local = 0  # Direkt aus dem Ortsverzeichnis übernommen
+        self.approximate = {}  # Adresse -> Genauigkeit, Ortsverzeichnis nach Fehlschlag
+        self.precision = {}  # Adresse -> Genauigkeit der Koordinate
+
+    def message(self):
+        messages = []
+        if self.failed:
+            addresses = ', '.join(sorted(self.failed))
+            messages.append(f'{len(self.failed)} Adressen konnten nicht geocodiert werden: {addresses}')
+        if self.approximate:
+            addresses = ', '.join(sorted(self.approximate))
+            messages.append(f'{len(self.approximate)} Adressen nur näherungsweise über PLZ/Ort verortet: {addresses}')
+        return ' '.join(messages) or None
+
+    def __str__(self):
+        return (f"Geocoding: {self.total} Adressen, {self.cached} aus Cache, "
+                f"{self.resolved} neu aufgelöst, {self.local} aus Ortsverzeichnis, "
+                f"{len(self.approximate)} näherungsweise, {len(self.failed)} fehlgeschlagen")
+
+
+def _geocode_with_retry(client, address, bucket, retries, backoff):
+    """Geocodiert eine Adresse; gibt ((lat, lon), fehler) zurück"""
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * (2 ** (attempt - 1)))
+        bucket.acquire()
+        GEOCODING_CALLS.inc()
+        start = time.perf_counter()
+        try:
+            result = client.geocode(address)
+        except Exception as e:
+            GEOCODING_ERRORS.inc(reason='exception')
+            error = str(e)
+            continue
+        finally:
+            GEOCODING_LATENCY.observe(time.perf_counter() - start)
+        if result:
+            location = result[0]['geometry']['location']
+            return (location['lat'], location['lng']), None
+        # Leeres Ergebnis ist endgültig, kein erneuter Versuch
+        GEOCODING_ERRORS.inc(reason='not_found')
+        return (None, None), NOT_FOUND
+    return (None, None), error
+
+
+def geocode_bulk(addresses, client, cache=None, max_workers=MAX_WORKERS,
+                 rate=REQUESTS_PER_SECOND, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Geocodiert eindeutige Adressen parallel.
+    - Cache-Treffer werden vorab mit einer Abfrage beantwortet
+    - Restliche Adressen laufen über einen begrenzten Thread-Pool
+    - Anfragerate wird per Token-Bucket begrenzt, Fehler mit Backoff wiederholt
+    Rückgabe: ({adresse: (lat, lon)}, GeocodeSummary)
+    """
+    unique_addresses = list(dict.fromkeys(addresses))
+    summary = GeocodeSummary()
+    summary.total = len(unique_addresses)
+
+    results = cache.get_many(unique_addresses) if cache is not None else {}
+    summary.cached = len(results)
+    for address, (lat, lon) in results.items():
+        if lat is None:
+            summary.failed[address] = f'{NOT_FOUND} (Cache)'
+
+    missing = [a for a in unique_addresses if a not in results]
+    if missing:
+        bucket = TokenBucket(rate)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            outcomes = executor.map(
+                lambda a: _geocode_with_retry(client, a, bucket, retries, backoff), missing
+            )
+            to_cache = {}
+            for address, (coordinates, error) in zip(missing, outcomes):
+                results[address] = coordinates
+                if error is None:
+                    summary.resolved += 1
+                    to_cache[address] = coordinates
+                else:
+                    summary.failed[address] = error
+                    # Nur endgültig nicht auflösbare Adressen negativ cachen
+                    if error == NOT_FOUND:
+                        to_cache[address] = coordinates
+
+        if cache is not None:
+            cache.put_many(to_cache)
+
+    GEOCODING_CACHE.inc(summary.cached, result='hit')
+    GEOCODING_CACHE.inc(len(missing), result='miss')
+    log_event('geocoding_summary', total=summary.total, cached=summary.cached,
+              resolved=summary.resolved, failed=len(summary.failed))
+    return results, summary
@@ -0,0 +1,309 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.DistanceMatrix import haversine_matrix, get_speed_profile
+from backend.Metrics import timed_stage, log_event
+from backend.Solver import (SolverBackend, SolvedRoute, SOLVER_BACKENDS, get_solver,
+                            service_duration, route_duration_limit, planning_horizon)
+
+try:
+    from config import DECOMPOSITION_CLUSTERS
+except ImportError:
+    DECOMPOSITION_CLUSTERS = 0  # 0/1 = monolithisches Modell
+
+try:
+    from config import DECOMPOSITION_GAP_CHECK
+except ImportError:
+    DECOMPOSITION_GAP_CHECK = False  # Zusätzlicher monolithischer Lauf zum Vergleich
+
+MIN_PATIENTS_PER_CLUSTER = 20   # Kleinere Modelle lohnen die Zerlegung nicht
+KMEANS_ITERATIONS = 50
+BOUNDARY_RATIO = 1.5            # Patient liegt am Rand, wenn 2. Zentrum < 1,5 * nächstes Zentrum
+NEIGHBOR_CLUSTERS = 2           # Nachbarcluster, die bei der Randkorrektur geprüft werden
+
+
+def _planar(lat, lon, ref_lat):
+    """Lat/Lon in eine lokal längentreue Ebene (Grad) für k-means"""
+    return np.column_stack([np.asarray(lat, dtype=float),
+                            np.asarray(lon, dtype=float) * np.cos(np.radians(ref_lat))])
+
+
+def kmeans(points, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Vektorisiertes k-means mit k-means++-Initialisierung.
+    Gibt (labels, centers) zurück; leere Cluster werden mit dem entferntesten Punkt neu besetzt.
+    """
+    points = np.asarray(points, dtype=float)
+    k = min(k, len(points))
+    rng = np.random.default_rng(seed)
+
+    centers = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        d2 = ((points[:, None, :] - np.asarray(centers)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        total = d2.sum()
+        probabilities = d2 / total if total > 0 else None
+        centers.append(points[rng.choice(len(points), p=probabilities)])
+    centers = np.asarray(centers)
+
+    labels = np.zeros(len(points), dtype=int)
+    for _ in range(iterations):
+        distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        counts = np.bincount(new_labels, minlength=k)
+        for empty in np.flatnonzero(counts == 0):
+            far = distances[np.arange(len(points)), new_labels].argmax()
+            new_labels[far] = empty
+            distances[far] = 0
+        sums = np.zeros_like(centers)
+        np.add.at(sums, new_labels, points)
+        centers = sums / np.bincount(new_labels, minlength=k)[:, None]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centers
+
+
+def assign_vehicles(vehicle_points, centers, demand, capacity):
+    """
+    Verteilt Mitarbeiter auf Cluster: jeder Cluster erhält abwechselnd den nächstgelegenen
+    freien Mitarbeiter, solange seine Arbeitszeit hinter dem Bedarfsanteil zurückliegt.
+    Gibt je Mitarbeiter den Clusterindex zurück.
+    """
+    k = len(centers)
+    distances = ((vehicle_points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    target = capacity.sum() * demand / max(demand.sum(), 1e-9)
+    assigned = np.zeros(k)
+    labels = np.full(len(vehicle_points), -1, dtype=int)
+    free = set(range(len(vehicle_points)))
+    while free:
+        # Cluster mit dem größten verbleibenden Bedarf zuerst
+        cluster = int(np.argmax(target - assigned))
+        vehicle = min(free, key=lambda v: distances[v, cluster])
+        labels[vehicle] = cluster
+        assigned[cluster] += capacity[vehicle]
+        free.discard(vehicle)
+    return labels
+
+
+class DecomposedSolver(SolverBackend):
+    """
+    Zerlegt große Modelle geografisch:
+    - k-means über die Patientenkoordinaten, Mitarbeiter nach Bedarf auf die Cluster verteilt
+    - Teilmodelle werden parallel mit dem eigentlichen Solver gelöst
+    - Randkorrektur: randnahe und nicht zugeteilte Patienten wandern in Routen benachbarter
+      Cluster, wenn das die geschätzte Fahrzeit senkt bzw. die Routenzeit es zulässt
+    """
+
+    def __init__(self, base, clusters=DECOMPOSITION_CLUSTERS, gap_check=DECOMPOSITION_GAP_CHECK,
+                 speed_profile=None):
+        self.base = base  # Name des Solvers für die Teilmodelle
+        self.clusters = clusters
+        self.gap_check = gap_check
+        self.speed_profile = get_speed_profile(speed_profile)
+        self.name = f"{self.base}-k{clusters}"
+        self.last_report = None
+
+    def _base_solver(self):
+        # Eigene Instanz je Teilmodell, da Solver Zwischenstände am Objekt halten
+        return SOLVER_BACKENDS[self.base]()
+
+    def _travel(self, a, b):
+        """Geschätzte Fahrzeit in Sekunden zwischen zwei (lat, lon)"""
+        km = haversine_matrix([a[0]], [a[1]], [b[0]], [b[1]])[0, 0]
+        return float(self.speed_profile.travel_seconds(km))
+
+    def solve(self, patients, vehicles, weekday, should_stop=None, initial_routes=None):
+        start = time.perf_counter()
+        routes, report = self._solve_decomposed(patients, vehicles, weekday, should_stop, initial_routes)
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        report.update(summarize(routes, len(patients)))
+
+        if self.gap_check and not (should_stop and should_stop()):
+            report['monolithic'] = compare_with_monolithic(
+                self._base_solver(), patients, vehicles, weekday, report, should_stop, initial_routes)
+        self.last_report = report
+        log_event('decomposition', **{key: value for key, value in report.items() if key != 'cluster_sizes'})
+        return routes
+
+    def _solve_decomposed(self, patients, vehicles, weekday, should_stop, initial_routes):
+        located = [i for i, p in enumerate(patients) if p.lat is not None and p.lon is not None]
+        staffed = [k for k, v in enumerate(vehicles) if v.lat is not None and v.lon is not None]
+        k = min(self.clusters, len(staffed), len(located) // MIN_PATIENTS_PER_CLUSTER)
+        if k < 2:
+            # Zu klein für eine Zerlegung: ein Modell wie bisher
+            return (self._base_solver().solve(patients, vehicles, weekday, should_stop, initial_routes),
+                    {'clusters': 1})
+
+        with timed_stage('clustering', clusters=k, shipments=len(located)):
+            ref_lat = float(np.mean([patients[i].lat for i in located]))
+            points = _planar([patients[i].lat for i in located], [patients[i].lon for i in located], ref_lat)
+            labels, centers = kmeans(points, k)
+            demand = np.bincount(labels, weights=[service_duration(patients[i].visit_type) for i in located],
+                                 minlength=k)
+            vehicle_points = _planar([vehicles[v].lat for v in staffed], [vehicles[v].lon for v in staffed],
+                                     ref_lat)
+            capacity = np.array([route_duration_limit(vehicles[v]) for v in staffed], dtype=float)
+            vehicle_labels = assign_vehicles(vehicle_points, centers, demand, capacity)
+
+        groups = [([located[i] for i in np.flatnonzero(labels == c)],
+                   [staffed[v] for v in np.flatnonzero(vehicle_labels == c)])
+                  for c in range(k)]
+
+        def solve_cluster(group):
+            patient_idx, vehicle_idx = group
+            if not patient_idx or not vehicle_idx:
+                return []
+            # Startlösung auf die Patienten und Mitarbeiter des Clusters einschränken
+            local_patient = {i: local for local, i in enumerate(patient_idx)}
+            sub_initial = {}
+            for local, v in enumerate(vehicle_idx):
+                sequence = [local_patient[i] for i in (initial_routes or {}).get(v, ()) if i in local_patient]
+                if sequence:
+                    sub_initial[local] = sequence
+            sub_routes = self._base_solver().solve([patients[i] for i in patient_idx],
+                                                   [vehicles[v] for v in vehicle_idx], weekday, should_stop,
+                                                   sub_initial)
+            # Indizes des Teilmodells auf das Gesamtmodell abbilden
+            return [SolvedRoute(vehicle_idx[r.vehicle_index], [patient_idx[i] for i in r.shipment_indices],
+                                r.duration_seconds, r.legs)
+                    for r in sub_routes]
+
+        with ThreadPoolExecutor(max_workers=k) as executor:
+            cluster_routes = list(executor.map(solve_cluster, groups))
+
+        routes = {k_: SolvedRoute(k_, [], 0) for k_ in range(len(vehicles))}
+        for sub_routes in cluster_routes:
+            for route in sub_routes:
+                routes[route.vehicle_index] = route
+        routes = [routes[k_] for k_ in range(len(vehicles))]
+
+        moves = 0
+        if not (should_stop and should_stop()):
+            with timed_stage('boundary_repair', clusters=k):
+                cluster_of_vehicle = {staffed[v]: int(c) for v, c in enumerate(vehicle_labels)}
+                moves = self._repair_boundaries(patients, vehicles, weekday, routes, located, points,
+                                                labels, centers, cluster_of_vehicle)
+
+        return routes, {
+            'clusters': k,
+            'cluster_sizes': [[len(p), len(v)] for p, v in groups],
+            'boundary_moves': moves
+        }
+
+    def _route_points(self, patients, vehicle, route):
+        depot = (vehicle.lat, vehicle.lon)
+        return [depot] + [(patients[i].lat, patients[i].lon) for i in route.shipment_indices] + [depot]
+
+    def _best_insertion(self, patients, vehicle, route, node, limit):
+        """(Mehrzeit, Position) der günstigsten zulässigen Einfügung oder None"""
+        seq = self._route_points(patients, vehicle, route)
+        point = (patients[node].lat, patients[node].lon)
+        extra = service_duration(patients[node].visit_type)
+        best = None
+        for pos in range(len(seq) - 1):
+            delta = self._travel(seq[pos], point) + self._travel(point, seq[pos + 1]) - self._travel(seq[pos], seq[pos + 1])
+            if route.duration_seconds + delta + extra > limit:
+                continue
+            if best is None or delta < best[0]:
+                best = (delta, pos)
+        return best
+
+    def _removal_saving(self, patients, vehicle, route, position):
+        seq = self._route_points(patients, vehicle, route)
+        a, node, b = seq[position], seq[position + 1], seq[position + 2]
+        return self._travel(a, node) + self._travel(node, b) - self._travel(a, b)
+
+    def _repair_boundaries(self, patients, vehicles, weekday, routes, located, points, labels, centers,
+                           cluster_of_vehicle):
+        """
+        Verschiebt Patienten zwischen benachbarten Clustern. Entscheidungen und Dauerkorrekturen
+        beruhen auf geschätzten Fahrzeiten (Luftlinie und Geschwindigkeitsprofil).
+        """
+        horizon = planning_horizon(weekday)
+        limits = {k: min(route_duration_limit(v), horizon) for k, v in enumerate(vehicles)}
+        routes_of_cluster = {}
+        for k, cluster in cluster_of_vehicle.items():
+            routes_of_cluster.setdefault(cluster, []).append(k)
+        position = {i: (route.vehicle_index, pos)
+                    for route in routes for pos, i in enumerate(route.shipment_indices)}
+
+        distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        order = np.argsort(distances, axis=1)
+        nearest = distances[np.arange(len(points)), order[:, 0]]
+        second = distances[np.arange(len(points)), order[:, 1]]
+        # Randpatienten und nicht zugeteilte Patienten
+        candidates = [row for row in range(len(located))
+                      if located[row] not in position or second[row] < nearest[row] * BOUNDARY_RATIO ** 2]
+
+        moves = 0
+        for row in candidates:
+            node = located[row]
+            home = int(labels[row])
+            neighbors = [int(c) for c in order[row, :NEIGHBOR_CLUSTERS + 1] if c != home][:NEIGHBOR_CLUSTERS]
+            saving = None
+            if node in position:
+                source, pos = position[node]
+                saving = self._removal_saving(patients, vehicles[source], routes[source], pos)
+            best = None
+            for cluster in neighbors + ([home] if saving is None else []):
+                for k in routes_of_cluster.get(cluster, ()):
+                    option = self._best_insertion(patients, vehicles[k], routes[k], node, limits[k])
+                    if option is not None and (best is None or option[0] < best[0]):
+                        best = (option[0], k, option[1])
+            if best is None or (saving is not None and best[0] >= saving - 1e-6):
+                continue
+
+            delta, target, pos = best
+            if saving is not None:
+                route = routes[source]
+                route.legs = None  # Etappen des Solvers passen nicht mehr zur Reihenfolge
+                route.shipment_indices.pop(position[node][1])
+                route.duration_seconds = (route.duration_seconds - saving - service_duration(patients[node].visit_type)
+                                          if route.shipment_indices else 0)
+                for p_, i in enumerate(route.shipment_indices):
+                    position[i] = (source, p_)
+            route = routes[target]
+            route.legs = None
+            if not route.shipment_indices:
+                route.duration_seconds = 0
+            route.shipment_indices.insert(pos, node)
+            route.duration_seconds += delta + service_duration(patients[node].visit_type)
+            for p_, i in enumerate(route.shipment_indices):
+                position[i] = (target, p_)
+            moves += 1
+        return moves
+
+
+def summarize(routes, patient_count):
+    """Kennzahlen eines Lösungsstands für den Qualitätsvergleich"""
+    assigned = sum(len(route.shipment_indices) for route in routes)
+    return {
+        'total_hours': round(sum(route.duration_hrs for route in routes), 2),
+        'assigned': assigned,
+        'unassigned': patient_count - assigned
+    }
+
+
+def compare_with_monolithic(solver, patients, vehicles, weekday, decomposed, should_stop=None,
+                            initial_routes=None):
+    """Löst das Gesamtmodell und vergleicht es mit dem zerlegten Ergebnis"""
+    start = time.perf_counter()
+    routes = solver.solve(patients, vehicles, weekday, should_stop, initial_routes)
+    monolithic = summarize(routes, len(patients))
+    monolithic['seconds'] = round(time.perf_counter() - start, 3)
+    if monolithic['total_hours']:
+        monolithic['gap_pct'] = round(
+            100.0 * (decomposed['total_hours'] - monolithic['total_hours']) / monolithic['total_hours'], 2)
+    monolithic['assigned_diff'] = decomposed['assigned'] - monolithic['assigned']
+    return monolithic
+
+
+def get_planning_solver(name=None, clusters=None):
+    """Konfigurierter Solver, bei DECOMPOSITION_CLUSTERS > 1 mit geografischer Zerlegung"""
+    solver = get_solver(name)
+    clusters = DECOMPOSITION_CLUSTERS if clusters is None else clusters
+    if clusters and clusters > 1:
+        return DecomposedSolver(solver.name, clusters)
+    return solver
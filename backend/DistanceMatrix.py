@@ -0,0 +1,264 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from config import SPEED_PROFILE
+except ImportError:
+    SPEED_PROFILE = 'mixed'
+
+MATRIX_CACHE_FOLDER = os.path.join('uploads', 'matrix_cache')
+MATRIX_CACHE_SIZE = 16          # Matrizen im Speicher
+MATRIX_DISK_ENTRIES = 200       # .npz-Dateien auf der Platte, älteste zuerst gelöscht
+MATRIX_DISK_BYTES = 512 * 1024 * 1024  # Höchstgröße des Ordners
+COORDINATE_PRECISION = 6        # Nachkommastellen für die Schlüsselbildung
+EARTH_RADIUS_KM = 6371.0
+
+
+class SpeedProfile:
+    """Schätzt Fahrzeiten aus Luftlinienentfernungen"""
+
+    def __init__(self, name, speed_kmh, detour_factor):
+        self.name = name
+        self.speed_kmh = speed_kmh
+        self.detour_factor = detour_factor
+
+    def travel_seconds(self, distance_km):
+        return distance_km * (self.detour_factor / self.speed_kmh * 3600)
+
+
+# Verfügbare Geschwindigkeitsprofile, erweiterbar über register_speed_profile
+SPEED_PROFILES = {}
+
+
+def register_speed_profile(profile):
+    SPEED_PROFILES[profile.name] = profile
+    return profile
+
+
+register_speed_profile(SpeedProfile('city', speed_kmh=25, detour_factor=1.4))
+register_speed_profile(SpeedProfile('mixed', speed_kmh=50, detour_factor=1.3))
+register_speed_profile(SpeedProfile('rural', speed_kmh=65, detour_factor=1.25))
+
+
+def get_speed_profile(profile=None):
+    if isinstance(profile, SpeedProfile):
+        return profile
+    name = profile or SPEED_PROFILE
+    if name not in SPEED_PROFILES:
+        raise ValueError(f"Unbekanntes Geschwindigkeitsprofil: {name}")
+    return SPEED_PROFILES[name]
+
+
+def haversine_pairs(lat_a, lon_a, lat_b, lon_b):
+    """Elementweise Luftlinienentfernungen in km (z.B. für die Etappen einer Route)"""
+    lat_a, lon_a = np.radians(lat_a), np.radians(lon_a)
+    lat_b, lon_b = np.radians(lat_b), np.radians(lon_b)
+    a = (np.sin((lat_b - lat_a) / 2) ** 2
+         + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lat_a, lon_a, lat_b, lon_b):
+    """Paarweise Luftlinienentfernungen in km zwischen zwei Koordinatenreihen"""
+    return haversine_pairs(np.asarray(lat_a)[:, None], np.asarray(lon_a)[:, None],
+                           np.asarray(lat_b)[None, :], np.asarray(lon_b)[None, :])
+
+
+def _as_coordinates(coordinates):
+    coords = np.asarray(list(coordinates), dtype=float).reshape(-1, 2)
+    return np.round(coords, COORDINATE_PRECISION)
+
+
+def coordinate_hash(coordinates):
+    """Reihenfolgeunabhängiger Hash einer Koordinatenmenge"""
+    coords = np.unique(_as_coordinates(coordinates), axis=0)
+    return hashlib.sha1(coords.tobytes()).hexdigest()
+
+
+class DistanceMatrix:
+    """
+    Entfernungsmatrix über eindeutige Koordinaten.
+    - Hinzufügen/Entfernen von Punkten berechnet nur die betroffenen Zeilen/Spalten
+    - Fahrzeiten werden je Geschwindigkeitsprofil aus den Entfernungen abgeleitet
+    """
+
+    def __init__(self, coordinates=()):
+        self.coords = np.empty((0, 2))
+        self.distances = np.empty((0, 0))
+        self._index = {}
+        self._durations = {}
+        self.add(coordinates)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __contains__(self, point):
+        return tuple(_as_coordinates([point])[0]) in self._index
+
+    def _reindex(self):
+        self._index = {tuple(c): i for i, c in enumerate(self.coords)}
+        self._durations.clear()
+
+    def add(self, coordinates):
+        """Ergänzt neue Punkte; bekannte Punkte werden übersprungen"""
+        new = [c for c in np.unique(_as_coordinates(coordinates), axis=0) if tuple(c) not in self._index]
+        if not new:
+            return 0
+        new = np.array(new)
+        all_coords = np.vstack([self.coords, new])
+        # Nur die neuen Zeilen berechnen, die Spalten ergeben sich aus der Symmetrie
+        block = haversine_matrix(new[:, 0], new[:, 1], all_coords[:, 0], all_coords[:, 1])
+        n = len(self.coords)
+        distances = np.empty((len(all_coords), len(all_coords)))
+        distances[:n, :n] = self.distances
+        distances[n:, :] = block
+        distances[:n, n:] = block[:, :n].T
+        self.coords, self.distances = all_coords, distances
+        self._reindex()
+        return len(new)
+
+    def remove(self, coordinates):
+        """Entfernt Punkte samt ihrer Zeilen und Spalten"""
+        drop = {tuple(c) for c in _as_coordinates(coordinates)} & self._index.keys()
+        if not drop:
+            return 0
+        keep = np.array([tuple(c) not in drop for c in self.coords])
+        self.coords = self.coords[keep]
+        self.distances = self.distances[np.ix_(keep, keep)]
+        self._reindex()
+        return len(drop)
+
+    def indices(self, coordinates):
+        """Matrixindizes für eine Koordinatenliste (Duplikate erlaubt)"""
+        return np.array([self._index[tuple(c)] for c in _as_coordinates(coordinates)], dtype=int)
+
+    def durations(self, profile=None):
+        """Fahrzeitmatrix in Sekunden für das Geschwindigkeitsprofil"""
+        profile = get_speed_profile(profile)
+        if profile.name not in self._durations:
+            self._durations[profile.name] = profile.travel_seconds(self.distances)
+        return self._durations[profile.name]
+
+    def submatrix(self, coordinates, profile=None):
+        """Fahrzeiten zwischen den angegebenen Punkten in deren Reihenfolge"""
+        idx = self.indices(coordinates)
+        return self.durations(profile)[np.ix_(idx, idx)]
+
+    def coordinate_hash(self):
+        return coordinate_hash(self.coords)
+
+    def copy(self):
+        matrix = DistanceMatrix()
+        matrix.coords, matrix.distances = self.coords.copy(), self.distances.copy()
+        matrix._reindex()
+        return matrix
+
+    def save(self, path):
+        # Kanonisch sortiert speichern, damit der Hash die Datei eindeutig beschreibt
+        order = np.lexsort((self.coords[:, 1], self.coords[:, 0]))
+        np.savez_compressed(path, coords=self.coords[order],
+                            distances=self.distances[np.ix_(order, order)])
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        matrix = cls()
+        matrix.coords, matrix.distances = data['coords'], data['distances']
+        matrix._reindex()
+        return matrix
+
+
+class MatrixCache:
+    """
+    Matrizen nach Koordinaten-Hash im Speicher (LRU) und als .npz auf der Platte.
+    Unbekannte Koordinatenmengen werden inkrementell aus der zuletzt genutzten Matrix
+    abgeleitet statt komplett neu berechnet.
+    Auf der Platte werden die am längsten ungenutzten Dateien gelöscht (Anzahl und Größe begrenzt).
+    """
+
+    def __init__(self, folder=MATRIX_CACHE_FOLDER, max_entries=MATRIX_CACHE_SIZE,
+                 max_disk_entries=MATRIX_DISK_ENTRIES, max_disk_bytes=MATRIX_DISK_BYTES):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.incremental_builds = 0
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.npz")
+
+    def _remember(self, key, matrix):
+        self._matrices[key] = matrix
+        self._matrices.move_to_end(key)
+        while len(self._matrices) > self.max_entries:
+            self._matrices.popitem(last=False)
+
+    def get(self, coordinates):
+        coords = np.unique(_as_coordinates(coordinates), axis=0)
+        key = coordinate_hash(coords)
+        with self._lock:
+            if key in self._matrices:
+                self.hits += 1
+                self._matrices.move_to_end(key)
+                return self._matrices[key]
+
+            path = self._path(key)
+            if os.path.exists(path):
+                self.disk_hits += 1
+                matrix = DistanceMatrix.load(path)
+                # Zugriffszeit für die LRU-Bereinigung
+                os.utime(path)
+            else:
+                if self._matrices:
+                    # Zuletzt genutzte Matrix anpassen: nur Differenz berechnen
+                    matrix = next(reversed(self._matrices.values())).copy()
+                    wanted = {tuple(c) for c in coords}
+                    matrix.remove([c for c in matrix.coords if tuple(c) not in wanted])
+                    matrix.add(coords)
+                    self.incremental_builds += 1
+                else:
+                    matrix = DistanceMatrix(coords)
+                if not os.path.exists(self.folder):
+                    os.makedirs(self.folder)
+                matrix.save(path)
+                self._prune_disk()
+            self._remember(key, matrix)
+            return matrix
+
+    def _prune_disk(self):
+        """Löscht die am längsten ungenutzten Dateien oberhalb der Grenzen"""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.npz'):
+                path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+        total = 0
+        for index, (_, size, path) in enumerate(entries):
+            total += size
+            # Die gerade gespeicherte (neueste) Matrix bleibt immer erhalten
+            if index and (index >= self.max_disk_entries or total > self.max_disk_bytes):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+
+
+# Gemeinsamer Matrix-Cache der Anwendung
+matrix_cache = MatrixCache()
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# Definition der erlaubten Besuchsarten
+VALID_VISIT_TYPES = {'HB', 'TK', 'Neuaufnahme'}
+
+# Mapping von Wochentagen
+WEEKDAY_MAPPING = {
+    0: 'Montag',
+    1: 'Dienstag',
+    2: 'Mittwoch',
+    3: 'Donnerstag',
+    4: 'Freitag'
+}
+WEEKDAYS = list(WEEKDAY_MAPPING.values())
+
+ADDRESS_COLUMNS = ['Nachname', 'Vorname', 'Strasse', 'Ort', 'PLZ']
+PATIENT_COLUMNS = (ADDRESS_COLUMNS + WEEKDAYS
+                   + [f"Uhrzeit/Info {day}" for day in WEEKDAYS])
+VEHICLE_COLUMNS = ADDRESS_COLUMNS + ['Stellenumfang', 'Funktion']
+
+# Ab dieser Dateigröße wird die Arbeitsmappe zeilenweise gestreamt
+STREAMING_THRESHOLD_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 5000
+
+# Excel-Zeile der ersten Datenzeile (Zeile 1 = Kopfzeile)
+FIRST_DATA_ROW = 2
+
+
+class IngestError(ValueError):
+    """Die Arbeitsmappe kann nicht verarbeitet werden (z.B. fehlende Spalten)"""
+
+
+def _normalize_header(value):
+    # Mehrfache Leerzeichen in Spaltennamen tolerieren ("Uhrzeit/Info  Donnerstag")
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def _cell_to_str(value):
+    """Zellwert wie bei read_excel(dtype=str) als String, leere Zellen als NaN"""
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _file_size(file):
+    try:
+        position = file.tell()
+        file.seek(0, 2)
+        size = file.tell()
+        file.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return 0
+
+
+def _validate_columns(columns, required_columns):
+    missing = [col for col in required_columns if col not in columns]
+    if missing:
+        raise IngestError(f"Excel-Datei hat nicht alle erforderlichen Spalten: {', '.join(missing)}")
+
+
+def iter_sheet_chunks(file, required_columns, chunksize=CHUNK_SIZE):
+    """
+    Streamt das erste Arbeitsblatt im openpyxl Read-Only-Modus als DataFrame-Blöcke.
+    Es werden nur die benötigten Spalten gehalten; der Index entspricht der Excel-Zeile.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_normalize_header(value) for value in next(rows, ())]
+        _validate_columns(header, required_columns)
+        positions = [header.index(col) for col in required_columns]
+
+        chunk, row_numbers = [], []
+        for row_number, row in enumerate(rows, start=FIRST_DATA_ROW):
+            values = [_cell_to_str(row[i]) if i < len(row) else np.nan for i in positions]
+            if all(pd.isna(v) for v in values):
+                continue
+            chunk.append(values)
+            row_numbers.append(row_number)
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=required_columns, index=row_numbers, dtype=object)
+                chunk, row_numbers = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=required_columns, index=row_numbers, dtype=object)
+    finally:
+        workbook.close()
+
+
+def read_sheet_chunks(file, required_columns, streaming=None):
+    """
+    Liest die Arbeitsmappe als Folge von DataFrames mit den benötigten Spalten.
+    Große .xlsx-Dateien werden gestreamt, alle anderen mit pandas gelesen.
+    """
+    filename = getattr(file, 'filename', None) or getattr(file, 'name', '') or ''
+    if streaming is None:
+        streaming = (filename.lower().endswith('.xlsx')
+                     and _file_size(file) > STREAMING_THRESHOLD_BYTES)
+    if streaming:
+        return iter_sheet_chunks(file, required_columns)
+
+    df = pd.read_excel(file, dtype=str)
+    df.columns = [_normalize_header(col) for col in df.columns]
+    _validate_columns(df.columns, required_columns)
+    df = df[required_columns].dropna(how='all')
+    df.index = df.index + FIRST_DATA_ROW
+    return [df]
+
+
+def _clean_text(series):
+    return series.fillna('').astype(str).str.strip()
+
+
+def _build_identity(df):
+    """Erzeugt Name und Adresse ('Strasse, PLZ Ort') spaltenweise"""
+    strasse, plz, ort = _clean_text(df['Strasse']), _clean_text(df['PLZ']), _clean_text(df['Ort'])
+    name = (_clean_text(df['Vorname']) + ' ' + _clean_text(df['Nachname'])).str.strip()
+    address = strasse + ', ' + plz + ' ' + ort
+    incomplete = (strasse == '') | (plz == '') | (ort == '')
+    return name, address, incomplete
+
+
+def _report(issues, mask, message):
+    for row_number in mask[mask].index:
+        issues.append((int(row_number), message))
+
+
+def prepare_patients(df, issues):
+    """
+    Bereitet einen Block der Patientendatei auf.
+    Rückgabe: DataFrame mit name, address und je Wochentag Besuchsart und Zeitinfo;
+    nur Patienten mit mindestens einem gültigen Besuch in der Woche.
+    """
+    visits = df[WEEKDAYS].apply(lambda col: col.str.strip())
+    has_visit = visits.isin(VALID_VISIT_TYPES).any(axis=1)
+    df, visits = df[has_visit], visits[has_visit]
+
+    name, address, incomplete = _build_identity(df)
+    _report(issues, incomplete, 'Adresse unvollständig, Patient übersprungen')
+
+    result = pd.DataFrame({'name': name, 'address': address}, index=df.index)
+    for day in WEEKDAYS:
+        result[day] = visits[day].where(visits[day].isin(VALID_VISIT_TYPES))
+        # NaN in Uhrzeit/Info zu leerem String bereinigen
+        result[f"Uhrzeit/Info {day}"] = _clean_text(df[f"Uhrzeit/Info {day}"])
+    return result[~incomplete]
+
+
+def prepare_vehicles(df, issues):
+    """
+    Bereitet einen Block der Mitarbeiterdatei auf.
+    Stellenumfang wird spaltenweise geparst und auf 0–100 begrenzt.
+    """
+    name, address, incomplete = _build_identity(df)
+    _report(issues, incomplete, 'Adresse unvollständig, Mitarbeiter übersprungen')
+
+    raw = _clean_text(df['Stellenumfang']).str.replace('%', '', regex=False).str.replace(',', '.', regex=False)
+    stellenumfang = pd.to_numeric(raw, errors='coerce')
+    invalid = stellenumfang.isna()
+    _report(issues, invalid & (raw != ''), 'Stellenumfang ungültig, 100 % angenommen')
+    stellenumfang = np.trunc(stellenumfang.fillna(100)).clip(0, 100).astype(int)
+
+    result = pd.DataFrame({
+        'name': name,
+        'start_address': address,
+        'stellenumfang': stellenumfang,
+        'funktion': _clean_text(df['Funktion'])
+    }, index=df.index)
+    return result[~incomplete]
+
+
+def _ingest(file, required_columns, prepare, streaming):
+    issues = []
+    frames = [prepare(chunk, issues) for chunk in read_sheet_chunks(file, required_columns, streaming)]
+    frames = [frame for frame in frames if not frame.empty]
+    result = pd.concat(frames) if frames else prepare(pd.DataFrame(columns=required_columns), issues)
+    return result, sorted(issues)
+
+
+def ingest_patients(file, streaming=None):
+    """Liest und bereinigt die Patientendatei; Rückgabe: (DataFrame, [(zeile, meldung)])"""
+    return _ingest(file, PATIENT_COLUMNS, prepare_patients, streaming)
+
+
+def ingest_vehicles(file, streaming=None):
+    """Liest und bereinigt die Mitarbeiterdatei; Rückgabe: (DataFrame, [(zeile, meldung)])"""
+    return _ingest(file, VEHICLE_COLUMNS, prepare_vehicles, streaming)
+
+
+def format_issues(issues, limit=10):
+    """Fasst fehlerhafte Zeilen für eine Flash-Meldung zusammen"""
+    if not issues:
+        return None
+    lines = [f"Zeile {row}: {message}" for row, message in issues[:limit]]
+    if len(issues) > limit:
+        lines.append(f"… und {len(issues) - limit} weitere")
+    return f"{len(issues)} fehlerhafte Zeilen: " + '; '.join(lines)
@@ -1,30 +1,53 @@
 import io
 import pandas as pd
-from flask import flash, redirect, url_for, session, current_app as app
+from flask import flash, redirect, url_for, session
 import googlemaps
 import os
 from werkzeug.utils import secure_filename
 
 from config import GOOGLE_MAPS_API_KEY
-from backend.entities import Patient, Vehicle, patients, vehicles
+from backend.entities import Patient, Vehicle, EntityStore, patients_for_weekday
+from backend.GeocodeCache import GeocodeCache
+from backend.BulkGeocoder import geocode_bulk
+from backend.Gazetteer import GEOCODING_MODE, get_gazetteer, resolve_addresses
+from backend.UploadSnapshots import upload_snapshots
+from backend.Metrics import timed_stage
+from backend.ExcelIngest import (VALID_VISIT_TYPES, WEEKDAY_MAPPING, WEEKDAYS, IngestError,
+                                 ingest_patients, ingest_vehicles, format_issues)
 
 # Google Maps Client initialisieren
 gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
 
+# Persistenter Geocoding-Cache
+geocode_cache = GeocodeCache()
+
 def get_selected_weekday():
     """Gibt den ausgewählten Wochentag zurück, standardmäßig 'Montag'"""
     return session.get('selected_weekday', 'Montag')
 
-def geocode_address(address):
-    try:
-        result = gmaps.geocode(address)
-        if result:
-            location = result[0]['geometry']['location']
-            return location['lat'], location['lng']
-        return None, None
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        return None, None
+def geocode_addresses(addresses, client=None):
+    """
+    Geocodiert eine Adressliste gesammelt (Ortsverzeichnis, Cache + paralleles Geocoding).
+    Rückgabe: ({adresse: (lat, lon)}, GeocodeSummary mit Genauigkeit je Adresse)
+    """
+    with timed_stage('geocoding', mode=GEOCODING_MODE):
+        return resolve_addresses(
+            addresses,
+            lambda remaining: geocode_bulk(remaining, client or gmaps, cache=geocode_cache),
+            gazetteer=get_gazetteer()
+        )
+
+def flash_ingest_issues(issues):
+    """Meldet fehlerhafte Zeilen mit ihren Zeilennummern"""
+    message = format_issues(issues)
+    if message:
+        flash(message)
+
+def flash_geocode_summary(summary):
+    """Meldet fehlgeschlagene Adressen gesammelt statt einzeln"""
+    message = summary.message()
+    if message:
+        flash(message)
 
 # Konfiguration für File Upload
 UPLOAD_FOLDER = 'uploads'
@@ -36,72 +59,105 @@ if not os.path.exists(UPLOAD_FOLDER):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Definition der erlaubten Besuchsarten
-VALID_VISIT_TYPES = {'HB', 'TK', 'Neuaufnahme'}
-
-# Mapping von Wochentagen
-WEEKDAY_MAPPING = {
-    0: 'Montag',
-    1: 'Dienstag',
-    2: 'Mittwoch',
-    3: 'Donnerstag',
-    4: 'Freitag'
-}
-
-def handle_patient_upload(request, selected_weekday=None):
+def _with_coordinates(df, column, coordinates, summary):
+    """Ergänzt lat, lon und Genauigkeit je Zeile aus dem Geocoding-Ergebnis"""
+    df = df.copy()
+    df['lat'] = df[column].map(lambda address: coordinates[address][0])
+    df['lon'] = df[column].map(lambda address: coordinates[address][1])
+    df['precision'] = df[column].map(summary.precision.get)
+    return df
+
+def _geocoded_upload(kind, file, ingest, column):
+    """
+    Geparste und geocodierte Arbeitsmappe als (DataFrame mit lat/lon/precision, meldungen).
+    Bereits verarbeitete Dateien kommen aus dem Upload-Snapshot ohne Parsen und Geocoding.
+    """
+    key = upload_snapshots.key(kind, file, GEOCODING_MODE)
+    snapshot = upload_snapshots.load(kind, key)
+    if snapshot is not None:
+        df, issues = snapshot
+        flash_ingest_issues(issues)
+        return df, issues
+
+    with timed_stage('excel_parse', upload=kind):
+        df, issues = ingest(file)
+    flash_ingest_issues(issues)
+
+    coordinates, summary = geocode_addresses(df[column])
+    flash_geocode_summary(summary)
+    df = _with_coordinates(df, column, coordinates, summary)
+
+    # Nur vollständig geocodierte Uploads speichern, sonst würden Fehler beim nächsten Upload nicht wiederholt
+    if not summary.failed and not summary.approximate:
+        upload_snapshots.save(kind, key, df, issues)
+    return df, issues
+
+def _optional(value):
+    return None if pd.isna(value) else value
+
+def apply_patient_upload(state, df, weekday):
+    """Baut den Wochendatensatz aus der aufbereiteten Patiententabelle, Rückgabe: Patienten des Wochentags"""
+    weekly_patients = []
+    for patient_id, record in enumerate(df.to_dict('records'), start=1):
+        weekly_patients.append({
+            'id': patient_id,
+            'name': record['name'],
+            'address': record['address'],
+            'lat': _optional(record['lat']),
+            'lon': _optional(record['lon']),
+            'precision': _optional(record['precision']),
+            'visits': {
+                day: (record[day], record[f"Uhrzeit/Info {day}"])
+                for day in WEEKDAYS if pd.notna(record[day])
+            }
+        })
+    # Neue Objekte statt Änderungen an den bestehenden: laufende Anfragen sehen einen konsistenten Stand
+    state.weekly_patients = weekly_patients
+    return len(state.patients_for(weekday))
+
+def apply_vehicle_upload(state, df):
+    """Ersetzt die Mitarbeiterliste aus der aufbereiteten Mitarbeitertabelle"""
+    vehicles = EntityStore()
+    for record in df.to_dict('records'):
+        vehicles.append(Vehicle(
+            name=record['name'],
+            start_address=record['start_address'],
+            lat=_optional(record['lat']),
+            lon=_optional(record['lon']),
+            precision=_optional(record['precision']),
+            stellenumfang=int(record['stellenumfang']),
+            funktion=record['funktion']
+        ))
+    state.vehicles = vehicles
+    return len(vehicles)
+
+def handle_patient_upload(request, commit, selected_weekday=None):
+    """
+    Parst und geocodiert die Patientendatei; commit(df, wochentag) übernimmt das Ergebnis
+    nur nach erfolgreicher Aufbereitung und gibt die Zahl der Patienten des Wochentags zurück
+    """
     if request.method == 'POST' and 'patient_file' in request.files:
         file = request.files['patient_file']
         if file and file.filename != '' and allowed_file(file.filename):
             try:
-                # Speichere die letzte Datei für späteres Neuladen
-                app.last_patient_upload = request
-                
-                df = pd.read_excel(file, dtype=str)
-                # Basis-Spalten
-                required_columns = ['Nachname', 'Vorname', 'Strasse', 'Ort', 'PLZ']
-                # Wochentags-Spalten
-                required_columns += list(WEEKDAY_MAPPING.values())
-                # Uhrzeit/Info-Spalten für jeden Wochentag
-                required_columns += [f"Uhrzeit/Info {day}" for day in WEEKDAY_MAPPING.values()]
-                
-                if not all(col in df.columns for col in required_columns):
-                    flash('Excel-Datei hat nicht alle erforderlichen Spalten')
-                    return redirect(request.url)
+                # Alle Adressen einmalig für die ganze Woche geocodieren
+                df, issues = _geocoded_upload('patients', file, ingest_patients, 'address')
 
                 # Verwende den übergebenen Wochentag oder hole ihn aus der Session
                 weekday = selected_weekday or get_selected_weekday()
-                
-                # Spaltenname für Zeitinfo
-                time_info_column = f"Uhrzeit/Info {weekday}"
-                
-                # Filtere nach Wochentag und gültigen Besuchsarten
-                df_filtered = df[df[weekday].isin(VALID_VISIT_TYPES)].copy()
-
-                patients.clear()
-                for _, row in df_filtered.iterrows():
-                    name = f"{row['Vorname']} {row['Nachname']}"
-                    address = f"{row['Strasse']}, {row['PLZ']} {row['Ort']}"
-                    visit_type = row[weekday]
-                    # Konvertiere NaN zu leerem String
-                    time_info = str(row.get(time_info_column, ""))
-                    time_info = "" if time_info.lower() == "nan" else time_info
-                    lat, lon = geocode_address(address)
-                    patient = Patient(
-                        name=name, 
-                        address=address, 
-                        visit_type=visit_type, 
-                        time_info=time_info,
-                        lat=lat, 
-                        lon=lon
-                    )
-                    patients.append(patient)
-
-                if len(patients) == 0:
+
+                # Wochendatensatz aufbauen: Besuchsart und Zeitinfo je Wochentag
+                patient_count = commit(df, weekday)
+
+                if patient_count == 0:
                     flash(f'Keine Patienten für {weekday} gefunden.')
                 else:
-                    flash(f'{len(patients)} Patienten für {weekday} erfolgreich importiert')
+                    flash(f'{patient_count} Patienten für {weekday} erfolgreich importiert')
                 return redirect(url_for('show_patients'))
 
+            except IngestError as e:
+                flash(str(e))
+                return redirect(request.url)
             except Exception as e:
                 flash(f'Fehler beim Verarbeiten der Patientendatei: {str(e)}')
                 return redirect(request.url)
@@ -112,7 +168,8 @@ def handle_patient_upload(request, selected_weekday=None):
     flash('Keine Patientendatei ausgewählt')
     return redirect(request.url)
 
-def handle_vehicle_upload(request):
+def handle_vehicle_upload(request, commit):
+    """Parst und geocodiert die Mitarbeiterdatei; commit(df) übernimmt das Ergebnis wie oben"""
     if 'vehicle_file' not in request.files:
         flash('Keine Mitarbeiterdatei ausgewählt')
         return redirect(request.url)
@@ -124,43 +181,19 @@ def handle_vehicle_upload(request):
 
     if file and allowed_file(file.filename):
         try:
-            df = pd.read_excel(file, dtype=str)
-
-            required_columns = ['Nachname', 'Vorname', 'Strasse', 'Ort', 'PLZ', 'Stellenumfang', 'Funktion']
-            if not all(col in df.columns for col in required_columns):
-                flash('Excel-Datei hat nicht alle erforderlichen Spalten')
-                return redirect(request.url)
+            # Alle Adressen vorab gesammelt geocodieren
+            df, issues = _geocoded_upload('vehicles', file, ingest_vehicles, 'start_address')
+            vehicle_count = commit(df)
 
-            vehicles.clear()
-            for _, row in df.iterrows():
-                lat, lon = geocode_address(f"{row['Strasse']}, {row['PLZ']} {row['Ort']}")
-                
-                try:
-                    stellenumfang_val = int(float(row['Stellenumfang']))
-                except:
-                    stellenumfang_val = 100
-
-                if stellenumfang_val < 0:  
-                    stellenumfang_val = 0
-                elif stellenumfang_val > 100:
-                    stellenumfang_val = 100
-
-                vehicle = Vehicle(
-                    name=f"{row['Vorname']} {row['Nachname']}",
-                    start_address=f"{row['Strasse']}, {row['PLZ']} {row['Ort']}",
-                    lat=lat,
-                    lon=lon,
-                    stellenumfang=stellenumfang_val,
-                    funktion=row.get('Funktion', '')
-                )
-                vehicles.append(vehicle)
-
-            if len(vehicles) == 0:
+            if vehicle_count == 0:
                 flash('Keine Mitarbeiter importiert')
             else:
-                flash(f'{len(vehicles)} Mitarbeiter erfolgreich importiert')
+                flash(f'{vehicle_count} Mitarbeiter erfolgreich importiert')
             return redirect(url_for('show_vehicles'))
 
+        except IngestError as e:
+            flash(str(e))
+            return redirect(request.url)
         except Exception as e:
             flash(f'Fehler beim Verarbeiten der Mitarbeiterdatei: {str(e)}')
             return redirect(request.url)
@@ -0,0 +1,189 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from backend.BulkGeocoder import GeocodeSummary, NOT_FOUND
+from backend.Metrics import log_event
+
+try:
+    from config import GAZETTEER_PATH
+except ImportError:
+    GAZETTEER_PATH = os.path.join('data', 'plz_ort.csv')  # Spalten plz, ort, lat, lon
+
+try:
+    from config import GEOCODING_MODE
+except ImportError:
+    GEOCODING_MODE = 'fallback'  # 'first_pass', 'fallback', 'offline' oder 'remote'
+
+GEOCODING_MODES = ('first_pass', 'fallback', 'offline', 'remote')
+
+# Genauigkeit einer Koordinate, von genau nach grob
+PRECISION_ADDRESS = 'address'   # Hausadresse über den Geocoding-Dienst
+PRECISION_PLZ_ORT = 'plz_ort'   # Mittelpunkt von PLZ und Ort
+PRECISION_PLZ = 'plz'           # Mittelpunkt der PLZ, Ort unbekannt
+PRECISION_ORT = 'ort'           # Mittelpunkt des Orts, PLZ unbekannt
+
+# Im Modus 'first_pass' ohne Nachfrage beim Geocoding-Dienst übernommen
+ACCEPTED_PRECISIONS = (PRECISION_PLZ_ORT,)
+
+# 'Strasse, PLZ Ort' oder 'PLZ Ort'
+ADDRESS_PATTERN = r'(?:^|[\s,])(?P<plz>\d{5})\s+(?P<ort>[^,]+?)\s*$'
+ORT_PATTERN = r',\s*(?P<ort>[^,\d]+?)\s*$'
+
+_UMLAUTS = {'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'}
+
+
+def normalize_ort(series):
+    """Ortsnamen vergleichbar machen (Kleinschreibung, Umlaute, ohne Satzzeichen)"""
+    series = series.fillna('').astype(str).str.lower()
+    for umlaut, replacement in _UMLAUTS.items():
+        series = series.str.replace(umlaut, replacement, regex=False)
+    return series.str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+
+
+def _centroids(keys, lat, lon):
+    """Mittelpunkt je Schlüssel als (pd.Index, lat, lon)"""
+    grouped = pd.DataFrame({'key': keys, 'lat': lat, 'lon': lon}).groupby('key', sort=True)[['lat', 'lon']].mean()
+    return (pd.Index(grouped.index),
+            grouped['lat'].to_numpy(dtype=np.float32), grouped['lon'].to_numpy(dtype=np.float32))
+
+
+class Gazetteer:
+    """
+    Ortsverzeichnis mit PLZ/Ort-Mittelpunkten im Speicher:
+    - Je Ebene (PLZ+Ort, PLZ, Ort) ein gehashter Index und float32-Koordinaten
+    - lookup() löst eine ganze Adressspalte mit einer vektorisierten Abfrage auf
+    - Jede Koordinate trägt ihre Genauigkeit, nicht gefundene Adressen None
+    """
+
+    def __init__(self, table):
+        plz = table['plz'].astype(str).str.strip().str.zfill(5)
+        ort = normalize_ort(table['ort'])
+        lat = pd.to_numeric(table['lat'], errors='coerce')
+        lon = pd.to_numeric(table['lon'], errors='coerce')
+        valid = plz.str.fullmatch(r'\d{5}') & lat.notna() & lon.notna()
+        plz, ort, lat, lon = plz[valid], ort[valid], lat[valid], lon[valid]
+        named = ort != ''
+
+        self.size = int(valid.sum())
+        self._levels = [
+            (PRECISION_PLZ_ORT, *_centroids((plz + ' ' + ort)[named], lat[named], lon[named])),
+            (PRECISION_PLZ, *_centroids(plz, lat, lon)),
+            (PRECISION_ORT, *_centroids(ort[named], lat[named], lon[named])),
+        ]
+
+    @classmethod
+    def load(cls, path):
+        """CSV mit Spalten plz, ort, lat, lon oder GeoNames-Postleitzahlen (.txt, tabgetrennt)"""
+        if path.lower().endswith('.txt'):
+            table = pd.read_csv(path, sep='\t', header=None, usecols=[1, 2, 9, 10], dtype=str,
+                                names=['plz', 'ort', 'lat', 'lon'], keep_default_na=False)
+        else:
+            table = pd.read_csv(path, sep=None, engine='python', dtype=str, keep_default_na=False)
+            table.columns = [str(col).strip().lower() for col in table.columns]
+        return cls(table)
+
+    def lookup(self, addresses):
+        """
+        Koordinaten für eine Adressspalte ('Strasse, PLZ Ort').
+        Rückgabe: DataFrame mit lat, lon und precision im Index der Eingabe
+        """
+        addresses = pd.Series(addresses, dtype=object).fillna('').astype(str)
+        parts = addresses.str.extract(ADDRESS_PATTERN)
+        ort = parts['ort'].fillna(addresses.str.extract(ORT_PATTERN)['ort'])
+        queries = {
+            PRECISION_PLZ_ORT: (parts['plz'] + ' ' + normalize_ort(parts['ort'])).to_numpy(),
+            PRECISION_PLZ: parts['plz'].to_numpy(),
+            PRECISION_ORT: normalize_ort(ort).to_numpy(),
+        }
+
+        lat = np.full(len(addresses), np.nan)
+        lon = np.full(len(addresses), np.nan)
+        precision = np.full(len(addresses), None, dtype=object)
+        open_rows = np.ones(len(addresses), dtype=bool)
+        for level, index, level_lat, level_lon in self._levels:
+            positions = index.get_indexer(queries[level])
+            hit = open_rows & (positions >= 0)
+            lat[hit] = level_lat[positions[hit]]
+            lon[hit] = level_lon[positions[hit]]
+            precision[hit] = level
+            open_rows &= ~hit
+        # float32-Mittelpunkte auf ~10 cm runden, damit keine Scheingenauigkeit entsteht
+        return pd.DataFrame({'lat': lat.round(6), 'lon': lon.round(6), 'precision': precision},
+                            index=addresses.index)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer(path=None):
+    """Gemeinsames Ortsverzeichnis, beim ersten Zugriff geladen; None ohne Datei"""
+    global _gazetteer
+    path = path or GAZETTEER_PATH
+    with _gazetteer_lock:
+        if _gazetteer is None or _gazetteer[0] != path:
+            gazetteer = None
+            if os.path.exists(path):
+                try:
+                    gazetteer = Gazetteer.load(path)
+                    log_event('gazetteer_loaded', path=path, entries=gazetteer.size)
+                except Exception as e:
+                    log_event('gazetteer_error', path=path, error=str(e))
+            _gazetteer = (path, gazetteer)
+        return _gazetteer[1]
+
+
+def resolve_addresses(addresses, remote, gazetteer=None, mode=None):
+    """
+    Geocodiert Adressen über Ortsverzeichnis und Geocoding-Dienst (remote: Adressliste ->
+    ({adresse: (lat, lon)}, GeocodeSummary)).
+    - first_pass: Ortsverzeichnis zuerst, nur unsichere Adressen gehen an den Dienst
+    - fallback: alle Adressen an den Dienst, Fehlschläge über das Ortsverzeichnis
+    - offline: nur Ortsverzeichnis; remote: nur Dienst
+    Rückgabe wie remote, summary.precision enthält die Genauigkeit je Adresse
+    """
+    mode = mode or GEOCODING_MODE
+    if mode not in GEOCODING_MODES:
+        raise ValueError(f"Unbekannter Geocoding-Modus: {mode}")
+    unique_addresses = list(dict.fromkeys(addresses))
+
+    if gazetteer is None or mode == 'remote':
+        results, summary = remote(unique_addresses)
+        summary.precision = {address: PRECISION_ADDRESS if address not in summary.failed else None
+                             for address in unique_addresses}
+        return results, summary
+
+    local = gazetteer.lookup(unique_addresses)
+    if mode == 'first_pass':
+        refine = [address for address, precision in zip(unique_addresses, local['precision'])
+                  if precision not in ACCEPTED_PRECISIONS]
+    elif mode == 'fallback':
+        refine = unique_addresses
+    else:
+        refine = []
+    results, summary = remote(refine) if refine else ({}, GeocodeSummary())
+    refined = set(refine)
+
+    summary.total = len(unique_addresses)
+    for address, lat, lon, precision in zip(unique_addresses, local['lat'], local['lon'], local['precision']):
+        if address in results and address not in summary.failed:
+            summary.precision[address] = PRECISION_ADDRESS
+        elif precision is not None:
+            results[address] = (float(lat), float(lon))
+            summary.precision[address] = precision
+            summary.failed.pop(address, None)
+            if address in refined:
+                summary.approximate[address] = precision
+            else:
+                summary.local += 1
+        else:
+            results[address] = (None, None)
+            summary.precision[address] = None
+            summary.failed.setdefault(address, NOT_FOUND)
+
+    log_event('gazetteer_summary', mode=mode, total=summary.total, local=summary.local,
+              remote=len(refine), approximate=len(summary.approximate), failed=len(summary.failed))
+    return results, summary
@@ -0,0 +1,169 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Konfiguration für den Geocoding-Cache
+CACHE_PATH = os.path.join('uploads', 'geocode_cache.sqlite')
+CACHE_TTL_SECONDS = 180 * 24 * 3600      # Erfolgreiche Treffer: 180 Tage
+NEGATIVE_TTL_SECONDS = 24 * 3600         # Fehlgeschlagene Adressen: 1 Tag
+CACHE_MAX_ENTRIES = 50000
+
+
+def normalize_address(address):
+    """Normalisiert eine Adresse der Form 'Strasse, PLZ Ort' zum Cache-Schlüssel"""
+    key = str(address).casefold().replace('ß', 'ss')
+    key = re.sub(r'str\.', 'strasse', key)
+    key = re.sub(r'\s*,\s*', ', ', key)
+    key = re.sub(r'\s+', ' ', key)
+    return key.strip(' ,')
+
+
+class GeocodeCache:
+    """Persistenter SQLite-Cache für Geocoding-Ergebnisse"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS,
+                 negative_ttl=NEGATIVE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocode (
+                    key TEXT PRIMARY KEY,
+                    lat REAL,
+                    lon REAL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_last_used ON geocode(last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _is_valid(self, lat, created, now):
+        # Negative Einträge (lat IS NULL) verfallen deutlich schneller
+        max_age = self.negative_ttl if lat is None else self.ttl
+        return now - created <= max_age
+
+    def get(self, address):
+        """Einzelabfrage; gibt (lat, lon), (None, None) bei negativem Treffer oder None zurück"""
+        return self.get_many([address]).get(address)
+
+    def get_many(self, addresses):
+        """
+        Beantwortet eine ganze Adressliste mit einer einzigen Abfrage.
+        Rückgabe: {adresse: (lat, lon)} nur für Cache-Treffer,
+        negative Treffer werden als (None, None) geliefert.
+        """
+        keys = {}
+        for address in addresses:
+            keys.setdefault(normalize_address(address), []).append(address)
+        if not keys:
+            return {}
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, lat, lon, created FROM geocode "
+                "WHERE key IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(keys)),)
+            ).fetchall()
+
+            found = {}
+            for key, lat, lon, created in rows:
+                if self._is_valid(lat, created, now):
+                    found[key] = (lat, lon)
+
+            if found:
+                conn.execute(
+                    "UPDATE geocode SET last_used = ? "
+                    "WHERE key IN (SELECT value FROM json_each(?))",
+                    (now, json.dumps(list(found)))
+                )
+
+            results = {}
+            for key, originals in keys.items():
+                if key in found:
+                    if found[key][0] is None:
+                        self.negative_hits += len(originals)
+                    else:
+                        self.hits += len(originals)
+                    for address in originals:
+                        results[address] = found[key]
+                else:
+                    self.misses += len(originals)
+        return results
+
+    def put(self, address, lat, lon):
+        self.put_many({address: (lat, lon)})
+
+    def put_failure(self, address):
+        """Merkt sich eine nicht auflösbare Adresse (negatives Caching)"""
+        self.put_many({address: (None, None)})
+
+    def put_many(self, results):
+        """Speichert {adresse: (lat, lon)}; (None, None) wird negativ gecacht"""
+        if not results:
+            return
+        now = time.time()
+        rows = [(normalize_address(address), lat, lon, now, now)
+                for address, (lat, lon) in results.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO geocode (key, lat, lon, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        # Abgelaufene Einträge entfernen
+        conn.execute(
+            "DELETE FROM geocode WHERE (lat IS NULL AND created < ?) "
+            "OR (lat IS NOT NULL AND created < ?)",
+            (now - self.negative_ttl, now - self.ttl)
+        )
+        # Größenbegrenzung: am längsten ungenutzte Einträge zuerst
+        count = conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM geocode WHERE key IN "
+                "(SELECT key FROM geocode ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM geocode")
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,134 @@
+import numpy as np
+
+from backend.DistanceMatrix import get_speed_profile, haversine_pairs
+from backend.RouteEvaluation import evaluate_route
+from backend.Solver import service_duration
+
+CELL_LAT = 0.05          # Rasterweite in Grad (~5,5 km)
+CELL_LON = 0.08          # ~5,5 km auf 51° nördlicher Breite
+MAX_RINGS = 8            # Suchradius in Rasterzellen, danach alle Routen prüfen
+KM_PER_DEGREE = 111.2
+
+
+def _cell(lat, lon):
+    return int(np.floor(lat / CELL_LAT)), int(np.floor(lon / CELL_LON))
+
+
+def _min_insertion_km(distance_km, max_edge_km):
+    """
+    Untere Schranke der Mehrstrecke für Etappen, die mindestens distance_km entfernt liegen
+    (ungünstigster Fall: Punkt mittig neben der längsten Etappe)
+    """
+    return 2 * np.hypot(distance_km, max_edge_km / 2) - max_edge_km
+
+
+class EdgeGrid:
+    """
+    Gleichmäßiges Raster über die Etappen der Routen (Stopps und Startpunkte):
+    jede Etappe ist in allen Zellen ihres umgebenden Rechtecks eingetragen
+    """
+
+    def __init__(self):
+        self._cells = {}
+
+    def add(self, a, b, route_index):
+        (row_a, col_a), (row_b, col_b) = _cell(*a), _cell(*b)
+        for row in range(min(row_a, row_b), max(row_a, row_b) + 1):
+            for col in range(min(col_a, col_b), max(col_a, col_b) + 1):
+                self._cells.setdefault((row, col), set()).add(route_index)
+
+    def ring(self, lat, lon, ring):
+        """Routen mit Etappen in den Zellen genau ring Zellen um (lat, lon)"""
+        row, col = _cell(lat, lon)
+        found = set()
+        for r in range(row - ring, row + ring + 1):
+            for c in range(col - ring, col + ring + 1):
+                if max(abs(r - row), abs(c - col)) == ring:
+                    found |= self._cells.get((r, c), set())
+        return found
+
+
+class InsertionIndex:
+    """
+    Schnelle Einfügevorschläge für nicht zugeordnete Patienten (z.B. TK):
+    - Raster über die Etappen der aktuellen Routen
+    - Die Suche wächst ringweise um den Patienten; für gefundene Routen wird jede Einfügeposition
+      vektorisiert bewertet (Mehrfahrzeit aus Luftlinie und Geschwindigkeitsprofil)
+    - Abbruch, sobald entferntere Etappen die k besten Vorschläge nicht mehr schlagen können
+    - Nur Einfügungen, die max_hours einhalten, werden vorgeschlagen
+    """
+
+    def __init__(self, routes, profile=None):
+        self.profile = get_speed_profile(profile)
+        self.grid = EdgeGrid()
+        self.routes = []
+        self.max_edge_km = 0.0
+        for route in routes:
+            start = route.get('vehicle_start') or {}
+            if start.get('lat') is None or start.get('lng') is None:
+                continue
+            depot = (float(start['lat']), float(start['lng']))
+            # Reguläre Stopps mit Koordinaten und ihre Position in der Stoppliste
+            regular = [(index, stop['location']) for index, stop in enumerate(route.get('stops', []))
+                       if stop.get('visit_type') != 'TK' and stop.get('location')
+                       and stop['location'].get('lat') is not None and stop['location'].get('lng') is not None]
+            path = np.array([depot] + [(float(l['lat']), float(l['lng'])) for _, l in regular] + [depot])
+            stops = route.get('stops', [])
+            positions = [index for index, _ in regular] + [regular[-1][0] + 1 if regular else len(stops)]
+
+            route_index = len(self.routes)
+            edge_km = haversine_pairs(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+            self.routes.append({
+                'vehicle': route.get('vehicle'),
+                'max_hours': route.get('max_hours'),
+                'duration_hrs': evaluate_route(route, self.profile)['duration_hrs'],
+                'lat': path[:, 0],
+                'lon': path[:, 1],
+                'edge_km': edge_km,
+                'positions': positions
+            })
+            self.max_edge_km = max(self.max_edge_km, float(edge_km.max()))
+            for a, b in zip(path[:-1], path[1:]):
+                self.grid.add(a, b, route_index)
+
+    def suggestions(self, lat, lon, visit_type='TK', k=3):
+        """Top-k Routen mit der geringsten Mehrfahrzeit für einen Patienten an (lat, lon)"""
+        if k < 1:
+            raise ValueError(f"k muss mindestens 1 sein, nicht {k}")
+        # Abstand vom Patienten zum Rand des durchsuchten Quadrats je Ring
+        cell_km = KM_PER_DEGREE * min(CELL_LAT, CELL_LON * np.cos(np.radians(lat))) * 0.99
+        seen, options = set(), []
+        for ring in range(MAX_RINGS + 1):
+            found = self.grid.ring(lat, lon, ring) - seen
+            seen |= found
+            options += self._options(found, lat, lon, visit_type)
+            options.sort(key=lambda option: option['added_km'])
+            if len(options) >= k and options[k - 1]['added_km'] <= _min_insertion_km(ring * cell_km, self.max_edge_km):
+                break
+        else:
+            options += self._options(set(range(len(self.routes))) - seen, lat, lon, visit_type)
+            options.sort(key=lambda option: option['added_km'])
+        return [{key: value for key, value in option.items() if key != 'added_km'} for option in options[:k]]
+
+    def _options(self, route_indices, lat, lon, visit_type):
+        """Günstigste zulässige Einfügeposition je Route"""
+        service_hrs = service_duration(visit_type) / 3600.0
+        options = []
+        for route_index in route_indices:
+            route = self.routes[route_index]
+            to_x = haversine_pairs(route['lat'], route['lon'], lat, lon)
+            added_km = to_x[:-1] + to_x[1:] - route['edge_km']
+            edge = int(np.argmin(added_km))
+            added_hrs = float(self.profile.travel_seconds(added_km[edge])) / 3600.0
+            duration_hrs = route['duration_hrs'] + added_hrs + service_hrs
+            if route['max_hours'] is not None and duration_hrs > float(route['max_hours']):
+                continue
+            options.append({
+                'added_km': float(added_km[edge]),
+                'vehicle': route['vehicle'],
+                'position': route['positions'][edge],
+                'added_minutes': round(added_hrs * 60, 1),
+                'duration_hrs': round(duration_hrs, 2),
+                'max_hours': route['max_hours']
+            })
+        return options
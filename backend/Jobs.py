@@ -0,0 +1,257 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.Metrics import log_event
+
+try:
+    from config import OPTIMIZATION_WORKERS
+except ImportError:
+    OPTIMIZATION_WORKERS = 2
+
+MAX_PENDING_JOBS = 10        # Wartende + laufende Jobs
+MAX_FINISHED_JOBS = 100      # Abgeschlossene Jobs, die abfragbar bleiben
+JOB_NAMESPACE = '_jobs'      # Team-Schlüssel der Jobdatensätze im StateStore
+CANCEL_CHECK_INTERVAL = 1.0  # Sekunden zwischen Abfragen eines Abbruchs aus anderen Prozessen
+JOB_POLL_INTERVAL = 1.0      # Sekunden zwischen Abfragen von Jobs anderer Prozesse
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = {DONE, FAILED, CANCELLED}
+
+
+class QueueFullError(RuntimeError):
+    """Die Warteschlange für Optimierungsjobs ist voll"""
+
+
+def describe(record, include_result=True):
+    """Statusantwort aus einem Jobdatensatz (Job.record() oder aus dem StateStore)"""
+    now = time.time()
+    started, finished = record.get('started'), record.get('finished')
+    data = {
+        'job_id': record['id'],
+        'status': record['status'],
+        'progress': record.get('progress', ''),
+        'description': record.get('description', ''),
+        'timings': {
+            'queued_s': round((started or now) - record['created'], 3),
+            'running_s': round((finished or now) - started, 3) if started else 0,
+        }
+    }
+    if record.get('error'):
+        data['message'] = record['error']
+    if include_result and record['status'] == DONE:
+        data['result'] = record.get('result')
+    return data
+
+
+def _cancel_key(job_id):
+    return f"{job_id}:cancel"
+
+
+class Job:
+    """Ein im Hintergrund laufender Optimierungsauftrag"""
+
+    def __init__(self, description='', store=None):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.status = QUEUED
+        self.progress = ''
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.version = 0  # Wird bei jeder Änderung erhöht
+        self.store = store  # Gemeinsamer Speicher, damit alle Worker-Prozesse den Job sehen
+        self._cancel_event = threading.Event()
+        self._cancel_checked = 0
+        self._changed = threading.Condition()
+
+    @property
+    def cancel_requested(self):
+        if self._cancel_event.is_set():
+            return True
+        # Abbruch über einen anderen Worker-Prozess, höchstens einmal je CANCEL_CHECK_INTERVAL abgefragt
+        if self.store is not None and time.monotonic() - self._cancel_checked >= CANCEL_CHECK_INTERVAL:
+            self._cancel_checked = time.monotonic()
+            try:
+                if self.store.load(JOB_NAMESPACE, _cancel_key(self.id))[1]:
+                    self._cancel_event.set()
+            except Exception as e:
+                log_event('job_store_error', job_id=self.id, error=str(e))
+        return self._cancel_event.is_set()
+
+    def set_progress(self, message):
+        self._update(progress=message)
+
+    def _update(self, **fields):
+        with self._changed:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.version += 1
+            self._save()
+            self._changed.notify_all()
+
+    def _save(self):
+        if self.store is None:
+            return
+        try:
+            self.store.save(JOB_NAMESPACE, self.id, self.record())
+        except Exception as e:
+            # Der Job läuft weiter, nur andere Prozesse sehen den Stand nicht
+            log_event('job_store_error', job_id=self.id, error=str(e))
+
+    def wait_for_change(self, version, timeout):
+        """Blockiert bis der Job eine neuere Version als version hat oder das Timeout abläuft"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+        return self.version
+
+    def record(self):
+        """Serialisierbarer Stand für den StateStore"""
+        return {
+            'id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+    def to_dict(self, include_result=True):
+        return describe(self.record(), include_result)
+
+
+class JobManager:
+    """
+    Führt Optimierungen auf einem begrenzten Thread-Pool aus.
+    - submit() kehrt sofort mit einem Job zurück
+    - Die Anzahl offener Jobs ist begrenzt (QueueFullError)
+    - Wartende Jobs werden sofort, laufende kooperativ abgebrochen
+    - Mit store liegen Status und Ergebnis im StateStore: Abfrage und Abbruch
+      funktionieren auch über andere Worker-Prozesse
+    """
+
+    def __init__(self, max_workers=OPTIMIZATION_WORKERS, max_pending=MAX_PENDING_JOBS,
+                 max_finished=MAX_FINISHED_JOBS, store=None):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='optimize')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pending_count(self):
+        return sum(1 for job in self._jobs.values() if job.status not in FINAL_STATES)
+
+    def submit(self, fn, *args, description=''):
+        """Startet fn(job, *args) im Hintergrund; der Rückgabewert wird job.result"""
+        with self._lock:
+            if self.pending_count() >= self.max_pending:
+                raise QueueFullError('Zu viele laufende Optimierungen, bitte später erneut versuchen')
+            job = Job(description, store=self.store)
+            job._save()
+            self._jobs[job.id] = job
+            self._prune()
+            job.future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        if job.cancel_requested:
+            job._update(status=CANCELLED, finished=time.time())
+            return
+        job._update(status=RUNNING, started=time.time())
+        try:
+            result = fn(job, *args)
+        except Exception as e:
+            job._update(status=FAILED, error=str(e), finished=time.time())
+            return
+        if job.cancel_requested:
+            job._update(status=CANCELLED, finished=time.time())
+        else:
+            job._update(status=DONE, result=result, finished=time.time())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINAL_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+            if self.store is not None:
+                try:
+                    self.store.delete(JOB_NAMESPACE, job_id)
+                    self.store.delete(JOB_NAMESPACE, _cancel_key(job_id))
+                except Exception as e:
+                    log_event('job_store_error', job_id=job_id, error=str(e))
+
+    def get(self, job_id):
+        """Job dieses Prozesses oder None"""
+        return self._jobs.get(job_id)
+
+    def status(self, job_id, include_result=True):
+        """Statusantwort eines Jobs dieses oder eines anderen Prozesses, None wenn unbekannt"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict(include_result)
+        if self.store is None:
+            return None
+        record = self.store.load(JOB_NAMESPACE, job_id)[1]
+        return describe(record, include_result) if record else None
+
+    def watch(self, job_id, keepalive=15):
+        """
+        Statusantworten bei jeder Änderung bis zum Ende des Jobs, None als Lebenszeichen
+        nach keepalive Sekunden ohne Änderung. Jobs anderer Prozesse werden abgefragt.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            version = job.version
+            yield job.to_dict()
+            while job.status not in FINAL_STATES:
+                new_version = job.wait_for_change(version, timeout=keepalive)
+                if new_version == version:
+                    yield None
+                    continue
+                version = new_version
+                yield job.to_dict()
+            return
+
+        seen, idle = None, 0
+        while True:
+            data = self.status(job_id)
+            if data is None:
+                return
+            if (data['status'], data['progress']) != seen:
+                seen, idle = (data['status'], data['progress']), 0
+                yield data
+            elif idle >= keepalive:
+                idle = 0
+                yield None
+            if data['status'] in FINAL_STATES:
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+            idle += JOB_POLL_INTERVAL
+
+    def cancel(self, job_id):
+        """Bricht einen Job ab und gibt seine Statusantwort zurück, None wenn unbekannt"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Job eines anderen Prozesses: Abbruch über den StateStore anfordern
+            data = self.status(job_id, include_result=False)
+            if data is not None and data['status'] not in FINAL_STATES:
+                self.store.save(JOB_NAMESPACE, _cancel_key(job_id), True)
+            return data
+        if job.status not in FINAL_STATES:
+            job._cancel_event.set()
+            if job.future is not None and job.future.cancel():
+                # Noch nicht gestartet
+                job._update(status=CANCELLED, finished=time.time())
+        return job.to_dict(include_result=False)
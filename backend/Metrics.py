@@ -0,0 +1,120 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Standard-Buckets in Sekunden (ms-Bereich bis mehrere Minuten)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger('sapv')
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket_counts, sum, count]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with _lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Metriken der Planungsstufen
+STAGE_DURATION = Histogram('sapv_stage_duration_seconds',
+                           'Dauer der Planungsstufen (excel_parse, geocoding, model_build, optimize_call, route_extraction)',
+                           ['stage'])
+GEOCODING_CALLS = Counter('sapv_geocoding_requests_total', 'Anfragen an den Geocoding-Dienst')
+GEOCODING_ERRORS = Counter('sapv_geocoding_errors_total', 'Fehlgeschlagene Geocoding-Anfragen', ['reason'])
+GEOCODING_CACHE = Counter('sapv_geocoding_cache_total', 'Geocoding-Cache-Abfragen', ['result'])
+GEOCODING_LATENCY = Histogram('sapv_geocoding_request_duration_seconds', 'Latenz einzelner Geocoding-Anfragen')
+HTTP_REQUESTS = Counter('sapv_http_requests_total', 'HTTP-Anfragen', ['endpoint', 'method', 'status'])
+HTTP_DURATION = Histogram('sapv_http_request_duration_seconds', 'Antwortzeit der HTTP-Endpunkte', ['endpoint'])
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Strukturierte Logzeile als JSON"""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps(dict(event=event, **fields), default=str, ensure_ascii=False))
+
+
+@contextmanager
+def timed_stage(stage, **fields):
+    """Misst eine Planungsstufe und schreibt Histogramm und Logzeile"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.observe(duration, stage=stage)
+        log_event('stage', stage=stage, duration_ms=round(duration * 1000, 2), **fields)
+
+
+def render_prometheus():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def configure_logging(level=logging.INFO):
+    """Gibt die strukturierten Logzeilen auf stderr aus (einmalig)"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
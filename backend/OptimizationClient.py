@@ -0,0 +1,96 @@
+import itertools
+import os
+import threading
+
+import grpc
+from google.api_core import exceptions, retry as retries
+from google.maps import routeoptimization_v1
+
+from backend.Metrics import log_event
+
+try:
+    from config import OPTIMIZATION_CLIENTS
+except ImportError:
+    OPTIMIZATION_CLIENTS = 1  # gRPC-Kanäle pro Prozess
+
+try:
+    from config import OPTIMIZATION_DEADLINE
+except ImportError:
+    OPTIMIZATION_DEADLINE = 300  # Sekunden für einen optimize_tours-Aufruf inkl. Wiederholungen
+
+try:
+    from config import OPTIMIZATION_WARMUP
+except ImportError:
+    OPTIMIZATION_WARMUP = True
+
+WARMUP_TIMEOUT = 10  # Sekunden für den Verbindungsaufbau beim Vorwärmen
+
+# Vorübergehende Fehler werden mit exponentiellem Backoff wiederholt;
+# DeadlineExceeded nicht, sonst liefe die Optimierung doppelt so lange
+TRANSIENT_ERRORS = (exceptions.ServiceUnavailable, exceptions.InternalServerError,
+                    exceptions.TooManyRequests, exceptions.Aborted)
+
+
+class OptimizationClientPool:
+    """
+    Langlebige RouteOptimizationClients je Prozess:
+    - Kanäle und Authentifizierung werden über alle Anfragen wiederverwendet
+    - Aufrufe mit Deadline und Wiederholung bei vorübergehenden Fehlern
+    - Nach einem fork (z.B. gunicorn) werden die Clients im Kindprozess neu erstellt
+    """
+
+    def __init__(self, size=OPTIMIZATION_CLIENTS, deadline=OPTIMIZATION_DEADLINE, factory=None):
+        self.size = max(1, size)
+        self.deadline = deadline
+        self.factory = factory or routeoptimization_v1.RouteOptimizationClient
+        self.retry = retries.Retry(initial=1.0, maximum=16.0, multiplier=2.0,
+                                   predicate=retries.if_exception_type(*TRANSIENT_ERRORS),
+                                   timeout=deadline)
+        self._clients = []
+        self._pid = None
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def _ensure_clients(self):
+        with self._lock:
+            if self._pid != os.getpid() or not self._clients:
+                self._clients = [self.factory() for _ in range(self.size)]
+                self._pid = os.getpid()
+            return self._clients
+
+    def client(self):
+        """Nächster Client reihum"""
+        clients = self._ensure_clients()
+        return clients[next(self._next) % len(clients)]
+
+    def optimize_tours(self, request, timeout=None):
+        timeout = timeout or self.deadline
+        return self.client().optimize_tours(request, retry=self.retry, timeout=timeout)
+
+    def warm_up(self, timeout=WARMUP_TIMEOUT):
+        """Erstellt die Clients, holt ein Zugriffstoken und baut die Kanäle auf"""
+        try:
+            for client in self._ensure_clients():
+                transport = client.transport
+                credentials = getattr(transport, '_credentials', None)
+                if credentials is not None and hasattr(credentials, 'refresh') and not credentials.valid:
+                    from google.auth.transport.requests import Request
+                    credentials.refresh(Request())
+                channel = getattr(transport, 'grpc_channel', None)
+                if channel is not None:
+                    grpc.channel_ready_future(channel).result(timeout=timeout)
+            log_event('optimization_client_warmup', clients=len(self._clients), status='ready')
+            return True
+        except Exception as e:
+            # Vorwärmen ist optional, der erste Aufruf baut die Verbindung sonst selbst auf
+            log_event('optimization_client_warmup', status='failed', error=str(e))
+            return False
+
+    def warm_up_async(self):
+        thread = threading.Thread(target=self.warm_up, name='optimization-warmup', daemon=True)
+        thread.start()
+        return thread
+
+
+# Gemeinsamer Pool des Prozesses
+optimization_clients = OptimizationClientPool()
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from backend.RouteHandler import get_start_time, get_end_time
+from backend.Solver import service_duration, route_duration_limit
+
+RESULT_CACHE_SIZE = 64
+RESULT_CACHE_TTL_SECONDS = 6 * 3600
+
+
+def model_key(patients, vehicles, weekday, solver_name=''):
+    """
+    Kanonischer Hash des Optimierungsmodells:
+    Orte und Dauern der Besuche, Startorte und Zeitlimits der Fahrzeuge,
+    globales Start-/Endfenster und Solver.
+    """
+    model = {
+        'solver': solver_name,
+        'shipments': [[p.lat, p.lon, service_duration(p.visit_type)] for p in patients],
+        'vehicles': [[v.lat, v.lon, route_duration_limit(v)] for v in vehicles],
+        'global_start_time': get_start_time(weekday),
+        'global_end_time': get_end_time(weekday)
+    }
+    canonical = json.dumps(model, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """LRU-Cache mit Ablaufzeit für Solver-Ergebnisse, adressiert über model_key"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (zeitstempel, ergebnis)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Entfernt einen Eintrag oder (ohne key) den gesamten Cache"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.DistanceMatrix import get_speed_profile, haversine_pairs
+from backend.Solver import service_duration
+
+EVALUATION_CACHE_SIZE = 1024  # Bewertete Routen im Speicher
+
+
+def _stop_location(stop):
+    location = stop.get('location') or {}
+    lat, lng = location.get('lat'), location.get('lng')
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+def route_signature(route):
+    """Identifiziert eine Route über Startpunkt und geordnete Stopps"""
+    start = route.get('vehicle_start') or {}
+    return (
+        (start.get('lat'), start.get('lng')),
+        tuple((stop.get('patient'), _stop_location(stop), stop.get('visit_type')) for stop in route.get('stops', []))
+    )
+
+
+def _road_travel_seconds(route, point_count):
+    """Fahrzeit aus der Streckengeometrie, falls sie genau die Etappen der Route abdeckt"""
+    legs = (route.get('geometry') or {}).get('legs') or []
+    if len(legs) != point_count + 1 or any(leg.get('duration_s') is None for leg in legs):
+        return None
+    return float(sum(leg['duration_s'] for leg in legs))
+
+
+def evaluate_route(route, profile=None):
+    """
+    Fahr- und Verweilzeit einer Route (Start -> Stopps -> Start).
+    Fahrzeit aus den Straßenetappen der Geometrie, sonst aus Luftlinie und Geschwindigkeitsprofil.
+    Stopps ohne Koordinaten zählen nur mit ihrer Verweilzeit; TK-Fälle werden nicht angefahren
+    (wie in Kartenlinie, Streckengeometrie und Einfügevorschlägen).
+    """
+    start = route.get('vehicle_start') or {}
+    stops = route.get('stops', [])
+    service_s = float(sum(service_duration(stop.get('visit_type')) for stop in stops))
+
+    points = [_stop_location(stop) for stop in stops if stop.get('visit_type') != 'TK']
+    points = [p for p in points if p is not None]
+    travel_s, source = 0.0, 'estimate'
+    if start.get('lat') is not None and start.get('lng') is not None and points:
+        road_s = _road_travel_seconds(route, len(points))
+        if road_s is not None:
+            travel_s, source = road_s, 'road'
+        else:
+            depot = (float(start['lat']), float(start['lng']))
+            path = np.array([depot] + points + [depot])
+            legs_km = haversine_pairs(path[:-1, 0], path[:-1, 1], path[1:, 0], path[1:, 1])
+            travel_s = float(get_speed_profile(profile).travel_seconds(legs_km).sum())
+
+    duration_hrs = (travel_s + service_s) / 3600.0
+    max_hours = route.get('max_hours')
+    return {
+        'travel_hrs': round(travel_s / 3600.0, 2),
+        'service_hrs': round(service_s / 3600.0, 2),
+        'duration_hrs': round(duration_hrs, 2),
+        'max_hours': max_hours,
+        'violation': max_hours is not None and duration_hrs > float(max_hours),
+        'travel_source': source
+    }
+
+
+def _evaluation_key(route):
+    geometry = route.get('geometry') or {}
+    return route['vehicle'], route_signature(route), route.get('max_hours'), geometry.get('duration_s')
+
+
+class RouteEvaluator:
+    """
+    Bewertet geänderte Routen nach Drag-and-Drop inkrementell:
+    - Bewertungen werden je Fahrzeug, Signatur, max_hours und Geometrie gecacht
+    - Vergleichsbasis ist immer der übergebene vorherige Plan, nicht der zuletzt bewertete Stand
+    - Unveränderte Routen behalten ihre bisherige Dauer, nur geänderte werden neu bewertet
+    """
+
+    def __init__(self, profile=None, max_entries=EVALUATION_CACHE_SIZE):
+        self.profile = profile
+        self.max_entries = max_entries
+        self._evaluations = OrderedDict()  # (fahrzeug, signatur, max_hours, geometrie) -> bewertung
+        self._lock = threading.Lock()
+
+    def _evaluate_cached(self, route):
+        key = _evaluation_key(route)
+        cached = self._evaluations.get(key)
+        if cached is not None:
+            self._evaluations.move_to_end(key)
+            return cached
+        evaluation = evaluate_route(route, self.profile)
+        self._evaluations[key] = evaluation
+        while len(self._evaluations) > self.max_entries:
+            self._evaluations.popitem(last=False)
+        return evaluation
+
+    def prime(self, routes):
+        """Übernimmt einen Plan in den Cache (z.B. nach einer Optimierung)"""
+        with self._lock:
+            for route in routes:
+                self._evaluate_cached(route)
+
+    def evaluate(self, routes, previous_routes=()):
+        """
+        Bewertet den neuen Stand und vergleicht ihn mit dem vorherigen Plan.
+        Rückgabe: Bewertung je Fahrzeug mit Delta, geänderte Fahrzeuge, Gesamtdelta
+        und Verletzungen von max_hours.
+        """
+        with self._lock:
+            previous = {route['vehicle']: (route, self._evaluate_cached(route)) for route in previous_routes}
+
+            result, violations, changed = {}, [], []
+            total_delta = 0.0
+            for route in routes:
+                before_route, before = previous.get(route['vehicle'], (None, None))
+                unchanged = (before_route is not None
+                             and route_signature(before_route) == route_signature(route)
+                             and before_route.get('max_hours') == route.get('max_hours'))
+                if unchanged:
+                    # Bisherige Dauer beibehalten (z.B. aus der Optimierung)
+                    evaluation = dict(before)
+                    if before_route.get('duration_hrs') is not None:
+                        evaluation['duration_hrs'] = before_route['duration_hrs']
+                        evaluation['violation'] = (evaluation['max_hours'] is not None and
+                                                   evaluation['duration_hrs'] > float(evaluation['max_hours']))
+                    delta = 0.0
+                else:
+                    evaluation = self._evaluate_cached(route)
+                    delta = evaluation['duration_hrs'] - (before['duration_hrs'] if before else 0.0)
+                    changed.append(route['vehicle'])
+                total_delta += delta
+                result[route['vehicle']] = dict(evaluation, delta_hrs=round(delta, 2))
+                if evaluation['violation']:
+                    violations.append({
+                        'vehicle': route['vehicle'],
+                        'duration_hrs': evaluation['duration_hrs'],
+                        'max_hours': evaluation['max_hours'],
+                        'message': (f"{route['vehicle']}: {evaluation['duration_hrs']} h "
+                                    f"überschreitet {evaluation['max_hours']} h")
+                    })
+
+        return {
+            'routes': result,
+            'changed': changed,
+            'total_delta_hrs': round(total_delta, 2),
+            'violations': violations
+        }
@@ -0,0 +1,193 @@
+import csv
+import io
+import os
+import queue
+import re
+import tempfile
+import threading
+
+from openpyxl import Workbook
+
+EXPORT_CHUNK_BYTES = 64 * 1024   # Größe der an den Client gesendeten Blöcke
+EXPORT_QUEUE_CHUNKS = 16         # Gepufferte Blöcke, danach wartet der Excel-Export auf den Client
+SHEET_NAME_LENGTH = 31           # Höchstlänge eines Blattnamens in Excel
+
+STOP_COLUMNS = ['Wochentag', 'Mitarbeiter', 'Funktion', 'Nr.', 'Patient', 'Adresse',
+                'Besuchsart', 'Uhrzeit/Info', 'Breitengrad', 'Längengrad']
+SUMMARY_COLUMNS = ['Wochentag', 'Mitarbeiter', 'Funktion', 'Stopps', 'Dauer (h)', 'Max. Stunden']
+SUMMARY_SHEET = 'Übersicht'
+UNASSIGNED_SHEET = 'TK offen'
+
+
+def _stop_values(stop):
+    location = stop.get('location') or {}
+    return [stop.get('patient'), stop.get('address'), stop.get('visit_type'), stop.get('time_info'),
+            location.get('lat'), location.get('lng')]
+
+
+def iter_stop_rows(plans):
+    """
+    Eine Zeile je Stopp (STOP_COLUMNS) für [(wochentag, plan)];
+    nicht zugeordnete TK-Fälle ohne Mitarbeiter und Reihenfolge
+    """
+    for weekday, plan in plans:
+        for route in plan.get('routes', []):
+            for number, stop in enumerate(route.get('stops', []), start=1):
+                yield [weekday, route.get('vehicle'), route.get('funktion'), number] + _stop_values(stop)
+        for stop in plan.get('tk_patients', []):
+            yield [weekday, None, None, None] + _stop_values(stop)
+
+
+def stream_csv(plans, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """CSV (Semikolon, UTF-8 mit BOM für Excel) blockweise als Bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(STOP_COLUMNS)
+    for row in iter_stop_rows(plans):
+        writer.writerow(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def sheet_title(name, used):
+    """Gültiger, eindeutiger Blattname (ohne []:*?/\\, höchstens 31 Zeichen)"""
+    base = re.sub(r'[\[\]:*?/\\]', ' ', str(name or 'Ohne Name')).strip()[:SHEET_NAME_LENGTH] or 'Ohne Name'
+    title, counter = base, 2
+    while title.lower() in used:
+        suffix = f" ({counter})"
+        title = base[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+        counter += 1
+    used.add(title.lower())
+    return title
+
+
+def write_workbook(plans, target):
+    """
+    Arbeitsmappe im Write-Only-Modus: Übersicht, ein Blatt je Mitarbeiter (alle Wochentage)
+    und die nicht zugeordneten TK-Fälle. Zeilen werden direkt in Zwischendateien geschrieben,
+    save() packt sie ins Archiv und löscht sie.
+    """
+    workbook = Workbook(write_only=True)
+    try:
+        used = set()
+        summary = workbook.create_sheet(sheet_title(SUMMARY_SHEET, used))
+        summary.append(SUMMARY_COLUMNS)
+        staff_sheets = {}
+        unassigned = []
+
+        for weekday, plan in plans:
+            for route in plan.get('routes', []):
+                stops = route.get('stops', [])
+                summary.append([weekday, route.get('vehicle'), route.get('funktion'), len(stops),
+                                route.get('duration_hrs'), route.get('max_hours')])
+                sheet = staff_sheets.get(route.get('vehicle'))
+                if sheet is None:
+                    sheet = workbook.create_sheet(sheet_title(route.get('vehicle'), used))
+                    sheet.append(['Wochentag', 'Nr.'] + STOP_COLUMNS[4:])
+                    staff_sheets[route.get('vehicle')] = sheet
+                for number, stop in enumerate(stops, start=1):
+                    sheet.append([weekday, number] + _stop_values(stop))
+            unassigned += [(weekday, stop) for stop in plan.get('tk_patients', [])]
+
+        tk_sheet = workbook.create_sheet(sheet_title(UNASSIGNED_SHEET, used))
+        tk_sheet.append(['Wochentag'] + STOP_COLUMNS[4:])
+        for weekday, stop in unassigned:
+            tk_sheet.append([weekday] + _stop_values(stop))
+        workbook.save(target)
+    except Exception:
+        # Zwischendateien fehlgeschlagener Exporte sofort löschen, nicht erst bei Prozessende:
+        # Speichern in ein eigenes temporäres Verzeichnis räumt sie über save() ab
+        with tempfile.TemporaryDirectory(prefix='route-export-') as directory:
+            try:
+                workbook.save(os.path.join(directory, 'abgebrochen.xlsx'))
+            except Exception:
+                pass
+        raise
+
+
+class _ChunkWriter:
+    """
+    Nur-Schreib-Datei, die Blöcke in eine begrenzte Queue legt (ohne seek/tell).
+    Nach einem Abbruch durch den Client wird weiter geschrieben, aber nichts mehr gesendet,
+    damit save() regulär endet und seine Zwischendateien löscht.
+    """
+
+    def __init__(self, chunks, chunk_bytes, cancelled):
+        self.chunks = chunks
+        self.chunk_bytes = chunk_bytes
+        self.cancelled = cancelled
+        self.aborted = False
+        self.buffer = bytearray()
+
+    def put(self, item):
+        # Wartet auf den Client, verwirft aber alles, sobald dieser die Verbindung schließt
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        self.aborted = True
+
+    def write(self, data):
+        # Nach dem Abbruch nichts mehr puffern oder senden
+        if self.aborted:
+            return len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer and not self.aborted:
+            self.put(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+
+
+def stream_xlsx(plans, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """
+    Excel-Datei blockweise als Bytes: die Arbeitsmappe wird in einem Hintergrund-Thread
+    direkt in den Antwortstrom gezippt, die begrenzte Queue hält den Speicherbedarf konstant.
+    Anders als bei CSV kommt der erste Block erst, wenn alle Zeilen geschrieben sind: openpyxl
+    zippt die Blätter erst in save() (bei 15.000 Zeilen etwa 2,3 s Wartezeit).
+    """
+    chunks = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    writer = _ChunkWriter(chunks, chunk_bytes, cancelled)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            write_workbook(plans, writer)
+            writer.flush()
+        except Exception as e:
+            errors.append(e)
+        writer.put(done)
+
+    threading.Thread(target=produce, name='route-export', daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        cancelled.set()
+    if errors:
+        raise errors[0]
+
+
+# Verfügbare Exportformate: format -> (erzeuger, mimetype, dateiendung)
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8', 'csv'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
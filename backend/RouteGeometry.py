@@ -0,0 +1,275 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from googlemaps.convert import decode_polyline, encode_polyline
+
+import backend.FileHandler as file_handler
+from backend.DistanceMatrix import get_speed_profile, haversine_pairs
+from backend.Metrics import log_event
+
+try:
+    from config import GEOMETRY_PROVIDER
+except ImportError:
+    GEOMETRY_PROVIDER = 'google'  # 'straight' zeichnet Luftlinien ohne API-Aufrufe
+
+# Konfiguration für den Polyline-Cache
+POLYLINE_CACHE_PATH = os.path.join('uploads', 'polyline_cache.sqlite')
+POLYLINE_TTL_SECONDS = 30 * 24 * 3600
+POLYLINE_MAX_ENTRIES = 200000
+LEG_PRECISION = 5  # Nachkommastellen der Koordinaten im Schlüssel (~1 m)
+
+
+def leg_key(provider, origin, destination):
+    return (f"{provider}:{origin[0]:.{LEG_PRECISION}f},{origin[1]:.{LEG_PRECISION}f};"
+            f"{destination[0]:.{LEG_PRECISION}f},{destination[1]:.{LEG_PRECISION}f}")
+
+
+def route_points(route):
+    """Start -> Stopps mit Koordinaten (ohne TK) -> Start als Liste von (lat, lng)"""
+    start = route.get('vehicle_start') or {}
+    if start.get('lat') is None or start.get('lng') is None:
+        return []
+    stops = [stop.get('location') or {} for stop in route.get('stops', []) if stop.get('visit_type') != 'TK']
+    stops = [(float(s['lat']), float(s['lng'])) for s in stops if s.get('lat') is not None and s.get('lng') is not None]
+    if not stops:
+        return []
+    depot = (float(start['lat']), float(start['lng']))
+    return [depot] + stops + [depot]
+
+
+class PolylineCache:
+    """Persistenter SQLite-Cache für Etappen (Polyline, Dauer, Distanz)"""
+
+    def __init__(self, path=POLYLINE_CACHE_PATH, ttl=POLYLINE_TTL_SECONDS, max_entries=POLYLINE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS legs (
+                    key TEXT PRIMARY KEY,
+                    polyline TEXT NOT NULL,
+                    duration REAL,
+                    distance REAL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_legs_last_used ON legs(last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys):
+        """{schlüssel: (polyline, dauer_s, distanz_m)} für alle gültigen Treffer"""
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, polyline, duration, distance FROM legs "
+                "WHERE key IN (SELECT value FROM json_each(?)) AND created >= ?",
+                (json.dumps(keys), now - self.ttl)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "UPDATE legs SET last_used = ? WHERE key IN (SELECT value FROM json_each(?))",
+                    (now, json.dumps([row[0] for row in rows]))
+                )
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return {key: (polyline, duration, distance) for key, polyline, duration, distance in rows}
+
+    def put_many(self, legs):
+        """Speichert {schlüssel: (polyline, dauer_s, distanz_m)}"""
+        if not legs:
+            return
+        now = time.time()
+        rows = [(key, polyline, duration, distance, now, now)
+                for key, (polyline, duration, distance) in legs.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO legs (key, polyline, duration, distance, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("DELETE FROM legs WHERE created < ?", (now - self.ttl,))
+            count = conn.execute("SELECT COUNT(*) FROM legs").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM legs WHERE key IN (SELECT key FROM legs ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM legs")
+
+
+class GeometryProvider:
+    """Schnittstelle für Anbieter von Streckengeometrie"""
+
+    name = None
+
+    def legs(self, points):
+        """Etappen entlang points: Liste von (polyline, dauer_s, distanz_m), eine je Punktpaar"""
+        raise NotImplementedError
+
+
+class StraightLineProvider(GeometryProvider):
+    """Luftlinie zwischen den Stopps, Dauer aus dem Geschwindigkeitsprofil"""
+
+    name = 'straight'
+
+    def __init__(self, speed_profile=None):
+        self.speed_profile = get_speed_profile(speed_profile)
+
+    def legs(self, points):
+        lat = [p[0] for p in points]
+        lon = [p[1] for p in points]
+        km = haversine_pairs(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        seconds = self.speed_profile.travel_seconds(km)
+        return [(encode_polyline([a, b]), float(s), float(d * 1000 * self.speed_profile.detour_factor))
+                for a, b, s, d in zip(points[:-1], points[1:], seconds, km)]
+
+
+class GoogleDirectionsProvider(GeometryProvider):
+    """Straßengeometrie über die Directions API, bis zu 25 Zwischenziele je Anfrage"""
+
+    name = 'google'
+    max_waypoints = 25
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def legs(self, points):
+        client = self.client or file_handler.gmaps
+        legs = []
+        step = self.max_waypoints + 1
+        for start in range(0, len(points) - 1, step):
+            chunk = points[start:start + step + 1]
+            response = client.directions(chunk[0], chunk[-1], waypoints=chunk[1:-1] or None, mode='driving')
+            if not response:
+                raise ValueError('Keine Route gefunden')
+            for leg in response[0]['legs']:
+                path = [point for s in leg['steps'] for point in decode_polyline(s['polyline']['points'])]
+                legs.append((encode_polyline(path), leg['duration']['value'], leg['distance']['value']))
+        return legs
+
+
+# Verfügbare Geometrie-Anbieter, erweiterbar über register_geometry_provider
+GEOMETRY_PROVIDERS = {}
+
+
+def register_geometry_provider(provider_class):
+    GEOMETRY_PROVIDERS[provider_class.name] = provider_class
+    return provider_class
+
+
+register_geometry_provider(StraightLineProvider)
+register_geometry_provider(GoogleDirectionsProvider)
+
+
+class RouteGeometry:
+    """
+    Liefert die Streckengeometrie der Routen als kodierte Polylines je Etappe.
+    - Etappen werden je Start/Ziel-Koordinate gecacht, nach Drag-and-Drop werden nur
+      neue Etappen berechnet (zusammenhängende Lücken mit einer Anfrage)
+    - Polylines aus der Optimierung können über seed() übernommen werden, gecacht unter
+      dem Anbieter, der sie berechnet hat
+    - Fällt der Anbieter aus, wird die Luftlinie gezeichnet (nicht gecacht)
+    - attach(..., compute=False) fragt den Anbieter nicht an: fehlende Etappen werden als
+      Luftlinie gezeichnet und die Geometrie als 'pending' markiert
+    """
+
+    def __init__(self, provider=GEOMETRY_PROVIDER, cache=None):
+        self.provider = GEOMETRY_PROVIDERS[provider]() if isinstance(provider, str) else provider
+        self.cache = cache
+        self.fallback = StraightLineProvider()
+
+    def _cache(self):
+        if self.cache is None:
+            self.cache = PolylineCache()
+        return self.cache
+
+    def seed(self, points, legs, provider='google'):
+        """Übernimmt Etappen (polyline, dauer_s, distanz_m) des Anbieters provider entlang points in den Cache"""
+        if len(points) - 1 != len(legs):
+            return
+        self._cache().put_many({leg_key(provider, a, b): leg
+                                for a, b, leg in zip(points[:-1], points[1:], legs)})
+
+    def attach(self, routes, compute=True):
+        """
+        Ergänzt jede Route um 'geometry' (Etappen, Gesamtdauer und -distanz).
+        compute=False: nur Cache, fehlende Etappen als Luftlinie ('pending': True)
+        """
+        paths = [route_points(route) for route in routes]
+        keys = [[leg_key(self.provider.name, a, b) for a, b in zip(path[:-1], path[1:])] for path in paths]
+        cached = self._cache().get_many([key for route_keys in keys for key in route_keys])
+
+        computed = {}
+        for path, route_keys in zip(paths, keys) if compute else ():
+            # Zusammenhängende fehlende Etappen gemeinsam anfragen
+            i = 0
+            while i < len(route_keys):
+                if route_keys[i] in cached or route_keys[i] in computed:
+                    i += 1
+                    continue
+                j = i
+                while j < len(route_keys) and route_keys[j] not in cached and route_keys[j] not in computed:
+                    j += 1
+                computed.update(zip(route_keys[i:j], self._compute(path[i:j + 1])))
+                i = j
+
+        fresh = {key: leg for key, leg in computed.items() if leg[3]}
+        self._cache().put_many({key: leg[:3] for key, leg in fresh.items()})
+
+        for route, path, route_keys in zip(routes, paths, keys):
+            pending = not compute and any(key not in cached for key in route_keys)
+            straight = self.fallback.legs(path) if pending else None
+            legs = [cached[key] if key in cached else computed[key][:3] if key in computed else straight[i]
+                    for i, key in enumerate(route_keys)]
+            route['geometry'] = {
+                'provider': self.provider.name,
+                'legs': [{'polyline': p, 'duration_s': d, 'distance_m': m} for p, d, m in legs],
+                'duration_s': round(sum(d or 0 for _, d, _ in legs), 1),
+                'distance_m': round(sum(m or 0 for _, _, m in legs), 1),
+                'pending': pending
+            }
+        return routes
+
+    def _compute(self, points):
+        """Etappen vom Anbieter; 4. Element gibt an, ob sie gecacht werden dürfen"""
+        try:
+            legs = self.provider.legs(points)
+            if len(legs) != len(points) - 1:
+                raise ValueError(f"{len(legs)} statt {len(points) - 1} Etappen erhalten")
+            return [tuple(leg) + (True,) for leg in legs]
+        except Exception as e:
+            log_event('route_geometry_error', provider=self.provider.name, legs=len(points) - 1, error=str(e))
+            return [leg + (False,) for leg in self.fallback.legs(points)]
+
+
+# Gemeinsame Instanz für die Anwendung
+route_geometry = RouteGeometry()
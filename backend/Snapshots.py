@@ -0,0 +1,84 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    from config import SNAPSHOT_GZIP
+except ImportError:
+    SNAPSHOT_GZIP = True
+
+SNAPSHOT_HISTORY = 8       # Ältere Stände für Delta-Antworten
+GZIP_MIN_BYTES = 1024      # Kleinere Antworten werden nicht komprimiert
+GZIP_LEVEL = 6
+
+
+def _serialize(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class Snapshot:
+    """
+    Vorserialisierte JSON-Antwort eines Lesendpunkts.
+    - Wird nur neu erzeugt, wenn sich die Version der zugrunde liegenden Daten ändert
+    - Optional gzip-komprimiert vorgehalten
+    - Delta zwischen zwei Versionen aus den letzten Ständen; keys legt je Abschnitt das
+      Feld fest, über das Einträge zugeordnet werden (None = Abschnitt wird komplett ersetzt)
+    """
+
+    def __init__(self, build, keys, history=SNAPSHOT_HISTORY, compress=SNAPSHOT_GZIP):
+        self.build = build
+        self.keys = keys
+        self.compress = compress
+        self.version = None
+        self.body = None
+        self.gzipped = None
+        self._history = OrderedDict()  # version -> payload
+        self._max_history = history
+        self._lock = threading.Lock()
+
+    def current(self, version):
+        """(body, gzipped) zur Version; gzipped ist None ohne Komprimierung"""
+        with self._lock:
+            if version != self.version:
+                payload = self.build()
+                body = _serialize(dict(payload, version=version))
+                self.gzipped = (gzip.compress(body, GZIP_LEVEL)
+                                if self.compress and len(body) >= GZIP_MIN_BYTES else None)
+                self.body = body
+                self.version = version
+                self._history[version] = payload
+                self._history.move_to_end(version)
+                while len(self._history) > self._max_history:
+                    self._history.popitem(last=False)
+            return self.body, self.gzipped
+
+    def delta(self, since, version):
+        """Änderungen seit einer früheren Version oder None, wenn diese nicht mehr vorliegt"""
+        self.current(version)
+        with self._lock:
+            old = self._history.get(since)
+            new = self._history.get(version)
+        if old is None or new is None:
+            return None
+
+        changes = {}
+        for section, key in self.keys.items():
+            before, after = old.get(section), new.get(section)
+            if before == after:
+                continue
+            change = _diff(before or [], after or [], key) if key else None
+            changes[section] = change if change is not None else {'replace': after}
+        return {'version': version, 'since': since, 'delta': True, 'changes': changes}
+
+
+def _diff(before, after, key):
+    """upsert/remove je Eintrag; None, wenn der Schlüssel nicht eindeutig ist"""
+    old = {item.get(key): item for item in before}
+    new = {item.get(key): item for item in after}
+    if len(old) != len(before) or len(new) != len(after):
+        return None
+    return {
+        'upsert': [item for k, item in new.items() if old.get(k) != item],
+        'remove': [k for k in old if k not in new]
+    }
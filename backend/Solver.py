@@ -0,0 +1,386 @@
+import time
+from datetime import datetime
+
+from google.maps import routeoptimization_v1
+
+from backend.RouteHandler import get_start_time, get_end_time
+from backend.DistanceMatrix import matrix_cache, get_speed_profile, haversine_pairs
+from backend.Metrics import timed_stage, log_event
+from backend.OptimizationClient import optimization_clients
+
+try:
+    from config import SOLVER_BACKEND
+except ImportError:
+    SOLVER_BACKEND = 'google'
+
+GOOGLE_PARENT = "projects/routenplanung-sapv"
+
+# Verweilzeiten je Besuchsart in Sekunden
+SERVICE_DURATIONS = {
+    'HB': 2100,            # 35 min
+    'Neuaufnahme': 7200    # 120 min
+}
+
+# 100 % Stellenumfang = 7 Stunden Routenzeit
+FULL_TIME_HOURS = 7
+
+LOCAL_SOLVER_TIME_LIMIT = 5  # Sekunden für die Verbesserungsphase
+
+# Startlösungen für die API nur bis zu diesem Anteil des Zeitlimits, da die Luftlinien-Schätzung
+# von den Straßenfahrzeiten abweicht und unzulässige Startlösungen abgelehnt werden können
+WARM_START_SLACK = 0.9
+
+
+def service_duration(visit_type):
+    return SERVICE_DURATIONS.get(visit_type, 0)
+
+
+def route_duration_limit(vehicle):
+    """Maximale Routenzeit in Sekunden (7 Stunden * Stellenumfang%)"""
+    stellenumfang = getattr(vehicle, 'stellenumfang', 100)
+    return int((stellenumfang / 100.0) * FULL_TIME_HOURS * 3600)
+
+
+def max_hours(vehicle):
+    return round((getattr(vehicle, 'stellenumfang', 100) / 100.0) * FULL_TIME_HOURS, 2)
+
+
+def estimated_duration(vehicle, patients, profile=None):
+    """Geschätzte Routenzeit in Sekunden: Luftlinie mit Geschwindigkeitsprofil plus Verweilzeiten"""
+    if not patients:
+        return 0.0
+    lat = [vehicle.lat] + [p.lat for p in patients] + [vehicle.lat]
+    lon = [vehicle.lon] + [p.lon for p in patients] + [vehicle.lon]
+    km = haversine_pairs(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    travel = float(get_speed_profile(profile).travel_seconds(km).sum())
+    return travel + sum(service_duration(p.visit_type) for p in patients)
+
+
+def trim_seed(sequence, patients, vehicle, limit):
+    """Startroute ohne Patienten ohne Koordinaten, hinten gekürzt bis die Schätzung limit einhält"""
+    route = [i for i in sequence if patients[i].lat is not None and patients[i].lon is not None]
+    while route and estimated_duration(vehicle, [patients[i] for i in route]) > limit:
+        route.pop()
+    return route
+
+
+def located_indices(entities):
+    """Indizes der Entitäten mit Koordinaten; die übrigen werden nicht eingeplant"""
+    return [i for i, e in enumerate(entities) if e.lat is not None and e.lon is not None]
+
+
+def planning_horizon(weekday):
+    """Länge des Planungsfensters (08:00–16:00) in Sekunden"""
+    start = datetime.strptime(get_start_time(weekday), "%Y-%m-%dT%H:%M:%SZ")
+    end = datetime.strptime(get_end_time(weekday), "%Y-%m-%dT%H:%M:%SZ")
+    return int((end - start).total_seconds())
+
+
+class SolvedRoute:
+    """Ergebnis eines Solvers für ein Fahrzeug"""
+
+    def __init__(self, vehicle_index, shipment_indices, duration_seconds, legs=None):
+        self.vehicle_index = vehicle_index
+        self.shipment_indices = shipment_indices  # Indizes in die Patientenliste
+        self.duration_seconds = duration_seconds
+        # Optional vom Solver gelieferte Etappen (polyline, dauer_s, distanz_m), Start -> Stopps -> Ende
+        self.legs = legs
+
+    @property
+    def duration_hrs(self):
+        return self.duration_seconds / 3600.0
+
+
+class SolverBackend:
+    """Schnittstelle für Routenoptimierer"""
+
+    name = None
+
+    def solve(self, patients, vehicles, weekday, should_stop=None, initial_routes=None):
+        """
+        Gibt eine Liste von SolvedRoute zurück (eine pro Fahrzeug).
+        should_stop: optionale Funktion, die einen vorzeitigen Abbruch anfordert
+        initial_routes: optionale Startlösung {fahrzeugindex: [patientenindizes]}
+        """
+        raise NotImplementedError
+
+
+class GoogleSolver(SolverBackend):
+    """Optimierung über die Google Route Optimization API"""
+
+    name = 'google'
+
+    def __init__(self, client=None):
+        # Optional vorgegebener Client (z.B. für Benchmarks), sonst der gemeinsame Client-Pool
+        self.client = client or optimization_clients
+
+    def build_request(self, patients, vehicles, weekday, initial_routes=None):
+        """
+        Füllt das OptimizeToursRequest-Proto direkt aus den Entitäten
+        (ohne Umweg über verschachtelte Dicts und Dauer-Strings).
+        Patienten und Fahrzeuge ohne Koordinaten fehlen im Modell (wie im LocalSolver),
+        Indizes im Modell entsprechen den Positionen in located_indices()
+        """
+        patient_idx, vehicle_idx = located_indices(patients), located_indices(vehicles)
+        shipment_of = {i: s for s, i in enumerate(patient_idx)}
+        model_vehicle_of = {k: m for m, k in enumerate(vehicle_idx)}
+        request = routeoptimization_v1.OptimizeToursRequest.pb()()
+        request.parent = GOOGLE_PARENT
+        # Polylines je Etappe gleich mitliefern lassen (Grundlage für die Kartendarstellung)
+        request.populate_transition_polylines = True
+        model = request.model
+        model.global_start_time.FromJsonString(get_start_time(weekday))
+        model.global_end_time.FromJsonString(get_end_time(weekday))
+
+        # Shipments für Nicht-TK erstellen
+        for patient in (patients[i] for i in patient_idx):
+            pickup = model.shipments.add().pickups.add()
+            pickup.arrival_location.latitude = patient.lat
+            pickup.arrival_location.longitude = patient.lon
+            pickup.duration.seconds = service_duration(patient.visit_type)
+
+        # Fahrzeuge: Berücksichtige Stellenumfang
+        for v in (vehicles[k] for k in vehicle_idx):
+            vehicle = model.vehicles.add()
+            vehicle.start_location.latitude = v.lat
+            vehicle.start_location.longitude = v.lon
+            vehicle.end_location.latitude = v.lat
+            vehicle.end_location.longitude = v.lon
+            vehicle.cost_per_hour = 1
+            vehicle.route_duration_limit.max_duration.seconds = route_duration_limit(v)
+
+        # Letzter Plan als Startlösung; manuell überplante Routen werden auf das Zeitlimit gekürzt,
+        # die entfernten Patienten plant die API selbst ein
+        horizon = planning_horizon(weekday) if initial_routes else 0
+        for vehicle_index, shipment_indices in (initial_routes or {}).items():
+            if vehicle_index not in model_vehicle_of:
+                continue
+            v = vehicles[vehicle_index]
+            limit = min(route_duration_limit(v), horizon) * WARM_START_SLACK
+            shipment_indices = trim_seed(shipment_indices, patients, v, limit)
+            if not shipment_indices:
+                continue
+            route = request.injected_first_solution_routes.add()
+            route.vehicle_index = model_vehicle_of[vehicle_index]
+            for shipment_index in shipment_indices:
+                visit = route.visits.add()
+                visit.shipment_index = shipment_of[shipment_index]
+                visit.is_pickup = True
+
+        return routeoptimization_v1.OptimizeToursRequest.wrap(request)
+
+    def solve(self, patients, vehicles, weekday, should_stop=None, initial_routes=None):
+        patient_idx, vehicle_idx = located_indices(patients), located_indices(vehicles)
+        if len(patient_idx) < len(patients) or len(vehicle_idx) < len(vehicles):
+            log_event('solver_missing_coordinates', solver=self.name,
+                      patients=len(patients) - len(patient_idx), vehicles=len(vehicles) - len(vehicle_idx))
+        located = set(vehicle_idx)
+        routes = [SolvedRoute(k, [], 0) for k in range(len(vehicles)) if k not in located]
+        if not vehicle_idx:
+            return routes
+
+        with timed_stage('model_build', solver=self.name, shipments=len(patient_idx), vehicles=len(vehicle_idx)):
+            fleet_routing_request = self.build_request(patients, vehicles, weekday, initial_routes)
+        with timed_stage('optimize_call', solver=self.name):
+            response = self.client.optimize_tours(fleet_routing_request)
+
+        # Indizes des Modells zurück auf die Positionen in patients und vehicles abbilden
+        for route in response.routes:
+            start_dt = route.vehicle_start_time
+            end_dt = route.vehicle_end_time
+            duration = (end_dt - start_dt).total_seconds() if start_dt and end_dt else 0
+            indices = [patient_idx[visit.shipment_index] for visit in route.visits if visit.shipment_index >= 0]
+            routes.append(SolvedRoute(vehicle_idx[route.vehicle_index], indices, duration, self._legs(route)))
+        return sorted(routes, key=lambda route: route.vehicle_index)
+
+    @staticmethod
+    def _legs(route):
+        transitions = route.transitions
+        if not route.visits or len(transitions) != len(route.visits) + 1:
+            return None
+        if not all(t.route_polyline.points for t in transitions):
+            return None
+        return [(t.route_polyline.points, t.travel_duration.total_seconds(), t.travel_distance_meters)
+                for t in transitions]
+
+
+class LocalSolver(SolverBackend):
+    """
+    Offline-Solver ohne Netzwerkzugriff:
+    - Konstruktion per Cheapest Insertion
+    - Verbesserung mit Relocate, 2-opt und Or-opt
+    - Fahrzeiten aus der Entfernungsmatrix und dem Geschwindigkeitsprofil
+    """
+
+    name = 'local'
+
+    def __init__(self, time_limit=LOCAL_SOLVER_TIME_LIMIT, speed_profile=None):
+        self.time_limit = time_limit
+        self.speed_profile = speed_profile
+
+    def travel_times(self, points):
+        """Fahrzeitmatrix in Sekunden für eine Liste von (lat, lon)"""
+        return matrix_cache.get(points).submatrix(points, self.speed_profile).tolist()
+
+    def solve(self, patients, vehicles, weekday, should_stop=None, initial_routes=None):
+        n = len(patients)
+        # Knoten 0..n-1 = Patienten, n.. = Fahrzeug-Startpunkte
+        with timed_stage('model_build', solver=self.name, shipments=n, vehicles=len(vehicles)):
+            points = [(p.lat, p.lon) for p in patients] + [(v.lat, v.lon) for v in vehicles]
+            known = [lat is not None and lon is not None for lat, lon in points]
+            matrix = self.travel_times([pt if ok else (0.0, 0.0) for pt, ok in zip(points, known)])
+            service = [service_duration(p.visit_type) for p in patients]
+
+            horizon = planning_horizon(weekday)
+            limits = [min(route_duration_limit(v), horizon) if known[n + k] else -1
+                      for k, v in enumerate(vehicles)]
+
+        self._matrix, self._service, self._n = matrix, service, n
+        self._should_stop = should_stop or (lambda: False)
+        routes = self._seed(initial_routes, known, limits, len(vehicles))
+        seeded = {i for route in routes for i in route}
+        unassigned = [i for i in range(n) if known[i] and i not in seeded]
+        with timed_stage('optimize_call', solver=self.name, seeded_stops=len(seeded)):
+            self._construct(routes, unassigned, limits)
+            self._improve(routes, limits, time.monotonic() + self.time_limit)
+
+        return [SolvedRoute(k, route, self._duration(k, route) if route else 0)
+                for k, route in enumerate(routes)]
+
+    def _seed(self, initial_routes, known, limits, vehicle_count):
+        """Startlösung übernehmen; Stopps ohne Koordinaten oder über dem Zeitlimit werden neu eingeplant"""
+        routes = [[] for _ in range(vehicle_count)]
+        for k, sequence in (initial_routes or {}).items():
+            if limits[k] < 0:
+                continue
+            route = [i for i in sequence if known[i]]
+            while route and self._duration(k, route) > limits[k]:
+                route.pop()
+            routes[k] = route
+        return routes
+
+    def _travel(self, k, route):
+        depot = self._n + k
+        m = self._matrix
+        total, prev = 0.0, depot
+        for node in route:
+            total += m[prev][node]
+            prev = node
+        return total + m[prev][depot]
+
+    def _duration(self, k, route):
+        return self._travel(k, route) + sum(self._service[i] for i in route)
+
+    def _best_insertion(self, k, route, node, limit):
+        """Günstigste zulässige Einfügeposition; (Mehrkosten, Position) oder None"""
+        m = self._matrix
+        depot = self._n + k
+        duration = self._duration(k, route) if route else 0.0
+        best = None
+        seq = [depot] + route + [depot]
+        for pos in range(len(seq) - 1):
+            a, b = seq[pos], seq[pos + 1]
+            delta = m[a][node] + m[node][b] - m[a][b]
+            if duration + delta + self._service[node] > limit:
+                continue
+            if best is None or delta < best[0]:
+                best = (delta, pos)
+        return best
+
+    def _construct(self, routes, unassigned, limits):
+        # Beste Einfügung je Patient und Fahrzeug, nach jeder Einfügung nur für die
+        # geänderte Route neu berechnet
+        options = {node: {k: self._best_insertion(k, routes[k], node, limits[k])
+                          for k in range(len(routes)) if limits[k] >= 0}
+                   for node in unassigned}
+        while options and not self._should_stop():
+            best = None
+            for node, per_route in options.items():
+                for k, option in per_route.items():
+                    if option is not None and (best is None or option[0] < best[0]):
+                        best = (option[0], node, k, option[1])
+            if best is None:
+                break  # Restliche Patienten passen in keine Route
+            _, node, k, pos = best
+            routes[k].insert(pos, node)
+            del options[node]
+            for other, per_route in options.items():
+                per_route[k] = self._best_insertion(k, routes[k], other, limits[k])
+
+    def _improve(self, routes, limits, deadline):
+        improved = True
+        while improved and time.monotonic() < deadline and not self._should_stop():
+            improved = False
+            for k in range(len(routes)):
+                improved |= self._two_opt(k, routes[k])
+                improved |= self._or_opt(k, routes[k])
+            improved |= self._relocate(routes, limits)
+
+    def _two_opt(self, k, route):
+        improved = False
+        best = self._travel(k, route)
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                cost = self._travel(k, candidate)
+                if cost < best - 1e-6:
+                    route[:] = candidate
+                    best = cost
+                    improved = True
+        return improved
+
+    def _or_opt(self, k, route):
+        improved = False
+        best = self._travel(k, route)
+        for length in (1, 2, 3):
+            for i in range(len(route) - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for pos in range(len(rest) + 1):
+                    candidate = rest[:pos] + segment + rest[pos:]
+                    cost = self._travel(k, candidate)
+                    if cost < best - 1e-6:
+                        route[:] = candidate
+                        best = cost
+                        improved = True
+                        break
+        return improved
+
+    def _relocate(self, routes, limits):
+        """Verschiebt einzelne Patienten in eine andere Route, wenn die Gesamtfahrzeit sinkt"""
+        improved = False
+        for source in range(len(routes)):
+            i = 0
+            while i < len(routes[source]):
+                node = routes[source][i]
+                remaining = routes[source][:i] + routes[source][i + 1:]
+                saving = self._travel(source, routes[source]) - self._travel(source, remaining)
+                best = None
+                for target in range(len(routes)):
+                    if target == source or limits[target] < 0:
+                        continue
+                    option = self._best_insertion(target, routes[target], node, limits[target])
+                    if option is not None and option[0] < saving - 1e-6 and (best is None or option[0] < best[0]):
+                        best = (option[0], target, option[1])
+                if best is None:
+                    i += 1
+                    continue
+                _, target, pos = best
+                routes[source] = remaining
+                routes[target].insert(pos, node)
+                improved = True
+        return improved
+
+
+SOLVER_BACKENDS = {
+    GoogleSolver.name: GoogleSolver,
+    LocalSolver.name: LocalSolver
+}
+
+
+def get_solver(name=None):
+    """Liefert den per Konfiguration gewählten Solver ('google' oder 'local')"""
+    name = name or SOLVER_BACKEND
+    if name not in SOLVER_BACKENDS:
+        raise ValueError(f"Unbekannter Solver: {name}")
+    return SOLVER_BACKENDS[name]()
@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+try:
+    from config import STATE_BACKEND
+except ImportError:
+    STATE_BACKEND = 'sqlite'
+
+try:
+    from config import STATE_DB_PATH
+except ImportError:
+    STATE_DB_PATH = os.path.join('uploads', 'state.sqlite')
+
+DEFAULT_TEAM = 'default'
+
+
+class VersionConflictError(RuntimeError):
+    """Der gespeicherte Zustand wurde zwischenzeitlich von einem anderen Prozess geändert"""
+
+
+class StateStore:
+    """
+    Schnittstelle für den gemeinsamen Anwendungszustand.
+    Werte sind JSON-serialisierbar und je Team und Schlüssel versioniert.
+    """
+
+    def versions(self, team):
+        """{schlüssel: version} aller gespeicherten Werte eines Teams"""
+        raise NotImplementedError
+
+    def load(self, team, key):
+        """(version, wert) oder (0, None), wenn nichts gespeichert ist"""
+        raise NotImplementedError
+
+    def save(self, team, key, value, expected_version=None):
+        """
+        Speichert einen Wert und gibt die neue Version zurück.
+        Mit expected_version wird nur geschrieben, wenn die gespeicherte Version übereinstimmt.
+        """
+        return self.save_many(team, {key: value},
+                              None if expected_version is None else {key: expected_version})[key]
+
+    def save_many(self, team, values, expected_versions=None):
+        """
+        Speichert mehrere Werte in einer Transaktion und gibt {schlüssel: neue version} zurück.
+        Weicht eine der erwarteten Versionen ab, wird nichts geschrieben (VersionConflictError).
+        """
+        raise NotImplementedError
+
+    def delete(self, team, key):
+        raise NotImplementedError
+
+
+class SQLiteStateStore(StateStore):
+    """Lokaler Standard: SQLite im WAL-Modus, sicher für mehrere Worker-Prozesse"""
+
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    team TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (team, key)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def versions(self, team):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, version FROM state WHERE team = ?", (team,)).fetchall()
+        return dict(rows)
+
+    def load(self, team, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version, value FROM state WHERE team = ? AND key = ?", (team, key)
+            ).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def save_many(self, team, values, expected_versions=None):
+        payloads = {key: json.dumps(value) for key, value in values.items()}
+        expected_versions = expected_versions or {}
+        versions = {}
+        with self._connect() as conn:
+            # Schreibsperre vor dem Lesen, damit parallele Prozesse sich nicht überholen
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                for key, payload in payloads.items():
+                    row = conn.execute(
+                        "SELECT version FROM state WHERE team = ? AND key = ?", (team, key)
+                    ).fetchone()
+                    current = row[0] if row else 0
+                    expected = expected_versions.get(key)
+                    if expected is not None and expected != current:
+                        raise VersionConflictError(
+                            f"Zustand '{key}' wurde geändert (Version {current}, erwartet {expected})"
+                        )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO state (team, key, version, value, updated) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (team, key, current + 1, payload, now)
+                    )
+                    versions[key] = current + 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return versions
+
+    def delete(self, team, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE team = ? AND key = ?", (team, key))
+
+
+STATE_BACKENDS = {
+    'sqlite': SQLiteStateStore
+}
+
+
+def get_state_store(name=None):
+    """Liefert den per Konfiguration gewählten Zustandsspeicher"""
+    name = name or STATE_BACKEND
+    if name not in STATE_BACKENDS:
+        raise ValueError(f"Unbekannter Zustandsspeicher: {name}")
+    return STATE_BACKENDS[name]()
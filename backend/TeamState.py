@@ -0,0 +1,139 @@
+import threading
+from contextlib import contextmanager
+
+from backend.entities import Vehicle, EntityStore, patients_for_weekday
+from backend.StateStore import VersionConflictError
+
+# Im StateStore gespeicherte Teile des Zustands eines Teams
+STATE_KEYS = ('vehicles', 'weekly_patients', 'routes', 'week_routes')
+
+
+class TeamState:
+    """
+    Zustand eines Teams im Prozess: Uploads, Entitäten und Routenpläne.
+    - Anfragen und Jobs arbeiten nur auf dem Zustand ihres eigenen Teams
+    - lock serialisiert Abgleich, Änderung und Speichern innerhalb des Prozesses; langsame
+      Arbeit (Parsen, Geocoding, Optimierung) läuft außerhalb der Sperre
+    - Änderungen ersetzen Listen und Dicts statt sie zu verändern, Leser ohne Sperre
+      sehen daher immer einen vollständigen Stand
+    - versions hält die StateStore-Versionen des geladenen Stands
+    """
+
+    def __init__(self, team):
+        self.team = team
+        self.vehicles = EntityStore()
+        self.weekly_patients = []  # Wochendatensatz aller Patienten (Montag–Freitag)
+        self._day_patients = {}  # Wochentag -> (Wochendatensatz, Patienten des Tages)
+        self.optimized_routes = []
+        self.unassigned_tk_stops = []  # Nicht zugeordnete TK-Fälle
+        self.optimized_weekday = None  # Wochentag, zu dem optimized_routes gehört
+        self.week_routes = {}  # Wochentag -> Plan ('routes', 'tk_patients') aus der Wochenplanung
+        self.versions = {}
+        self.snapshots = {}  # Name -> vorserialisierte Antworten der Lesendpunkte dieses Teams
+        self.lock = threading.RLock()
+
+    def version(self, *keys):
+        """Versionskennung aus Team und StateStore-Versionen der Schlüssel"""
+        return f"{self.team}:" + '.'.join(str(self.versions.get(key, 0)) for key in keys)
+
+    def patients_for(self, weekday):
+        """
+        Patienten eines Wochentags aus dem Wochendatensatz. Der Wochentag kommt aus der Sitzung
+        des jeweiligen Nutzers, gespeichert wird nur der Wochendatensatz des Teams.
+        """
+        weekly_patients = self.weekly_patients
+        cached = self._day_patients.get(weekday)
+        # Der Wochendatensatz wird bei Änderungen ersetzt, die Identität zeigt den Stand an
+        if cached is None or cached[0] is not weekly_patients:
+            cached = self._day_patients[weekday] = (weekly_patients,
+                                                    patients_for_weekday(weekly_patients, weekday))
+        return cached[1]
+
+    def dump(self, key):
+        """Serialisiert einen Teil des Zustands für den StateStore"""
+        if key == 'vehicles':
+            return [v.to_dict() for v in self.vehicles]
+        if key == 'weekly_patients':
+            return self.weekly_patients
+        if key == 'routes':
+            return {'optimized_routes': self.optimized_routes, 'unassigned_tk_stops': self.unassigned_tk_stops,
+                    'weekday': self.optimized_weekday}
+        if key == 'week_routes':
+            return self.week_routes
+        raise KeyError(key)
+
+    def restore(self, key, value):
+        """Übernimmt einen gespeicherten Wert (None = leer)"""
+        if key == 'vehicles':
+            vehicles = EntityStore()
+            vehicles.extend(Vehicle.from_dict(v) for v in value or [])
+            self.vehicles = vehicles
+        elif key == 'weekly_patients':
+            self.weekly_patients = value or []
+        elif key == 'routes':
+            value = value or {}
+            self.optimized_routes = value.get('optimized_routes', [])
+            self.unassigned_tk_stops = value.get('unassigned_tk_stops', [])
+            self.optimized_weekday = value.get('weekday')
+        elif key == 'week_routes':
+            self.week_routes = value or {}
+        else:
+            raise KeyError(key)
+
+
+class TeamStates:
+    """Zustände aller Teams eines Prozesses, abgeglichen mit dem gemeinsamen StateStore"""
+
+    def __init__(self, store):
+        self.store = store
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, team):
+        with self._lock:
+            state = self._states.get(team)
+            if state is None:
+                state = self._states[team] = TeamState(team)
+            return state
+
+    def sync(self, state):
+        """Lädt Änderungen anderer Prozesse; der Aufrufer hält state.lock"""
+        versions = self.store.versions(state.team)
+        for key in STATE_KEYS:
+            if state.versions.get(key, 0) != versions.get(key, 0):
+                version, value = self.store.load(state.team, key)
+                state.restore(key, value)
+                state.versions[key] = version
+
+    def persist(self, state, *keys):
+        """
+        Schreibt Teile des Zustands in einer Transaktion, erwartet wird der geladene Stand.
+        Hat ein anderer Prozess einen der Teile inzwischen geändert, wird nichts geschrieben:
+        die lokalen Änderungen werden verworfen und VersionConflictError ausgelöst.
+        """
+        try:
+            versions = self.store.save_many(state.team, {key: state.dump(key) for key in keys},
+                                            {key: state.versions.get(key, 0) for key in keys})
+        except VersionConflictError:
+            for key in keys:
+                state.versions[key] = None  # Beim nächsten sync() neu laden
+            self.sync(state)
+            raise
+        state.versions.update(versions)
+
+    @contextmanager
+    def locked(self, team, expected=None):
+        """
+        Aktueller Zustand eines Teams unter dessen Sperre, z.B. für Hintergrundjobs.
+        expected: {schlüssel: version}, auf denen die Änderung beruht; weicht der gespeicherte
+        Stand davon ab, wird VersionConflictError ausgelöst.
+        """
+        state = self.get(team)
+        with state.lock:
+            self.sync(state)
+            for key, version in (expected or {}).items():
+                if state.versions.get(key, 0) != version:
+                    raise VersionConflictError(
+                        f"Zustand '{key}' wurde geändert (Version {state.versions.get(key, 0)}, erwartet {version})"
+                    )
+            yield state
@@ -0,0 +1,127 @@
+import glob
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.Metrics import log_event
+
+try:
+    from config import UPLOAD_SNAPSHOTS
+except ImportError:
+    UPLOAD_SNAPSHOTS = True  # Bereits verarbeitete Arbeitsmappen nicht erneut parsen und geocodieren
+
+try:
+    from config import UPLOAD_SNAPSHOT_WARMLOAD
+except ImportError:
+    UPLOAD_SNAPSHOT_WARMLOAD = False  # Zustand beim Start laden, fehlende Uploads aus den letzten Snapshots
+
+# Konfiguration für die Upload-Snapshots
+UPLOAD_SNAPSHOT_DIR = os.path.join('uploads', 'snapshots')
+UPLOAD_SNAPSHOT_KEEP = 20  # Snapshots je Art, ältere werden gelöscht
+SNAPSHOT_FORMAT = 1  # Erhöhen, wenn sich die gespeicherten Spalten ändern
+HASH_BLOCK_SIZE = 1024 * 1024
+METADATA_KEY = b'sapv'
+
+
+def content_hash(file, salt=''):
+    """SHA-256 über die Dateibytes (plus salt), die Leseposition bleibt unverändert"""
+    stream = getattr(file, 'stream', file)
+    position = stream.tell()
+    digest = hashlib.sha256(salt.encode('utf-8'))
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+class UploadSnapshotStore:
+    """
+    Geparste und geocodierte Uploads als Parquet-Dateien, adressiert über den Inhalts-Hash.
+    - Gleiche Arbeitsmappe -> gleicher Snapshot, Parsen und Geocoding entfallen
+    - Meldungen zu fehlerhaften Zeilen liegen in den Metadaten der Datei
+    - Der zuletzt verwendete Snapshot je Art dient als Startzustand (latest)
+    """
+
+    def __init__(self, directory=UPLOAD_SNAPSHOT_DIR, keep=UPLOAD_SNAPSHOT_KEEP, enabled=UPLOAD_SNAPSHOTS):
+        self.directory = directory
+        self.keep = keep
+        self.enabled = enabled
+
+    def key(self, kind, file, mode=''):
+        """Schlüssel aus Art, Dateiinhalt, Geocoding-Modus und Snapshot-Format"""
+        return content_hash(file, salt=f"{kind}:{mode}:{SNAPSHOT_FORMAT}:")
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, f"{kind}-{key}.parquet")
+
+    def load(self, kind, key):
+        """(DataFrame, meldungen) oder None, wenn kein Snapshot vorliegt"""
+        if not self.enabled:
+            return None
+        path = self._path(kind, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            snapshot = self._read(path)
+            # Zuletzt verwendeter Snapshot gilt als aktueller Stand
+            os.utime(path)
+        except Exception as e:
+            log_event('upload_snapshot_error', kind=kind, path=path, error=str(e))
+            return None
+        log_event('upload_snapshot_hit', kind=kind, rows=len(snapshot[0]))
+        return snapshot
+
+    def save(self, kind, key, df, issues):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(kind, key)
+        try:
+            table = pa.Table.from_pandas(df)
+            metadata = dict(table.schema.metadata or {})
+            metadata[METADATA_KEY] = json.dumps({'issues': issues}).encode('utf-8')
+            # Erst vollständig schreiben, dann umbenennen: andere Prozesse sehen nie halbe Dateien
+            temporary = f"{path}.{os.getpid()}.tmp"
+            pq.write_table(table.replace_schema_metadata(metadata), temporary)
+            os.replace(temporary, path)
+        except Exception as e:
+            log_event('upload_snapshot_error', kind=kind, path=path, error=str(e))
+            return
+        log_event('upload_snapshot_saved', kind=kind, rows=len(df))
+        self._prune(kind)
+
+    def latest(self, kind):
+        """Zuletzt gespeicherter oder verwendeter Snapshot einer Art als (DataFrame, meldungen)"""
+        if not self.enabled:
+            return None
+        for path in self._paths(kind):
+            try:
+                return self._read(path)
+            except Exception as e:
+                log_event('upload_snapshot_error', kind=kind, path=path, error=str(e))
+        return None
+
+    def _paths(self, kind):
+        """Snapshots einer Art, neueste zuerst"""
+        paths = glob.glob(os.path.join(self.directory, f"{kind}-*.parquet"))
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def _read(self, path):
+        table = pq.read_table(path)
+        metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+        issues = [tuple(issue) for issue in metadata.get('issues', [])]
+        return table.to_pandas(), issues
+
+    def _prune(self, kind):
+        for path in self._paths(kind)[self.keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Gemeinsamer Snapshot-Speicher der Anwendung
+upload_snapshots = UploadSnapshotStore()
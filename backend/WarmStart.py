@@ -0,0 +1,60 @@
+try:
+    from config import WARM_START
+except ImportError:
+    WARM_START = True  # Letzten Plan des Wochentags als Startlösung verwenden
+
+
+def _stop_key(stop):
+    return stop.get('patient'), stop.get('address')
+
+
+def _assignments(routes):
+    """{(patient, adresse): fahrzeug} aller Nicht-TK-Stopps eines Plans"""
+    return {_stop_key(stop): route.get('vehicle')
+            for route in routes or [] for stop in route.get('stops', []) if stop.get('visit_type') != 'TK'}
+
+
+def initial_routes(previous_routes, patients, vehicles):
+    """
+    Startlösung aus dem letzten Plan (inkl. manueller Änderungen).
+    Patienten werden über Name und Adresse zugeordnet: entfernte Patienten fallen weg,
+    neue Patienten fehlen in der Startlösung und werden vom Solver eingefügt.
+    Rückgabe: ({fahrzeugindex: [patientenindizes]}, kennzahlen)
+    """
+    index = {}
+    for i, patient in enumerate(patients):
+        index.setdefault((patient.name, patient.address), []).append(i)
+    vehicle_index = {}
+    for k, vehicle in enumerate(vehicles):
+        vehicle_index.setdefault(vehicle.name, k)
+
+    seeds, used, previous_stops = {}, set(), 0
+    for route in previous_routes or []:
+        k = vehicle_index.get(route.get('vehicle'))
+        stops = [stop for stop in route.get('stops', []) if stop.get('visit_type') != 'TK']
+        previous_stops += len(stops)
+        if k is None or k in seeds:
+            continue
+        sequence = []
+        for stop in stops:
+            for i in index.get(_stop_key(stop), ()):
+                if i not in used:
+                    used.add(i)
+                    sequence.append(i)
+                    break
+        if sequence:
+            seeds[k] = sequence
+
+    return seeds, {
+        'seeded_routes': len(seeds),
+        'seeded_stops': len(used),
+        'new_patients': len(patients) - len(used),
+        'removed_patients': previous_stops - len(used)
+    }
+
+
+def moved_patients(previous_routes, routes):
+    """Anzahl der Patienten, die gegenüber dem letzten Plan das Fahrzeug gewechselt haben"""
+    before = _assignments(previous_routes)
+    after = _assignments(routes)
+    return sum(1 for key, vehicle in after.items() if key in before and before[key] != vehicle)
@@ -1,22 +1,37 @@
-# Listen für Patienten und Fahrzeuge
-patients = []
-vehicles = []
+import threading
+
 
 class Entity:
-    def __init__(self, name, lat=None, lon=None):
-        self.id = None  # Wird später gesetzt
+    __slots__ = ('id', 'name', 'lat', 'lon', 'precision')
+
+    def __init__(self, name, lat=None, lon=None, precision=None):
+        self.id = None  # Wird beim Einfügen in den EntityStore gesetzt
         self.name = name
         self.lat = lat
         self.lon = lon
+        self.precision = precision  # Genauigkeit der Koordinate (siehe Gazetteer)
 
     def __str__(self):
         return f"{self.name} ({self.lat}, {self.lon})"
 
+    def to_dict(self):
+        return {field: getattr(self, field)
+                for cls in reversed(type(self).__mro__) for field in getattr(cls, '__slots__', ())}
+
+    @classmethod
+    def from_dict(cls, data):
+        entity = cls.__new__(cls)
+        for cls_ in type(entity).__mro__:
+            for field in getattr(cls_, '__slots__', ()):
+                setattr(entity, field, data.get(field))
+        return entity
+
 
 class Patient(Entity):
-    def __init__(self, name, address, visit_type, time_info="", lat=None, lon=None):
-        super().__init__(name, lat, lon)
-        self.id = len(patients) + 1  # Eindeutige ID basierend auf Patientenliste
+    __slots__ = ('address', 'visit_type', 'time_info')
+
+    def __init__(self, name, address, visit_type, time_info="", lat=None, lon=None, precision=None):
+        super().__init__(name, lat, lon, precision)
         self.address = address
         self.visit_type = visit_type
         self.time_info = time_info
@@ -26,9 +41,10 @@ class Patient(Entity):
 
 
 class Vehicle(Entity):
-    def __init__(self, name, start_address, lat=None, lon=None, stellenumfang=100, funktion=""):
-        super().__init__(name, lat, lon)
-        self.id = len(vehicles) + 1  # Eindeutige ID basierend auf Mitarbeiterliste
+    __slots__ = ('start_address', 'stellenumfang', 'funktion')
+
+    def __init__(self, name, start_address, lat=None, lon=None, stellenumfang=100, funktion="", precision=None):
+        super().__init__(name, lat, lon, precision)
         self.start_address = start_address
         self.stellenumfang = stellenumfang  # Arbeitszeit in Prozent (0-100%)
         self.funktion = funktion
@@ -37,3 +53,96 @@ class Vehicle(Entity):
         return (f"Vehicle: {self.name}, {self.start_address} "
                 f"({self.lat}, {self.lon}), Stellenumfang={self.stellenumfang}, "
                 f"Funktion={self.funktion}")
+
+
+class EntityStore:
+    """
+    Listenartiger Speicher für Entitäten mit stabilen IDs und Hash-Indizes.
+    - IDs werden fortlaufend vergeben, nach clear() beginnt die Zählung neu
+    - Indizes nach ID, Name und weiteren Attributen (z.B. visit_type)
+    """
+
+    def __init__(self, index_fields=()):
+        self.index_fields = tuple(index_fields)
+        self._items = []
+        self._by_id = {}
+        self._by_name = {}
+        self._by_field = {field: {} for field in self.index_fields}
+        self._next_id = 1
+        self._lock = threading.RLock()
+
+    # Listen-Schnittstelle
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def append(self, entity):
+        with self._lock:
+            if entity.id is None or entity.id in self._by_id:
+                entity.id = self._next_id
+            self._next_id = max(self._next_id, entity.id + 1)
+            self._items.append(entity)
+            self._by_id[entity.id] = entity
+            self._by_name.setdefault(entity.name, []).append(entity)
+            for field in self.index_fields:
+                self._by_field[field].setdefault(getattr(entity, field), []).append(entity)
+
+    def extend(self, entities):
+        with self._lock:
+            for entity in entities:
+                self.append(entity)
+
+    def clear(self):
+        with self._lock:
+            self._items = []
+            self._by_id = {}
+            self._by_name = {}
+            self._by_field = {field: {} for field in self.index_fields}
+            self._next_id = 1
+
+    # Indexzugriffe
+    def get(self, entity_id):
+        return self._by_id.get(entity_id)
+
+    def get_by_name(self, name):
+        """Erste Entität mit diesem Namen oder None"""
+        matches = self._by_name.get(name)
+        return matches[0] if matches else None
+
+    def filter_by(self, field, *values):
+        """Alle Entitäten, deren indiziertes Attribut einen der Werte hat"""
+        index = self._by_field[field]
+        if len(values) == 1:
+            return list(index.get(values[0], ()))
+        return [entity for value in values for entity in index.get(value, ())]
+
+
+def patients_for_weekday(weekly_patients, weekday):
+    """Erzeugt die Patienten eines Wochentags aus dem Wochendatensatz"""
+    day_patients = EntityStore(index_fields=('visit_type',))
+    for record in weekly_patients:
+        visit = record['visits'].get(weekday)
+        if visit is None:
+            continue
+        visit_type, time_info = visit
+        patient = Patient(
+            name=record['name'],
+            address=record['address'],
+            visit_type=visit_type,
+            time_info=time_info,
+            lat=record['lat'],
+            lon=record['lon'],
+            precision=record.get('precision')
+        )
+        # Stabile ID aus dem Wochendatensatz, gleich für alle Wochentage
+        patient.id = record['id']
+        day_patients.append(patient)
+    return day_patients
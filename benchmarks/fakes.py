@@ -0,0 +1,79 @@
+"""Lokale Ersatz-Clients für googlemaps und die Route Optimization API mit einstellbarer Latenz"""
+import random
+import time
+from datetime import timedelta
+
+from google.maps import routeoptimization_v1
+from googlemaps.convert import encode_polyline
+
+from benchmarks.synthetic import TOWNS
+
+
+class FakeGeocoder:
+    """
+    Ahmt googlemaps.Client.geocode (Koordinaten deterministisch aus der Adresse)
+    und googlemaps.Client.directions (gerade Etappen) nach
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rng = random.Random(address)
+        if rng.random() < self.failure_rate:
+            return []
+        lat, lon = 51.0, 7.5
+        for plz, _, town_lat, town_lon in TOWNS:
+            if plz in address:
+                lat, lon = town_lat, town_lon
+        return [{'geometry': {'location': {'lat': lat + rng.gauss(0, 0.02),
+                                           'lng': lon + rng.gauss(0, 0.03)}}}]
+
+    def directions(self, origin, destination, waypoints=None, mode='driving'):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        points = [origin] + list(waypoints or []) + [destination]
+        legs = [{'steps': [{'polyline': {'points': encode_polyline([a, b])}}],
+                 'duration': {'value': 600}, 'distance': {'value': 8000}}
+                for a, b in zip(points[:-1], points[1:])]
+        return [{'legs': legs}]
+
+
+class FakeRouteOptimizationClient:
+    """
+    Ahmt RouteOptimizationClient.optimize_tours nach:
+    verteilt die Shipments reihum auf die Fahrzeuge und liefert eine echte OptimizeToursResponse.
+    """
+
+    def __init__(self, latency=0.0, seconds_per_visit=2700):
+        self.latency = latency
+        self.seconds_per_visit = seconds_per_visit
+        self.calls = 0
+
+    def optimize_tours(self, request):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        model = request.model
+        vehicle_count = len(model.vehicles)
+        visits = [[] for _ in range(vehicle_count)]
+        for index in range(len(model.shipments)):
+            visits[index % vehicle_count].append(index)
+
+        start = model.global_start_time
+        routes = []
+        for vehicle_index, shipment_indices in enumerate(visits):
+            route = {'vehicle_index': vehicle_index,
+                     'visits': [{'shipment_index': i} for i in shipment_indices]}
+            if shipment_indices:
+                route['vehicle_start_time'] = start
+                route['vehicle_end_time'] = start + timedelta(
+                    seconds=self.seconds_per_visit * len(shipment_indices))
+            routes.append(route)
+        return routeoptimization_v1.OptimizeToursResponse(routes=routes)
@@ -0,0 +1,199 @@
+"""
+Benchmarks der Hot Paths mit synthetischen Daten und lokalen Ersatz-Clients.
+
+Aufruf aus dem Projektverzeichnis:
+    python -m benchmarks.run_benchmarks --patients 50 500 5000 --vehicles 5 50 200
+
+Gemessen werden Latenz-Perzentile (p50/p90/p99/max in ms) und der Spitzenspeicher (tracemalloc)
+für Excel-Import, Geocoding, Modellaufbau, Antwortaufbereitung, /get_markers und /update_routes.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ensure_config():
+    # Ohne config.py laufen die Benchmarks mit Platzhalterwerten, alle Google-Clients sind ersetzt
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType('config')
+        config.GOOGLE_MAPS_API_KEY = 'AIza' + '0' * 35
+        config.SERVICE_ACCOUNT_CREDENTIALS = os.devnull
+        config.FLASK_SECRET_KEY = 'benchmark'
+        config.OPTIMIZATION_WARMUP = False
+        sys.modules['config'] = config
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(fn, repeat, setup=None):
+    """Ein Lauf unter tracemalloc für den Spitzenspeicher, danach repeat Läufe für die Latenz"""
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p90_ms': round(percentile(samples, 90), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+        'max_ms': round(max(samples), 2),
+        'mean_ms': round(statistics.mean(samples), 2),
+        'peak_mb': round(peak / (1024 * 1024), 2)
+    }
+
+
+def run_size(workdir, patient_count, vehicle_count, repeat, geocode_latency, optimize_latency, geocode_rate):
+    import pandas as pd
+    from benchmarks.fakes import FakeGeocoder, FakeRouteOptimizationClient
+    from benchmarks.synthetic import TOWNS, write_patient_workbook, write_vehicle_workbook
+    import app as app_module
+    import backend.FileHandler as file_handler
+    from backend import Solver
+    from backend.BulkGeocoder import geocode_bulk, REQUESTS_PER_SECOND
+    from backend.ExcelIngest import ingest_patients, ingest_vehicles
+    from backend.Gazetteer import Gazetteer
+    from backend.GeocodeCache import GeocodeCache
+
+    patient_file = write_patient_workbook(os.path.join(workdir, f'patients_{patient_count}.xlsx'), patient_count)
+    vehicle_file = write_vehicle_workbook(os.path.join(workdir, f'vehicles_{vehicle_count}.xlsx'), vehicle_count)
+
+    geocoder = FakeGeocoder(latency=geocode_latency)
+    optimizer = FakeRouteOptimizationClient(latency=optimize_latency)
+    file_handler.gmaps = geocoder
+    Solver.SOLVER_BACKEND = 'google'
+    Solver.SOLVER_BACKENDS['google'] = lambda: Solver.GoogleSolver(client=optimizer)
+    # Strukturierte Logzeilen würden die Messung verfälschen
+    logging.getLogger('sapv').setLevel(logging.WARNING)
+
+    results = {}
+
+    def parse_patients():
+        with open(patient_file, 'rb') as f:
+            ingest_patients(f)
+
+    def parse_vehicles():
+        with open(vehicle_file, 'rb') as f:
+            ingest_vehicles(f)
+
+    results['parse_patients'] = measure(parse_patients, repeat)
+    results['parse_vehicles'] = measure(parse_vehicles, repeat)
+
+    with open(patient_file, 'rb') as f:
+        addresses = list(ingest_patients(f)[0]['address'])
+    with open(vehicle_file, 'rb') as f:
+        vehicle_addresses = list(ingest_vehicles(f)[0]['start_address'])
+    cache = GeocodeCache(os.path.join(workdir, f'geocode_{patient_count}.sqlite'))
+    geocode = lambda: geocode_bulk(addresses, geocoder, cache=cache, rate=geocode_rate or REQUESTS_PER_SECOND)
+    results['geocode_cold'] = measure(geocode, repeat, setup=cache.clear)
+    results['geocode_warm'] = measure(geocode, repeat)
+
+    gazetteer = Gazetteer(pd.DataFrame(TOWNS, columns=['plz', 'ort', 'lat', 'lon']))
+    results['gazetteer_lookup'] = measure(lambda: gazetteer.lookup(addresses), repeat)
+
+    # Cache für die Uploads vollständig vorwärmen, damit sie nicht am Ratenlimit warten
+    geocode_bulk(addresses + vehicle_addresses, geocoder, cache=cache, rate=1e9)
+    file_handler.geocode_cache = cache
+
+    # Anwendung über die Upload-Endpunkte befüllen
+    client = app_module.app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for upload_type, field, path in (('patients', 'patient_file', patient_file),
+                                         ('vehicles', 'vehicle_file', vehicle_file)):
+            with open(path, 'rb') as f:
+                client.post('/', data={'upload_type': upload_type, field: (f, os.path.basename(path))},
+                            content_type='multipart/form-data')
+
+    state = app_module.team_states.get(app_module.DEFAULT_TEAM)
+    day_patients = state.patients_for('Montag')
+    non_tk = day_patients.filter_by('visit_type', 'Neuaufnahme', 'HB')
+    tk = day_patients.filter_by('visit_type', 'TK')
+    vehicle_list = list(state.vehicles)
+
+    results['build_model'] = measure(
+        lambda: Solver.GoogleSolver().build_request(non_tk, vehicle_list, 'Montag'), repeat)
+
+    def solve_and_extract():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return app_module.plan_day(non_tk, tk, vehicle_list, 'Montag')
+
+    results['solve_and_extract'] = measure(solve_and_extract, repeat,
+                                           setup=app_module.optimization_cache.invalidate)
+
+    plan = solve_and_extract()
+    payload = {'optimized_routes': plan['routes'], 'unassigned_tk_stops': plan['tk_patients']}
+
+    results['get_markers'] = measure(lambda: client.get('/get_markers'), repeat)
+    results['update_routes'] = measure(lambda: client.post('/update_routes', json=payload), repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, nargs='+', default=[50, 500])
+    parser.add_argument('--vehicles', type=int, nargs='+', default=[5, 50])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--geocode-latency', type=float, default=0.0, help='Sekunden je Geocoding-Aufruf')
+    parser.add_argument('--geocode-rate', type=float, default=None,
+                        help='Geocoding-Anfragen pro Sekunde (Standard: Produktivwert)')
+    parser.add_argument('--optimize-latency', type=float, default=0.0, help='Sekunden je optimize_tours-Aufruf')
+    parser.add_argument('--json', help='Ergebnisse zusätzlich als JSON speichern')
+    args = parser.parse_args(argv)
+
+    if len(args.patients) != len(args.vehicles):
+        parser.error('--patients und --vehicles brauchen gleich viele Werte')
+
+    sys.path.insert(0, ROOT)
+    _ensure_config()
+
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # Caches und Zustandsdatenbank landen im temporären Verzeichnis
+        previous = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for patient_count, vehicle_count in zip(args.patients, args.vehicles):
+                results = run_size(workdir, patient_count, vehicle_count, args.repeat,
+                                   args.geocode_latency, args.optimize_latency, args.geocode_rate)
+                report.append({'patients': patient_count, 'vehicles': vehicle_count, 'results': results})
+        finally:
+            os.chdir(previous)
+
+    for entry in report:
+        print(f"\n{entry['patients']} Patienten / {entry['vehicles']} Mitarbeiter")
+        print(f"{'Benchmark':<20}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'Peak MB':>10}")
+        for name, r in entry['results'].items():
+            print(f"{name:<20}{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}{r['peak_mb']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Erzeugt synthetische SAPV-Arbeitsmappen im Spaltenschema der Upload-Dateien"""
+import random
+
+from openpyxl import Workbook
+
+WEEKDAYS = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag']
+
+# Orte im Oberbergischen Kreis und Umgebung (PLZ, Ort, lat, lon)
+TOWNS = [
+    ('51643', 'Gummersbach', 51.0264, 7.5647),
+    ('51709', 'Marienheide', 51.0838, 7.5306),
+    ('51688', 'Wipperfürth', 51.1167, 7.4000),
+    ('51789', 'Lindlar', 51.0196, 7.3772),
+    ('42499', 'Hückeswagen', 51.1450, 7.3417),
+    ('51766', 'Engelskirchen', 50.9883, 7.4150),
+    ('51702', 'Bergneustadt', 51.0247, 7.6572),
+    ('51580', 'Reichshof', 50.9333, 7.6333),
+    ('51597', 'Morsbach', 50.8667, 7.7333),
+    ('51545', 'Waldbröl', 50.8789, 7.6147),
+]
+STREETS = ['Hauptstr.', 'Kirchweg', 'Lindenallee', 'Am Markt', 'Bergstraße',
+           'Talweg', 'Sonnenweg', 'Schulstr.', 'Mühlenweg', 'Waldstraße']
+FIRST_NAMES = ['Anna', 'Ellen', 'Ingrid', 'Luise', 'Karl', 'Hans', 'Maria', 'Peter', 'Ursula', 'Werner']
+LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Hoffmann', 'Koch']
+
+PATIENT_HEADER = (['Nachname', 'Vorname', 'Ort', 'PLZ', 'Strasse']
+                  + [column for day in WEEKDAYS for column in (day, f'Uhrzeit/Info {day}')])
+VEHICLE_HEADER = ['Vorname', 'Nachname', 'Strasse', 'PLZ', 'Ort', 'Funktion', 'Stellenumfang']
+
+
+def synthetic_address(rng):
+    plz, town, lat, lon = rng.choice(TOWNS)
+    street = f"{rng.choice(STREETS)} {rng.randint(1, 120)}"
+    return street, plz, town, lat + rng.gauss(0, 0.02), lon + rng.gauss(0, 0.03)
+
+
+def _person(rng, index):
+    return f"{rng.choice(LAST_NAMES)}{index}", rng.choice(FIRST_NAMES)
+
+
+def write_patient_workbook(path, count, seed=0):
+    """Patientendatei mit count Zeilen; je Wochentag HB/TK/Neuaufnahme oder leer"""
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(PATIENT_HEADER)
+    for i in range(count):
+        nachname, vorname = _person(rng, i)
+        street, plz, town, _, _ = synthetic_address(rng)
+        row = [nachname, vorname, town, plz, street]
+        for _ in WEEKDAYS:
+            visit = rng.choices(['HB', 'TK', 'Neuaufnahme', None], weights=[5, 2, 1, 4])[0]
+            info = rng.choice(['', 'ab 12:00 Uhr', 'vormittags']) if visit else None
+            row += [visit, info or None]
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def write_vehicle_workbook(path, count, seed=0):
+    """Mitarbeiterdatei mit count Zeilen"""
+    rng = random.Random(seed + 1)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(VEHICLE_HEADER)
+    for i in range(count):
+        nachname, vorname = _person(rng, i)
+        street, plz, town, _, _ = synthetic_address(rng)
+        funktion = rng.choice(['Pflegekraft', 'Pflegekraft', 'Arzt'])
+        sheet.append([vorname, nachname, street, plz, town, funktion, rng.choice([50, 75, 100, 100])])
+    workbook.save(path)
+    return path
@@ -1,8 +1,10 @@
 // Globale Variablen
 let map;                        // Google Maps Objekt
 let markers = [];               // Alle aktuellen Marker
-let directionsRenderers = [];   // DirectionsRenderer für Routen
+let routePolylines = [];        // Polylines der Routen
 let optimized_routes = [];      // Optimierte Routen
+let routesVersion = null;       // Serverversion des angezeigten Plans
+let geometryRefreshes = 0;      // Nachladeversuche für vorläufige Streckengeometrie
 
 // Feste Farbpalette (30 gut unterscheidbare Farben)
 const COLORS = [
@@ -14,12 +16,6 @@ const COLORS = [
     "#20B2AA", "#CD5C5C", "#6B8E23", "#C71585", "#87CEEB"
 ];
 
-// Mapping der Besuchstypen zu Verweilzeiten in Sekunden
-const VISIT_DWELL_TIMES = {
-    'HB': 35 * 60,          // 35 Minuten in Sekunden
-    'Neuaufnahme': 120 * 60 // 120 Minuten in Sekunden
-};
-
 window.onload = initMap();
 
 // Google Maps initialisieren und Marker laden
@@ -165,53 +161,24 @@ function clearMarkers() {
 
 // Alle Routen löschen
 function clearRoutes() {
-  directionsRenderers.forEach(renderer => renderer.setMap(null));
-  directionsRenderers = [];
+  routePolylines.forEach(polyline => polyline.setMap(null));
+  routePolylines = [];
 }
 
-// Route berechnen mit DirectionsService
-function calculateRoute(request, routeColor, routeCard) {
-    return new Promise((resolve, reject) => {
-        const directionsService = new google.maps.DirectionsService();
-        
-        const directionsRenderer = new google.maps.DirectionsRenderer({
-            map: map,
-            suppressMarkers: true,
-            preserveViewport: true,
-            polylineOptions: {
-                strokeColor: routeColor,
-                strokeOpacity: 0.8,
-                strokeWeight: 4
-            }
-        });
-        directionsRenderers.push(directionsRenderer);
-
-        directionsService.route(request, (result, status) => {
-            if (status === "OK") {
-                directionsRenderer.setDirections(result);
-                
-                let totalDuration = 0;
-                result.routes[0].legs.forEach(leg => {
-                    totalDuration += leg.duration.value;
-                });
-                
-                const stops = routeCard.querySelector('.stops-container').querySelectorAll('.stop-card:not(.tk-stop)');
-                stops.forEach(stop => {
-                    const visitType = stop.querySelector('.visit-type').textContent;
-                    totalDuration += VISIT_DWELL_TIMES[visitType] || 0;
-                });
-                
-                const durationHrs = Math.round((totalDuration / 3600) * 100) / 100;
-                routeCard.dataset.durationHrs = durationHrs;
-                updateRouteDuration(routeCard, durationHrs);
-                
-                resolve(result);
-            } else {
-                console.error("Fehler bei der Routenberechnung:", status);
-                reject(status);
-            }
-        });
+// Route aus den vom Server gelieferten Etappen-Polylines zeichnen
+function drawRoute(geometry, routeColor) {
+    const path = [];
+    geometry.legs.forEach(leg => {
+        path.push(...google.maps.geometry.encoding.decodePath(leg.polyline));
     });
+    const polyline = new google.maps.Polyline({
+        map: map,
+        path: path,
+        strokeColor: routeColor,
+        strokeOpacity: 0.8,
+        strokeWeight: 4
+    });
+    routePolylines.push(polyline);
 }
 
 // Handle optimize button click
@@ -221,19 +188,53 @@ document.getElementById('optimizeButton').addEventListener('click', async () =>
         const response = await fetch('/optimize_route', { method: 'POST' });
         const data = await response.json();
 
-        if (data.status === 'success') {
-            displayRoutes(data);
+        if (data.status === 'queued') {
+            const result = await waitForJob(data.job_id);
+            displayRoutes(result);
             document.getElementById('resultsSection').style.display = 'block';
         } else {
             console.error("Optimierungsfehler:", data.message);
             alert(data.message || "Fehler bei der Routenoptimierung");
         }
     } catch (error) {
-        console.error("Fetch-Fehler bei /optimize_route:", error);
-        alert("Netzwerkfehler bei der Routenoptimierung. Details in der Konsole.");
+        console.error("Fehler bei /optimize_route:", error);
+        alert(error.message || "Netzwerkfehler bei der Routenoptimierung. Details in der Konsole.");
     }
 });
 
+// Wartet durch regelmäßiges Abfragen von /jobs/<id> auf das Ende eines Optimierungsjobs
+// (belegt keinen Worker dauerhaft, funktioniert mit jedem Worker-Prozess)
+const JOB_POLL_MS = 1000;
+
+async function waitForJob(jobId) {
+    const button = document.getElementById('optimizeButton');
+    const label = button.textContent;
+    button.disabled = true;
+
+    try {
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error("Verbindung zum Optimierungsjob verloren");
+            }
+            const job = await response.json();
+            if (job.progress) {
+                button.textContent = `${job.progress} (${job.timings.running_s.toFixed(0)} s)`;
+            }
+            if (job.status === 'done') {
+                return job.result;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                throw new Error(job.message || "Optimierung abgebrochen");
+            }
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        }
+    } finally {
+        button.disabled = false;
+        button.textContent = label;
+    }
+}
+
 // Funktion zum Aktualisieren des Wochentags
 async function updateWeekdayDisplay() {
     try {
@@ -292,9 +293,35 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Vorläufige Geometrie (Luftlinie nach Drag-and-Drop) wird serverseitig ergänzt,
+// der Plan wird danach neu geladen, solange er nicht weiter bearbeitet wurde
+const GEOMETRY_REFRESH_MS = 2000;
+const GEOMETRY_REFRESH_LIMIT = 5;
+
+function scheduleGeometryRefresh(data) {
+    if (!(data.routes || []).some(route => route.geometry?.pending)) {
+        geometryRefreshes = 0;
+        return;
+    }
+    if (geometryRefreshes >= GEOMETRY_REFRESH_LIMIT) {
+        return;
+    }
+    geometryRefreshes++;
+    const version = routesVersion;
+    setTimeout(() => {
+        if (routesVersion === version) {
+            loadSavedRoutes();
+        }
+    }, GEOMETRY_REFRESH_MS);
+}
+
 // Optimierte Routen anzeigen
 function displayRoutes(data) {
     clearRoutes();
+    if (data.version) {
+        routesVersion = data.version;
+    }
+    scheduleGeometryRefresh(data);
     // Aktualisiere die Marker-Labels für die neuen Routen
     markers.forEach(marker => {
         if (marker.customData?.type === 'patient' && !marker.customData?.isTK) {
@@ -359,40 +386,9 @@ function displayRoutes(data) {
         // Filtere TK-Stopps für die Route aus
         const regularStops = route.stops.filter(stop => stop.visit_type !== 'TK');
         
-        // Nur reguläre Stopps für die Wegpunkte und Route verwenden
-        if (regularStops.length > 0) {
-            const waypoints = regularStops.map(s => ({
-                location: new google.maps.LatLng(s.location.lat, s.location.lng),
-                stopover: true
-            }));
-
-            // Route berechnen und anzeigen
-            const origin = new google.maps.LatLng(route.vehicle_start.lat, route.vehicle_start.lng);
-            const destination = origin;
-
-            const directionsRenderer = new google.maps.DirectionsRenderer({
-                map: map,
-                suppressMarkers: true,
-                preserveViewport: true,
-                polylineOptions: {
-                    strokeColor: routeColor,
-                    strokeOpacity: 0.8,
-                    strokeWeight: 4
-                }
-            });
-            directionsRenderers.push(directionsRenderer);
-
-            const request = {
-                origin: origin,
-                destination: destination,
-                waypoints: waypoints,
-                travelMode: google.maps.TravelMode.DRIVING,
-                optimizeWaypoints: false
-            };
-
-            calculateRoute(request, routeColor, routeCard).catch(err => {
-                console.error("Fehler bei der Routenberechnung:", err);
-            });
+        // Streckenverlauf wird serverseitig berechnet
+        if (regularStops.length > 0 && route.geometry) {
+            drawRoute(route.geometry, routeColor);
         }
 
         // Alle Stopps anzeigen
@@ -482,10 +478,41 @@ function handleDragStart(e) {
     e.dataTransfer.setData('text/plain', e.target.innerHTML);
     // Speichere den Typ des gezogenen Elements
     e.dataTransfer.setData('type', e.target.classList.contains('tk-stop') ? 'tk' : 'regular');
+    // Für TK-Patienten die günstigsten Zielrouten hervorheben
+    if (e.target.classList.contains('tk-stop')) {
+        highlightSuggestions(e.target.querySelector('strong').textContent);
+    }
 }
 
 function handleDragEnd(e) {
     e.target.classList.remove('dragging');
+    clearSuggestions();
+}
+
+// Einfügevorschläge (geringste Mehrfahrzeit innerhalb max_hours) vom Server holen und markieren
+async function highlightSuggestions(patientName) {
+    try {
+        const response = await fetch(`/tk_suggestions?patient=${encodeURIComponent(patientName)}`);
+        const data = await response.json();
+        (data.suggestions?.[patientName] || []).forEach(suggestion => {
+            const container = document.querySelector(
+                `.stops-container[data-vehicle="${CSS.escape(suggestion.vehicle)}"]`);
+            const routeCard = container?.closest('.route-card');
+            if (routeCard) {
+                routeCard.classList.add('suggested-drop');
+                routeCard.dataset.suggestion = `+${suggestion.added_minutes} min`;
+            }
+        });
+    } catch (error) {
+        console.error("Fehler beim Laden der Einfügevorschläge:", error);
+    }
+}
+
+function clearSuggestions() {
+    document.querySelectorAll('.route-card.suggested-drop').forEach(routeCard => {
+        routeCard.classList.remove('suggested-drop');
+        delete routeCard.dataset.suggestion;
+    });
 }
 
 function handleDragOver(e) {
@@ -553,7 +580,7 @@ function getDropPosition(container, y, isTKStop) {
     }, { offset: Number.NEGATIVE_INFINITY }).element;
 }
 
-async function handleDrop(e) {
+function handleDrop(e) {
     e.preventDefault();
     const draggingElement = document.querySelector('.dragging');
     
@@ -590,52 +617,8 @@ async function handleDrop(e) {
             // Aktualisiere die Stoppnummern
             updateStopNumbers();
             
-            // Sammle alle Routenberechnungen
-            const routePromises = [];
-            
-            // Aktualisiere die Routen für alle Container
-            document.querySelectorAll('.stops-container:not([data-vehicle="tk"])').forEach(cont => {
-                const routeCard = cont.closest('.route-card');
-                const routeColor = routeCard.style.borderColor;
-                const regularStops = [...cont.querySelectorAll('.stop-card:not(.tk-stop)')];
-                
-                if (regularStops.length === 0) {
-                    updateRouteDuration(routeCard, 0);
-                } else {
-                    const origin = new google.maps.LatLng(
-                        routeCard.dataset.vehicleStartLat, 
-                        routeCard.dataset.vehicleStartLng
-                    );
-                    
-                    const waypoints = regularStops.map(stop => ({
-                        location: new google.maps.LatLng(
-                            parseFloat(stop.querySelector('[data-lat]').dataset.lat),
-                            parseFloat(stop.querySelector('[data-lat]').dataset.lng)
-                        ),
-                        stopover: true
-                    }));
-
-                    const request = {
-                        origin: origin,
-                        destination: origin,
-                        waypoints: waypoints,
-                        travelMode: google.maps.TravelMode.DRIVING,
-                        optimizeWaypoints: false
-                    };
-
-                    routePromises.push(calculateRoute(request, routeColor, routeCard));
-                }
-            });
-
-            try {
-                // Warte auf alle Routenberechnungen
-                await Promise.all(routePromises);
-                
-                // Jetzt erst die optimierten Routen aktualisieren
-                updateOptimizedRoutes();
-            } catch (error) {
-                console.error('Fehler bei der Routenberechnung:', error);
-            }
+            // Dauer und Streckenverlauf berechnet der Server für die geänderten Routen
+            updateOptimizedRoutes();
         }
     }
 }
@@ -750,15 +733,23 @@ function updateOptimizedRoutes() {
         },
         body: JSON.stringify({ 
             optimized_routes: optimized_routes,
-            unassigned_tk_stops: unassigned_tk_stops
+            unassigned_tk_stops: unassigned_tk_stops,
+            version: routesVersion
         })
     })
     .then(response => response.json())
     .then(data => {
-        if (data.status === 'success') {
+        if (data.conflict) {
+            // Plan wurde inzwischen anderweitig geändert: aktuellen Stand anzeigen
+            alert(data.message);
+            loadSavedRoutes();
+        } else if (data.status === 'success') {
+            geometryRefreshes = 0;
             clearRoutes();
             // Zeige die Routen mit den aktualisierten Werten aus dem Backend an
             displayRoutes(data);
+            // Vom Server erkannte Überschreitungen der maximalen Arbeitszeit
+            (data.evaluation?.violations || []).forEach(v => console.warn(v.message));
         }
     })
     .catch(error => console.error('Error updating routes:', error));
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+import pytest
+
+from backend.DistanceMatrix import get_speed_profile, haversine_pairs
+from backend.InsertionIndex import InsertionIndex
+from backend.RouteEvaluation import evaluate_route
+from backend.Solver import service_duration
+
+
+def _routes(seed, count=40, stops=12):
+    rng = random.Random(seed)
+    routes = []
+    for i in range(count):
+        lat, lon = 50.8 + rng.random() * 0.4, 7.2 + rng.random() * 0.6
+        routes.append({
+            'vehicle': f'Fahrzeug {i}',
+            'max_hours': rng.choice([None, 4, 6, 8]),
+            'vehicle_start': {'lat': lat, 'lng': lon},
+            'stops': [{
+                'patient': f'P{i}-{j}',
+                'visit_type': rng.choice(['HB', 'HB', 'Neuaufnahme', 'TK']),
+                'location': {'lat': lat + rng.gauss(0, 0.05), 'lng': lon + rng.gauss(0, 0.08)}
+            } for j in range(rng.randint(0, stops))]
+        })
+    return routes
+
+
+def brute_force(routes, lat, lon, visit_type, k):
+    """Alle Einfügepositionen aller Routen prüfen"""
+    profile = get_speed_profile()
+    service_hrs = service_duration(visit_type) / 3600.0
+    options = []
+    for route in routes:
+        start = route['vehicle_start']
+        regular = [(index, stop['location']) for index, stop in enumerate(route['stops'])
+                   if stop['visit_type'] != 'TK']
+        path = np.array([(start['lat'], start['lng'])] + [(l['lat'], l['lng']) for _, l in regular]
+                        + [(start['lat'], start['lng'])])
+        positions = [index for index, _ in regular] + [regular[-1][0] + 1 if regular else len(route['stops'])]
+        best = None
+        for edge in range(len(path) - 1):
+            added_km = (haversine_pairs(path[edge, 0], path[edge, 1], lat, lon)
+                        + haversine_pairs(lat, lon, path[edge + 1, 0], path[edge + 1, 1])
+                        - haversine_pairs(path[edge, 0], path[edge, 1], path[edge + 1, 0], path[edge + 1, 1]))
+            if best is None or added_km < best[0]:
+                best = (float(added_km), positions[edge])
+        duration_hrs = (evaluate_route(route)['duration_hrs']
+                        + float(profile.travel_seconds(best[0])) / 3600.0 + service_hrs)
+        if route['max_hours'] is not None and duration_hrs > route['max_hours']:
+            continue
+        options.append((best[0], route['vehicle'], best[1]))
+    options.sort()
+    return [(vehicle, position) for _, vehicle, position in options[:k]]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_suggestions_match_brute_force(seed):
+    routes = _routes(seed)
+    index = InsertionIndex(routes)
+    rng = random.Random(1000 + seed)
+    for _ in range(40):
+        lat, lon = 50.7 + rng.random() * 0.6, 7.1 + rng.random() * 0.8
+        k = rng.randint(1, 5)
+        found = [(s['vehicle'], s['position']) for s in index.suggestions(lat, lon, 'TK', k)]
+        assert found == brute_force(routes, lat, lon, 'TK', k)
+
+
+def test_no_feasible_route_returns_empty_list():
+    routes = _routes(0)
+    for route in routes:
+        route['max_hours'] = 0
+    assert InsertionIndex(routes).suggestions(51.0, 7.5, 'TK', k=1) == []
+
+
+def test_k_must_be_positive():
+    with pytest.raises(ValueError):
+        InsertionIndex(_routes(0)).suggestions(51.0, 7.5, 'TK', k=0)
@@ -0,0 +1,49 @@
+import random
+
+from backend.entities import Patient, Vehicle
+from backend.Solver import LocalSolver, route_duration_limit
+
+
+def _patients(seed, count):
+    rng = random.Random(seed)
+    return [Patient(f'P{i}', f'Straße {i}', rng.choice(['HB', 'HB', 'Neuaufnahme']),
+                    lat=50.85 + rng.random() * 0.3, lon=6.85 + rng.random() * 0.3)
+            for i in range(count)]
+
+
+def _vehicles(stellenumfang):
+    return [Vehicle(f'Fahrzeug {k}', 'Depot', lat=50.94 + k * 0.01, lon=6.96, stellenumfang=s)
+            for k, s in enumerate(stellenumfang)]
+
+
+def test_routes_respect_max_hours():
+    """Mehr Besuche als Arbeitszeit: keine Route überschreitet das Limit ihres Fahrzeugs"""
+    patients = _patients(1, 60)
+    vehicles = _vehicles([100, 50, 75])
+    routes = LocalSolver(time_limit=0.5).solve(patients, vehicles, 'Montag')
+
+    assert sorted(route.vehicle_index for route in routes) == [0, 1, 2]
+    for route in routes:
+        assert route.duration_seconds <= route_duration_limit(vehicles[route.vehicle_index])
+    planned = [i for route in routes for i in route.shipment_indices]
+    assert len(planned) == len(set(planned)) < len(patients)
+
+
+def test_seed_over_limit_is_trimmed():
+    """Eine manuell überplante Startroute wird auf das Zeitlimit gekürzt"""
+    patients = _patients(2, 30)
+    vehicles = _vehicles([50])
+    routes = LocalSolver(time_limit=0.2).solve(patients, vehicles, 'Montag',
+                                               initial_routes={0: list(range(len(patients)))})
+
+    assert routes[0].duration_seconds <= route_duration_limit(vehicles[0])
+
+
+def test_entities_without_coordinates_stay_unplanned():
+    patients = _patients(3, 3) + [Patient('Ohne Ort', 'unbekannt', 'HB')]
+    vehicles = _vehicles([100]) + [Vehicle('Ohne Start', 'unbekannt')]
+    routes = LocalSolver(time_limit=0.2).solve(patients, vehicles, 'Montag')
+    routes = {route.vehicle_index: route.shipment_indices for route in routes}
+
+    assert routes[1] == []
+    assert sorted(routes[0]) == [0, 1, 2]
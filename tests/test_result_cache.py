@@ -0,0 +1,49 @@
+from backend.entities import Patient, Vehicle
+from backend.ResultCache import ResultCache, model_key
+
+
+def _model(stellenumfang=100):
+    patients = [Patient('A', 'x', 'HB', lat=50.95, lon=6.98), Patient('B', 'y', 'Neuaufnahme', lat=50.97, lon=7.01)]
+    vehicles = [Vehicle('Fahrzeug 1', 'Depot', lat=50.94, lon=6.96, stellenumfang=stellenumfang)]
+    return patients, vehicles
+
+
+def test_model_key_depends_on_model_only():
+    patients, vehicles = _model()
+    renamed = [Patient('Anderer Name', 'z', p.visit_type, lat=p.lat, lon=p.lon) for p in patients]
+
+    assert model_key(patients, vehicles, 'Montag', 'local') == model_key(renamed, vehicles, 'Montag', 'local')
+    assert model_key(patients, vehicles, 'Montag', 'local') != model_key(patients, vehicles, 'Montag', 'google')
+    assert model_key(patients, vehicles, 'Montag') != model_key(*_model(stellenumfang=50), 'Montag')
+
+
+def test_hit_and_miss():
+    cache = ResultCache()
+    key = model_key(*_model(), 'Montag')
+
+    assert cache.get(key) is None
+    cache.put(key, ['ergebnis'])
+    assert cache.get(key) == ['ergebnis']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalidate_single_and_all():
+    cache = ResultCache()
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    cache.invalidate('a')
+    assert cache.get('a') is None and cache.get('b') == 2
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_expired_and_evicted_entries():
+    cache = ResultCache(max_entries=2, ttl=-1)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+
+    cache = ResultCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, key)
+    assert cache.get('a') is None and cache.get('c') == 'c'
@@ -0,0 +1,65 @@
+from backend.DistanceMatrix import get_speed_profile, haversine_pairs
+from backend.RouteEvaluation import RouteEvaluator, evaluate_route
+
+
+def _route(stops):
+    return {
+        'vehicle': 'Fahrzeug 1',
+        'max_hours': 7,
+        'vehicle_start': {'lat': 50.94, 'lng': 6.96},
+        'stops': [{'patient': name, 'visit_type': visit_type, 'location': {'lat': lat, 'lng': lng}}
+                  for name, visit_type, lat, lng in stops]
+    }
+
+
+def _with_geometry(route):
+    """Etappen wie von RouteGeometry.attach: Start -> Stopps ohne TK -> Start"""
+    start = route['vehicle_start']
+    points = ([(start['lat'], start['lng'])]
+              + [(s['location']['lat'], s['location']['lng']) for s in route['stops'] if s['visit_type'] != 'TK']
+              + [(start['lat'], start['lng'])])
+    lat, lon = [p[0] for p in points], [p[1] for p in points]
+    seconds = get_speed_profile().travel_seconds(haversine_pairs(lat[:-1], lon[:-1], lat[1:], lon[1:]))
+    legs = [{'duration_s': float(s) * 1.2} for s in seconds]  # Straße etwas langsamer als die Schätzung
+    route['geometry'] = {'legs': legs, 'duration_s': sum(leg['duration_s'] for leg in legs)}
+    return route
+
+
+REGULAR = [('A', 'HB', 50.95, 6.98), ('B', 'Neuaufnahme', 50.97, 7.01)]
+
+
+def test_tk_stop_adds_no_travel():
+    without_tk = evaluate_route(_with_geometry(_route(REGULAR)))
+    with_tk = evaluate_route(_with_geometry(_route(REGULAR + [('T', 'TK', 51.40, 7.90)])))
+
+    assert with_tk['travel_source'] == 'road'
+    assert with_tk['travel_hrs'] == without_tk['travel_hrs']
+    assert with_tk['duration_hrs'] == without_tk['duration_hrs']
+
+
+def test_tk_stop_ignored_in_estimate():
+    without_tk = evaluate_route(_route(REGULAR))
+    with_tk = evaluate_route(_route([('T', 'TK', 51.40, 7.90)] + REGULAR))
+
+    assert with_tk['travel_source'] == 'estimate'
+    assert with_tk['travel_hrs'] == without_tk['travel_hrs']
+
+
+def test_unchanged_routes_keep_duration():
+    """Nach Drag-and-Drop behalten unveränderte Routen die Dauer aus der Optimierung"""
+    other = [('C', 'HB', 50.90, 6.90)]
+    previous = [dict(_route(REGULAR), duration_hrs=5.5),
+                dict(_route(other), vehicle='Fahrzeug 2', duration_hrs=2.25)]
+    # B wechselt von Fahrzeug 1 zu Fahrzeug 2
+    edited = [_route(REGULAR[:1]), dict(_route(other + REGULAR[1:]), vehicle='Fahrzeug 2')]
+    evaluation = RouteEvaluator().evaluate(edited, previous)
+
+    assert evaluation['changed'] == ['Fahrzeug 1', 'Fahrzeug 2']
+    assert evaluation['routes']['Fahrzeug 1']['duration_hrs'] == evaluate_route(edited[0])['duration_hrs']
+
+    # Nur Fahrzeug 2 geändert: Fahrzeug 1 behält 5,5 h statt der Schätzung
+    evaluation = RouteEvaluator().evaluate([_route(REGULAR), edited[1]], previous)
+
+    assert evaluation['changed'] == ['Fahrzeug 2']
+    assert evaluation['routes']['Fahrzeug 1']['duration_hrs'] == 5.5
+    assert evaluation['routes']['Fahrzeug 1']['delta_hrs'] == 0.0
@@ -0,0 +1,75 @@
+import pytest
+
+from backend.entities import EntityStore, Vehicle
+from backend.StateStore import SQLiteStateStore, VersionConflictError
+from backend.TeamState import TeamStates
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStateStore(str(tmp_path / 'state.sqlite'))
+
+
+def test_save_many_conflict_writes_nothing(store):
+    versions = store.save_many('team', {'routes': [1], 'week_routes': {}})
+    with pytest.raises(VersionConflictError):
+        store.save_many('team', {'routes': [2], 'week_routes': {'Montag': {}}},
+                        {'routes': versions['routes'], 'week_routes': versions['week_routes'] - 1})
+
+    assert store.load('team', 'routes') == (1, [1])
+    assert store.load('team', 'week_routes') == (1, {})
+
+
+def test_persist_conflict_reloads_stored_state(store):
+    """Zwei Worker-Prozesse ändern denselben Plan: der zweite verliert und sieht den Stand des ersten"""
+    first, second = TeamStates(store), TeamStates(store)
+    state, state_b = first.get('team'), second.get('team')
+
+    with state.lock:
+        state.optimized_routes = [{'vehicle': 'A', 'stops': []}]
+        first.persist(state, 'routes')
+    with state_b.lock, pytest.raises(VersionConflictError):
+        state_b.optimized_routes = [{'vehicle': 'B', 'stops': []}]
+        second.persist(state_b, 'routes')
+
+    assert state_b.optimized_routes == [{'vehicle': 'A', 'stops': []}]
+    assert state_b.version('routes') == state.version('routes')
+
+
+def test_locked_checks_expected_versions(store):
+    states = TeamStates(store)
+    with states.locked('team') as state:
+        state.optimized_routes = []
+        states.persist(state, 'routes')
+        version = state.versions['routes']
+    store.save('team', 'routes', {'optimized_routes': []})
+
+    with pytest.raises(VersionConflictError):
+        with states.locked('team', expected={'routes': version}):
+            pass
+
+
+def test_update_routes_stale_version_409(store, monkeypatch):
+    pytest.importorskip('config')
+    import app as application
+
+    team_states = TeamStates(store)
+    monkeypatch.setattr(application, 'team_states', team_states)
+    with team_states.locked('team') as state:
+        vehicles = EntityStore()
+        vehicles.append(Vehicle('Fahrzeug 1', 'Depot', lat=50.94, lon=6.96))
+        state.vehicles = vehicles
+        team_states.persist(state, 'vehicles')
+
+    client = application.app.test_client()
+    saved = client.get('/get_saved_routes?team=team').get_json()
+    routes = [{'vehicle': 'Fahrzeug 1', 'duration_hrs': 0, 'funktion': '', 'stops': []}]
+    response = client.post('/update_routes', json={'optimized_routes': routes, 'unassigned_tk_stops': [],
+                                                   'version': saved['version']})
+    assert response.status_code == 200
+
+    # Derselbe Ausgangsstand ein zweites Mal: der Plan wurde inzwischen geändert
+    response = client.post('/update_routes', json={'optimized_routes': routes, 'unassigned_tk_stops': [],
+                                                   'version': saved['version']})
+    assert response.status_code == 409
+    assert response.get_json()['conflict'] is True
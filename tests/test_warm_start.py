@@ -0,0 +1,61 @@
+from backend.entities import Patient, Vehicle
+from backend.Solver import GoogleSolver, estimated_duration, trim_seed
+from backend.WarmStart import initial_routes, moved_patients
+
+
+def _stop(name, visit_type='HB'):
+    return {'patient': name, 'address': f'{name}-Adresse', 'visit_type': visit_type}
+
+
+def _patient(name, lat=50.95, lon=6.98):
+    return Patient(name, f'{name}-Adresse', 'HB', lat=lat, lon=lon)
+
+
+def test_initial_routes_map_previous_plan():
+    """Zuordnung über Name und Adresse: neue Reihenfolge der Listen, entfernte und neue Patienten"""
+    previous = [
+        {'vehicle': 'Fahrzeug 1', 'stops': [_stop('A'), _stop('T', 'TK'), _stop('B')]},
+        {'vehicle': 'Fahrzeug 2', 'stops': [_stop('C'), _stop('Entlassen')]},
+        {'vehicle': 'Ausgeschieden', 'stops': [_stop('D')]},
+    ]
+    patients = [_patient('Neu'), _patient('C'), _patient('B'), _patient('A'), _patient('D')]
+    vehicles = [Vehicle('Fahrzeug 2', 'Depot'), Vehicle('Fahrzeug 1', 'Depot')]
+
+    seeds, stats = initial_routes(previous, patients, vehicles)
+
+    assert seeds == {1: [3, 2], 0: [1]}
+    assert stats == {'seeded_routes': 2, 'seeded_stops': 3, 'new_patients': 2, 'removed_patients': 2}
+
+
+def test_moved_patients_ignores_tk():
+    before = [{'vehicle': 'Fahrzeug 1', 'stops': [_stop('A'), _stop('T', 'TK')]},
+              {'vehicle': 'Fahrzeug 2', 'stops': [_stop('B')]}]
+    after = [{'vehicle': 'Fahrzeug 1', 'stops': [_stop('B')]},
+             {'vehicle': 'Fahrzeug 2', 'stops': [_stop('A'), _stop('T', 'TK')]}]
+
+    assert moved_patients(before, after) == 2
+
+
+def test_trim_seed_drops_unlocated_and_trims_tail():
+    vehicle = Vehicle('Fahrzeug 1', 'Depot', lat=50.94, lon=6.96)
+    patients = [_patient('A'), Patient('Ohne Ort', 'x', 'HB'), _patient('B', 50.97, 7.01), _patient('C', 51.1, 7.3)]
+    limit = estimated_duration(vehicle, [patients[0], patients[2]])
+
+    assert trim_seed([0, 1, 2, 3], patients, vehicle, limit) == [0, 2]
+    assert trim_seed([0, 1, 2, 3], patients, vehicle, 0) == []
+
+
+def test_google_request_maps_seeds_to_model_indices():
+    """Startlösung im Proto verweist auf Modellindizes, Entitäten ohne Koordinaten fehlen im Modell"""
+    patients = [Patient('Ohne Ort', 'x', 'HB'), _patient('A'), _patient('B', 50.97, 7.01)]
+    vehicles = [Vehicle('Ohne Start', 'x'), Vehicle('Fahrzeug 1', 'Depot', lat=50.94, lon=6.96)]
+
+    request = GoogleSolver(client=object()).build_request(patients, vehicles, 'Montag',
+                                                          initial_routes={0: [1], 1: [2, 0, 1]})
+
+    assert len(request.model.shipments) == 2
+    assert len(request.model.vehicles) == 1
+    assert len(request.injected_first_solution_routes) == 1
+    route = request.injected_first_solution_routes[0]
+    assert route.vehicle_index == 0
+    assert [visit.shipment_index for visit in route.visits] == [1, 0]